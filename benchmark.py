@@ -0,0 +1,376 @@
+"""Замеры производительности Portable Browser без выхода в сеть.
+
+Страницы отдаёт локальный http.server, Qt работает на платформе offscreen.
+Результаты сохраняются в JSON, чтобы сравнивать прогоны между собой:
+
+    python benchmark.py
+    python benchmark.py --only blocklist --rules 1000,100000
+    python benchmark.py --compare bench_results/20260101-120000.json
+"""
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+if hasattr(os, "geteuid") and os.geteuid() == 0:
+    # Песочница Chromium не запускается от root
+    os.environ.setdefault("QTWEBENGINE_DISABLE_SANDBOX", "1")
+
+APP_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(APP_DIR))
+
+# QtWebEngineWidgets должен быть импортирован до создания QApplication
+import portable  # noqa: E402
+from PyQt5.QtCore import QEventLoop, QTimer, QUrl  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+SUITES = ("blocklist", "startup", "tabs", "session")
+
+# Замеры, для которых больше - лучше; для остальных лучше меньше
+HIGHER_IS_BETTER = ("lookups_per_sec",)
+
+
+class FixtureSite:
+    """Локальный сайт для замеров: страницы со стилями, скриптами и картинками"""
+    def __init__(self, pages=50):
+        self.root = Path(tempfile.mkdtemp(prefix="pb-fixture-"))
+        self.pages = pages
+        self._generate()
+        handler = partial(QuietHandler, directory=str(self.root))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _generate(self):
+        (self.root / "style.css").write_text("body { font-family: sans-serif; }\n" * 200)
+        (self.root / "app.js").write_text("var data = [%s];\n" % ",".join(str(i) for i in range(5000)))
+        # Небольшая картинка в формате SVG - без зависимостей
+        (self.root / "image.svg").write_text(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64">'
+            '<rect width="64" height="64" fill="#4285F4"/></svg>')
+        paragraph = "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>"
+        for i in range(self.pages):
+            (self.root / f"page{i}.html").write_text(
+                f"<!DOCTYPE html><html><head><title>Страница {i}</title>"
+                f'<link rel="stylesheet" href="style.css"><script src="app.js"></script></head>'
+                f"<body><h1>Страница {i}</h1>{paragraph * 5}"
+                + "".join(f'<img src="image.svg?{i}-{n}">' for n in range(10))
+                + "</body></html>")
+
+    def url(self, i=0):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/page{i % self.pages}.html"
+
+    def close(self):
+        self.server.shutdown()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def process_tree_rss_kb(root_pid):
+    """Суммарный RSS процесса и всех потомков (рендереры, GPU) по /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += portable.process_rss_kb(pid)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def metric(value, unit):
+    return {"value": round(value, 3), "unit": unit}
+
+
+def bench_blocklist(rule_counts, lookups=100000):
+    """Пропускная способность is_blocked на импортированных списках разного размера"""
+    results = {}
+    rng = random.Random(42)
+    for count in rule_counts:
+        work_dir = Path(tempfile.mkdtemp(prefix="pb-blocklist-"))
+        source = work_dir / "hosts.txt"
+        with open(source, "w") as f:
+            for i in range(count):
+                f.write(f"0.0.0.0 ads{i}.tracker{i % 997}.example\n")
+
+        manager = portable.BlockedSitesManager(work_dir / "config")
+        started = time.perf_counter()
+        manager.install_filter_cache(manager.import_filter_list(source))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        portable.BlockedSitesManager(work_dir / "config")
+        load_ms = (time.perf_counter() - started) * 1000
+
+        # Половина адресов попадает в список, половина нет
+        urls = []
+        for i in range(1000):
+            n = rng.randrange(count)
+            if i % 2:
+                urls.append(QUrl(f"https://cdn.ads{n}.tracker{n % 997}.example/script.js"))
+            else:
+                urls.append(QUrl(f"https://static{n}.news.example/page/{i}"))
+        started = time.perf_counter()
+        for i in range(lookups):
+            manager.is_blocked(urls[i % len(urls)])
+        elapsed = time.perf_counter() - started
+
+        results[f"blocklist_{count}"] = {
+            "build_ms": metric(build_ms, "ms"),
+            "load_ms": metric(load_ms, "ms"),
+            "lookups_per_sec": metric(lookups / elapsed, "1/s"),
+        }
+        manager.clear_filter_lists()
+    return results
+
+
+def wait_until(app, predicate, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Превышено время ожидания")
+        app.processEvents(QEventLoop.AllEvents, 10)
+        time.sleep(0.001)
+
+
+def open_and_load(app, browser, url, timeout=30.0):
+    """Открыть вкладку и дождаться окончания загрузки; возвращает миллисекунды"""
+    loaded = []
+    started = time.perf_counter()
+    tab = browser.add_new_tab(url)
+    wait_until(app, lambda: tab.browser is not None, timeout)
+    tab.browser.loadFinished.connect(lambda ok: loaded.append(time.perf_counter()))
+    wait_until(app, lambda: loaded, timeout)
+    return (loaded[0] - started) * 1000, tab
+
+
+def new_browser(app, data_dir):
+    browser = portable.PortableBrowser(data_dir=data_dir)
+    browser.show()
+    wait_until(app, lambda: browser.initialized)
+    return browser
+
+
+def close_browser(app, browser):
+    browser.close()
+    browser.deleteLater()
+    app.processEvents()
+
+
+def bench_startup(fixture, runs=3):
+    """Холодный (пустой каталог данных) и тёплый запуск в отдельных процессах"""
+    data_dir = tempfile.mkdtemp(prefix="pb-startup-")
+    samples = []
+    for run in range(runs + 1):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child-startup", data_dir, fixture.url(0)],
+            capture_output=True, text=True, timeout=120)
+        if output.returncode != 0:
+            raise RuntimeError(output.stderr.strip() or "дочерний процесс завершился с ошибкой")
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    cold, warm = samples[0], samples[1:]
+    results = {"startup_cold": {name: metric(value, "ms") for name, value in cold.items()}}
+    results["startup_warm"] = {
+        name: metric(sorted(sample[name] for sample in warm)[len(warm) // 2], "ms")
+        for name in warm[0]
+    }
+    return results
+
+
+def child_startup(data_dir, url):
+    """Дочерний процесс: запуск браузера до первой загруженной страницы"""
+    STARTUP = portable.STARTUP
+    app = QApplication(sys.argv[:1])
+    STARTUP.mark("QApplication создан")
+    browser = portable.PortableBrowser(data_dir=data_dir)
+    browser.home_page = url
+    browser.show()
+
+    def check():
+        phases = dict(STARTUP.phases)
+        if "первая страница загружена" in phases:
+            print(json.dumps({name: (moment - STARTUP.origin) * 1000 for name, moment in STARTUP.phases}))
+            browser.close()
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(check)
+    timer.start(5)
+    QTimer.singleShot(60000, lambda: app.exit(1))
+    return app.exec_()
+
+
+def bench_tabs(app, fixture, tab_counts, new_tab_runs=10):
+    """Задержка новой вкладки и память при N загруженных вкладках"""
+    results = {}
+    browser = new_browser(app, tempfile.mkdtemp(prefix="pb-tabs-"))
+    latencies = [open_and_load(app, browser, fixture.url(i))[0] for i in range(new_tab_runs)]
+    latencies.sort()
+    results["new_tab"] = {
+        "p50_ms": metric(latencies[len(latencies) // 2], "ms"),
+        "max_ms": metric(latencies[-1], "ms"),
+    }
+    close_browser(app, browser)
+
+    for count in tab_counts:
+        browser = new_browser(app, tempfile.mkdtemp(prefix="pb-rss-"))
+        baseline = process_tree_rss_kb(os.getpid())
+        for i in range(count):
+            open_and_load(app, browser, fixture.url(i))
+        total = process_tree_rss_kb(os.getpid())
+        results[f"tabs_{count}"] = {
+            "rss_mb": metric(total / 1024, "MB"),
+            "rss_per_tab_mb": metric((total - baseline) / 1024 / count, "MB"),
+        }
+        close_browser(app, browser)
+    return results
+
+
+def bench_session(app, fixture, tab_count):
+    """Восстановление сессии из N вкладок: до заглушек и до загрузки текущей"""
+    data_dir = Path(tempfile.mkdtemp(prefix="pb-session-"))
+    session = portable.SessionStore(data_dir / "session")
+    for i in range(tab_count):
+        session.record("open", f"bench-{i}", url=fixture.url(i), title=f"Страница {i}")
+    session.close()
+
+    loaded = []
+    started = time.perf_counter()
+    browser = new_browser(app, data_dir)
+    restored_ms = (time.perf_counter() - started) * 1000
+    wait_until(app, lambda: browser.tabs.currentWidget() is not None
+               and browser.tabs.currentWidget().browser is not None)
+    current = browser.tabs.currentWidget()
+    current.browser.loadFinished.connect(lambda ok: loaded.append(time.perf_counter()))
+    wait_until(app, lambda: loaded)
+    results = {f"session_restore_{tab_count}": {
+        "tabs": metric(browser.tabs.count(), "tabs"),
+        "restore_ms": metric(restored_ms, "ms"),
+        "first_load_ms": metric((loaded[0] - started) * 1000, "ms"),
+    }}
+    close_browser(app, browser)
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Список регрессий хуже порога в процентах"""
+    regressions = []
+    for group, metrics in current["results"].items():
+        for name, value in metrics.items():
+            old = baseline.get("results", {}).get(group, {}).get(name)
+            if not old or not old["value"]:
+                continue
+            change = (value["value"] - old["value"]) / old["value"] * 100
+            if name in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append((f"{group}.{name}", old["value"], value["value"], change))
+    return regressions
+
+
+def environment():
+    from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+    return {
+        "python": platform.python_version(),
+        "qt": QT_VERSION_STR,
+        "pyqt": PYQT_VERSION_STR,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки Portable Browser")
+    parser.add_argument("--only", action="append", choices=SUITES,
+                        help="запустить только указанные наборы (можно несколько раз)")
+    parser.add_argument("--rules", default="1000,100000,1000000",
+                        help="размеры списков блокировки через запятую")
+    parser.add_argument("--tabs", default="10,50", help="число вкладок для замера памяти")
+    parser.add_argument("--session-tabs", type=int, default=100)
+    parser.add_argument("--out", default=str(APP_DIR / "bench_results"),
+                        help="каталог для JSON с результатами")
+    parser.add_argument("--compare", help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="регрессия, если замер хуже на столько процентов")
+    parser.add_argument("--child-startup", nargs=2, metavar=("DATA_DIR", "URL"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_startup:
+        return child_startup(*args.child_startup)
+
+    suites = args.only or list(SUITES)
+    results = {}
+    app = QApplication(sys.argv[:1])
+
+    if "blocklist" in suites:
+        results.update(bench_blocklist([int(n) for n in args.rules.split(",")]))
+
+    gui_suites = [suite for suite in suites if suite != "blocklist"]
+    if gui_suites:
+        fixture = FixtureSite()
+        try:
+            if "startup" in suites:
+                results.update(bench_startup(fixture))
+            if "tabs" in suites:
+                results.update(bench_tabs(app, fixture, [int(n) for n in args.tabs.split(",")]))
+            if "session" in suites:
+                results.update(bench_session(app, fixture, args.session_tabs))
+        finally:
+            fixture.close()
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "results": results,
+    }
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_file = out_dir / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for group, metrics in results.items():
+        print(group)
+        for name, value in metrics.items():
+            print(f"  {name:<20}{value['value']:>14,.2f} {value['unit']}")
+    print(f"Результаты: {out_file}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"РЕГРЕССИЯ {name}: {old} -> {new} ({change:+.1f}%)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
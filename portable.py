@@ -1,19 +1,221 @@
 import sys
 import os
 import json
+import mmap
+import array
+import struct
+import zlib
+import hashlib
+import html
+import shutil
+import time
+import threading
+import uuid
+import math
+import bisect
+import heapq
+import itertools
+import queue
+import re
+import fnmatch
+import sqlite3
+import argparse
+import http.client
+import urllib.request
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict, defaultdict, deque
 from datetime import datetime
 from pathlib import Path
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-from PyQt5.QtWebEngineWidgets import *
+from PyQt5.QtWidgets import (
+    QAction, QApplication, QCheckBox, QComboBox, QCompleter, QDialog, QDialogButtonBox,
+    QFileDialog, QFormLayout, QHBoxLayout, QLabel, QLineEdit, QListView,
+    QListWidget, QListWidgetItem, QMainWindow, QMessageBox, QPushButton,
+    QSpinBox, QTabWidget, QToolBar, QVBoxLayout, QWidget, QDockWidget,
+    QTableWidget, QTableWidgetItem, QHeaderView,
+)
+from PyQt5.QtCore import (
+    QAbstractListModel, QByteArray, QDataStream, QEvent, QFileSystemWatcher, QIODevice,
+    QModelIndex, QObject, QSize, QThread, QTimer, QUrl, Qt, pyqtSignal, pyqtSlot,
+)
+from PyQt5.QtGui import (
+    QBrush, QColor, QDesktopServices, QIcon, QPainter, QPalette, QPen, QPixmap,
+    QStandardItem, QStandardItemModel,
+)
+from PyQt5.QtWebEngineWidgets import (
+    QWebEngineDownloadItem, QWebEnginePage, QWebEngineProfile, QWebEngineScript,
+    QWebEngineSettings, QWebEngineView,
+)
+from PyQt5.QtWebEngineCore import QWebEngineUrlRequestInfo, QWebEngineUrlRequestInterceptor
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket, QNetworkConfigurationManager
+
+log = logging.getLogger("portable")
+
+class StartupProfiler:
+    """Фазы запуска от старта процесса до первой загруженной страницы.
+    
+    Отметки ставятся всегда (это дёшево), а печатаются только с флагом
+    --profile-startup.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.origin = self.process_start()
+        self.phases = []
+        self.reported = False
+    
+    @staticmethod
+    def process_start():
+        """Время старта процесса по /proc/self/stat (Linux), иначе - текущее"""
+        try:
+            with open('/proc/self/stat', 'r') as f:
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/uptime', 'r') as f:
+                uptime = float(f.read().split()[0])
+            return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+        except (OSError, ValueError, IndexError, AttributeError):
+            return time.time()
+    
+    def mark(self, phase):
+        if all(name != phase for name, _ in self.phases):
+            self.phases.append((phase, time.time()))
+    
+    def report(self, stream=None):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        stream = stream or sys.stderr
+        print("Профиль запуска (от старта процесса):", file=stream)
+        previous = self.origin
+        for name, moment in self.phases:
+            print(f"  {name:<34}{(moment - self.origin) * 1000:9.1f} мс"
+                  f"  (+{(moment - previous) * 1000:.1f} мс)", file=stream)
+            previous = moment
+        stream.flush()
+
+STARTUP = StartupProfiler()
+STARTUP.mark("импорт модулей")
+
+def serialize_history(history):
+    """QWebEngineHistory -> base64-строка для сессии"""
+    data = QByteArray()
+    stream = QDataStream(data, QIODevice.WriteOnly)
+    stream << history
+    return bytes(data.toBase64()).decode('ascii')
+
+def restore_history(history, encoded):
+    data = QByteArray.fromBase64(encoded.encode('ascii'))
+    stream = QDataStream(data)
+    stream >> history
+
+DARK_MODE_SCRIPT_NAME = "portable-dark-mode"
+
+# Инверсия с поворотом тона сохраняет оттенки; картинки и видео
+# инвертируются обратно. Страницы со своей тёмной темой помечены data-native-theme
+DARK_MODE_CSS = (
+    "html:not([data-native-theme]) { filter: invert(1) hue-rotate(180deg) !important;"
+    " background-color: #fff !important; }"
+    " html:not([data-native-theme]) :is(img, video, picture, canvas, iframe, embed, object)"
+    " { filter: invert(1) hue-rotate(180deg) !important; }"
+)
+
+def dark_mode_toggle_js(enabled):
+    """Скрипт, добавляющий или убирающий стиль затемнения в документе"""
+    return """
+    (function(enabled) {
+        var id = %s;
+        var style = document.getElementById(id);
+        if (!enabled) {
+            if (style) style.remove();
+            return;
+        }
+        if (style) return;
+        style = document.createElement('style');
+        style.id = id;
+        style.textContent = %s;
+        if (document.documentElement) {
+            document.documentElement.appendChild(style);
+        } else {
+            new MutationObserver(function(mutations, observer) {
+                if (document.documentElement) {
+                    document.documentElement.appendChild(style);
+                    observer.disconnect();
+                }
+            }).observe(document, {childList: true});
+        }
+    })(%s);
+    """ % (json.dumps(DARK_MODE_SCRIPT_NAME), json.dumps(DARK_MODE_CSS), 'true' if enabled else 'false')
+
+def dark_mode_script():
+    script = QWebEngineScript()
+    script.setName(DARK_MODE_SCRIPT_NAME)
+    script.setSourceCode(dark_mode_toggle_js(True))
+    script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+    script.setWorldId(QWebEngineScript.ApplicationWorld)
+    script.setRunsOnSubFrames(True)
+    return script
+
+_THEME_PALETTES = {}
+
+def theme_palette(dark):
+    """Палитра интерфейса; строится один раз на тему"""
+    palette = _THEME_PALETTES.get(dark)
+    if palette is None:
+        palette = QPalette()
+        if dark:
+            for role, color in ((QPalette.Window, "#2b2b2b"), (QPalette.WindowText, "#ffffff"),
+                                (QPalette.Base, "#3b3b3b"), (QPalette.AlternateBase, "#333333"),
+                                (QPalette.Text, "#ffffff"), (QPalette.Button, "#4b4b4b"),
+                                (QPalette.ButtonText, "#ffffff"), (QPalette.ToolTipBase, "#3b3b3b"),
+                                (QPalette.ToolTipText, "#ffffff"), (QPalette.Highlight, "#4285f4"),
+                                (QPalette.HighlightedText, "#ffffff"), (QPalette.Link, "#8ab4f8"),
+                                (QPalette.BrightText, "#ff6b6b"), (QPalette.Mid, "#444444"),
+                                (QPalette.Dark, "#222222"), (QPalette.Light, "#5b5b5b")):
+                palette.setColor(role, QColor(color))
+            for role in (QPalette.WindowText, QPalette.Text, QPalette.ButtonText):
+                palette.setColor(QPalette.Disabled, role, QColor("#808080"))
+        else:
+            palette = QApplication.style().standardPalette()
+        _THEME_PALETTES[dark] = palette
+    return palette
 
 class BrowserTab(QWidget):
-    def __init__(self, parent=None, home_page="https://www.google.com"):
+    """Вкладка браузера.
+    
+    Пока вкладку не показали, это лёгкая заглушка: только URL, заголовок и
+    значок, без QWebEngineView. Вид и страница создаются при первом показе,
+    и навигация на сохранённый URL выполняется ровно один раз.
+    """
+    materialized = pyqtSignal(object)
+    
+    def __init__(self, parent=None, home_page="https://www.google.com", url=None,
+                 title="", icon=None, profile=None, page_factory=None, tab_id=None, history=None):
         super().__init__(parent)
+        self.tab_id = tab_id or uuid.uuid4().hex  # Постоянный идентификатор для сессии
         self.home_page = home_page  # Сохраняем домашнюю страницу
+        self.last_active = time.monotonic()  # Для усыпления фоновых вкладок
+        self.url = url or self.home_page  # Используем домашнюю страницу по умолчанию
+        self.title = title
+        self.icon = icon
+        self.profile = profile
+        self.incognito = profile is not None and profile.isOffTheRecord()
+        self.page_factory = page_factory
+        self.navigation_handler = None  # Может сам выполнить переход по Enter
+        self.history = history  # Сериализованная история из сессии
+        self.theme_generation = 0  # Тема, под которую подогнана загруженная страница
+        self.browser = None
+        
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        self.setLayout(layout)
+    
+    def materialize(self):
+        """Создать вид, страницу и панель навигации и загрузить URL"""
+        if self.browser is not None:
+            return
         self.browser = QWebEngineView()
-        self.browser.setUrl(QUrl(self.home_page))  # Используем домашнюю страницу по умолчанию
+        if self.page_factory is not None:
+            self.browser.setPage(self.page_factory(self.profile, self.browser))
         
         # Панель навигации
         self.nav_bar = QToolBar()
@@ -31,6 +233,7 @@ class BrowserTab(QWidget):
         self.go_btn.clicked.connect(self.navigate_to_url)
         self.url_bar.returnPressed.connect(self.navigate_to_url)
         self.browser.urlChanged.connect(self.update_url)
+        self.browser.titleChanged.connect(self.update_title)
         
         self.nav_bar.addWidget(self.back_btn)
         self.nav_bar.addWidget(self.forward_btn)
@@ -39,114 +242,4207 @@ class BrowserTab(QWidget):
         self.nav_bar.addWidget(self.url_bar)
         self.nav_bar.addWidget(self.go_btn)
         
-        layout = QVBoxLayout()
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setSpacing(0)
-        layout.addWidget(self.nav_bar)
-        layout.addWidget(self.browser)
-        self.setLayout(layout)
+        self.layout().addWidget(self.nav_bar)
+        self.layout().addWidget(self.browser)
+        
+        self.url_bar.setText(self.url)
+        self.materialized.emit(self)
+        
+        # Восстановленная из сессии история сама переходит на текущую запись
+        if self.history:
+            history, self.history = self.history, None
+            restore_history(self.browser.history(), history)
+            if self.browser.history().count():
+                return
+        self.browser.setUrl(QUrl(self.url))
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Откладываем на итерацию цикла событий: при массовом открытии вкладка
+        # может показаться и сразу скрыться, не успев стать текущей
+        QTimer.singleShot(0, self._materialize_if_visible)
+    
+    def _materialize_if_visible(self):
+        if self.isVisible():
+            self.materialize()
+    
+    def current_url(self):
+        return self.browser.url().toString() if self.browser is not None else self.url
+    
+    def current_title(self):
+        return self.browser.page().title() if self.browser is not None else self.title
+    
+    def navigate(self, url):
+        """Открыть URL; у заглушки он просто запоминается до показа"""
+        if self.browser is not None:
+            self.browser.setUrl(QUrl(url))
+        else:
+            self.url = url
     
     def go_home(self):
         """Перейти на домашнюю страницу"""
-        self.browser.setUrl(QUrl(self.home_page))
+        self.navigate(self.home_page)
     
     def navigate_to_url(self):
         url = self.url_bar.text()
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
-        self.browser.setUrl(QUrl(url))
+        if self.navigation_handler is not None and self.navigation_handler(self, url):
+            return
+        self.navigate(url)
     
     def update_url(self, q):
-        self.url_bar.setText(q.toString())
+        self.url = q.toString()
+        self.url_bar.setText(self.url)
+    
+    def update_title(self, title):
+        self.title = title
+    
+    def teardown(self):
+        """Освободить страницу и вид сразу при закрытии вкладки.
+        
+        Страница удаляется раньше вида и раньше профиля инкогнито, который
+        освобождается после неё: deleteLater обрабатывается по порядку.
+        """
+        if self.browser is not None:
+            self.browser.stop()
+            self.browser.page().deleteLater()
+            self.browser.deleteLater()
+            self.browser = None
+        self.deleteLater()
 
-class BlockedSitesManager:
-    def __init__(self, config_dir):
-        self.config_dir = Path(config_dir)
-        self.config_file = self.config_dir / "blocked_sites.json"
-        self.blocked_sites = self.load_blocked_sites()
+def fuzzy_span(query, text):
+    """Жадное вхождение символов query в text по порядку: (начало, конец) или None"""
+    start = pos = text.find(query[0])
+    if start < 0:
+        return None
+    for ch in query[1:]:
+        pos = text.find(ch, pos + 1)
+        if pos < 0:
+            return None
+    return start, pos
+
+class TabRegistry:
+    """Открытые вкладки по постоянному tab_id и индекс для поиска по ним.
     
-    def load_blocked_sites(self):
-        if self.config_file.exists():
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
-        return []
+    Текст для поиска (заголовок и адрес в нижнем регистре) обновляется при
+    смене заголовка или адреса вкладки, а не собирается на каждый запрос.
+    Если новый запрос продолжает предыдущий, просматриваются только
+    прошлые совпадения.
+    """
+    def __init__(self):
+        self.tabs = OrderedDict()
+        self.texts = {}
+        self._last_query = None
+        self._last_ids = []
     
-    def save_blocked_sites(self):
-        self.config_dir.mkdir(parents=True, exist_ok=True)
-        with open(self.config_file, 'w') as f:
-            json.dump(self.blocked_sites, f, indent=2)
+    def __len__(self):
+        return len(self.tabs)
     
-    def add_site(self, site):
-        if site not in self.blocked_sites:
-            self.blocked_sites.append(site)
-            self.save_blocked_sites()
+    def __contains__(self, tab_id):
+        return tab_id in self.tabs
+    
+    def get(self, tab_id):
+        return self.tabs.get(tab_id)
+    
+    def add(self, tab):
+        self.tabs[tab.tab_id] = tab
+        self.update(tab)
+    
+    def remove(self, tab):
+        if self.tabs.pop(tab.tab_id, None) is not None:
+            del self.texts[tab.tab_id]
+            self._last_query = None
+    
+    def update(self, tab):
+        if tab.tab_id not in self.tabs:
+            return
+        text = f"{tab.current_title()}\n{tab.current_url()}".lower()
+        if self.texts.get(tab.tab_id) != text:
+            self.texts[tab.tab_id] = text
+            self._last_query = None
+    
+    def search(self, query, limit=50):
+        """Вкладки, в заголовке или адресе которых есть символы query по порядку.
+        
+        Точные вхождения идут первыми, затем более плотные совпадения.
+        """
+        query = query.strip().lower()
+        if not query:
+            return list(self.tabs.values())[:limit]
+        if self._last_query and query.startswith(self._last_query):
+            candidates = self._last_ids
+        else:
+            candidates = self.texts
+        
+        scored = []
+        for tab_id in candidates:
+            text = self.texts[tab_id]
+            pos = text.find(query)
+            if pos >= 0:
+                scored.append((pos, tab_id))
+                continue
+            span = fuzzy_span(query, text)
+            if span is not None:
+                scored.append((len(text) + span[1] - span[0], tab_id))
+        self._last_query = query
+        self._last_ids = [tab_id for _, tab_id in scored]
+        scored.sort()
+        return [self.tabs[tab_id] for _, tab_id in scored[:limit]]
+
+class TabSwitcher(QDialog):
+    """Переключатель вкладок по Ctrl+K с нечётким поиском"""
+    LIMIT = 50
+    
+    def __init__(self, registry, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Переключиться на вкладку")
+        self.resize(600, 400)
+        self.registry = registry
+        self.selected = None
+        
+        self.input = QLineEdit()
+        self.input.setPlaceholderText("Заголовок или адрес вкладки")
+        self.list = QListWidget()
+        layout = QVBoxLayout()
+        layout.addWidget(self.input)
+        layout.addWidget(self.list)
+        self.setLayout(layout)
+        
+        self.input.textChanged.connect(self.refresh)
+        self.input.returnPressed.connect(self.accept_current)
+        self.list.itemActivated.connect(lambda _: self.accept_current())
+        # Стрелки в строке поиска двигают выделение в списке
+        self.input.installEventFilter(self)
+        self.refresh("")
+    
+    def eventFilter(self, obj, event):
+        if (obj is self.input and event.type() == QEvent.KeyPress
+                and event.key() in (Qt.Key_Up, Qt.Key_Down, Qt.Key_PageUp, Qt.Key_PageDown)):
+            QApplication.sendEvent(self.list, event)
             return True
-        return False
+        return super().eventFilter(obj, event)
     
-    def remove_site(self, site):
-        if site in self.blocked_sites:
-            self.blocked_sites.remove(site)
-            self.save_blocked_sites()
+    def refresh(self, text):
+        self.list.clear()
+        for tab in self.registry.search(text, self.LIMIT):
+            item = QListWidgetItem(f"{tab.current_title() or 'Без названия'} — {tab.current_url()}")
+            if tab.icon is not None:
+                item.setIcon(tab.icon)
+            item.setData(Qt.UserRole, tab.tab_id)
+            self.list.addItem(item)
+        if self.list.count():
+            self.list.setCurrentRow(0)
+    
+    def accept_current(self):
+        item = self.list.currentItem()
+        if item is not None:
+            self.selected = item.data(Qt.UserRole)
+            self.accept()
+
+WORD_RE = re.compile(r'\w{2,}')
+
+class PageTextIndex:
+    """Обратный индекс по тексту страниц в открытых и недавно закрытых вкладках.
+    
+    Документ - последний загруженный текст вкладки. Индекс обновляется по
+    одному документу: старые вхождения вкладки вычёркиваются, новые
+    добавляются, так что стоимость не зависит от числа вкладок. Закрытая
+    вкладка остаётся в индексе, пока не вытеснена CLOSED_PAGES более
+    свежими. Ранжирование - BM25, последнее слово запроса ищется по
+    префиксу, чтобы результаты шли по мере набора.
+    
+    Изменения приходят из фонового потока, поиск - из потока интерфейса,
+    поэтому всё под одной блокировкой.
+    """
+    DEFAULT_SETTINGS = {
+        'enabled': True,
+        'persist': True,       # хранить индекс в browser_data между запусками
+        'closed_pages': 50,    # сколько закрытых страниц помнить
+        'max_chars': 200000,   # текст длиннее обрезается
+    }
+    K1 = 1.2
+    B = 0.75
+    SNIPPET = 80
+    
+    def __init__(self, settings=None):
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.docs = {}
+        self.postings = {}
+        self.by_tab = {}
+        self.closed = deque()
+        self.total_length = 0
+        self.next_id = 1
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._sorted_terms = None
+    
+    def __len__(self):
+        return len(self.docs)
+    
+    def add(self, tab_id, url, title, text):
+        """Заменить документ вкладки; False, если текст не изменился"""
+        text = text[:self.settings['max_chars']]
+        digest = hashlib.sha1(text.encode('utf-8', 'replace')).digest()
+        terms = Counter(WORD_RE.findall(f"{title}\n{text}".lower()))
+        with self._lock:
+            doc_id = self.by_tab.get(tab_id)
+            doc = self.docs.get(doc_id)
+            if doc is not None and doc['digest'] == digest and doc['url'] == url:
+                doc['title'] = title
+                return False
+            if doc_id is not None:
+                self._remove(doc_id)
+            doc_id = self.next_id
+            self.next_id += 1
+            self.docs[doc_id] = {'tab_id': tab_id, 'url': url, 'title': title, 'text': text,
+                                 'digest': digest, 'terms': terms,
+                                 'length': sum(terms.values()), 'time': time.time()}
+            self.by_tab[tab_id] = doc_id
+            self.total_length += self.docs[doc_id]['length']
+            for term, count in terms.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    self.postings[term] = postings = {}
+                    self._sorted_terms = None
+                postings[doc_id] = count
+            self.generation += 1
+        return True
+    
+    def tab_closed(self, tab_id):
+        """Документ закрытой вкладки переходит в число недавно закрытых"""
+        with self._lock:
+            doc_id = self.by_tab.pop(tab_id, None)
+            if doc_id is None:
+                return
+            self.docs[doc_id]['tab_id'] = None
+            self.closed.append(doc_id)
+            while len(self.closed) > self.settings['closed_pages']:
+                self._remove(self.closed.popleft())
+            self.generation += 1
+    
+    def _remove(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc['length']
+        for term in doc['terms']:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+                self._sorted_terms = None
+    
+    def _expand(self, prefix):
+        """Термины индекса, начинающиеся с prefix (не больше 64)"""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        terms = []
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        for term in itertools.islice(self._sorted_terms, start, start + 64):
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+    
+    def search(self, query, limit=50):
+        """Страницы, где есть все слова запроса: (оценка, документ, фрагмент) по убыванию оценки"""
+        words = WORD_RE.findall(query.lower())
+        if not words:
+            return []
+        with self._lock:
+            if not self.docs:
+                return []
+            count = len(self.docs)
+            avg_length = self.total_length / count or 1
+            scores = None
+            # Каждое слово - группа терминов: само слово или, для последнего, его продолжения
+            for i, word in enumerate(words):
+                group = self._expand(word) if i == len(words) - 1 else [word]
+                word_scores = {}
+                for term in group:
+                    postings = self.postings.get(term, {})
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, tf in postings.items():
+                        norm = self.K1 * (1 - self.B + self.B * self.docs[doc_id]['length'] / avg_length)
+                        score = idf * tf * (self.K1 + 1) / (tf + norm)
+                        word_scores[doc_id] = max(word_scores.get(doc_id, 0.0), score)
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {doc_id: score + word_scores[doc_id]
+                              for doc_id, score in scores.items() if doc_id in word_scores}
+                if not scores:
+                    return []
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(score, dict(self.docs[doc_id]), self._snippet(self.docs[doc_id]['text'], words))
+                    for doc_id, score in best]
+    
+    def _snippet(self, text, words):
+        lowered = text.lower()
+        for word in words:
+            pos = lowered.find(word)
+            if pos >= 0:
+                start = max(0, pos - self.SNIPPET // 2)
+                return ' '.join(text[start:start + self.SNIPPET].split())
+        return ' '.join(text[:self.SNIPPET].split())
+    
+    def save(self, path):
+        with self._lock:
+            docs = [{key: doc[key] for key in ('tab_id', 'url', 'title', 'text', 'time')}
+                    for doc in self.docs.values()]
+        data = json.dumps({'docs': docs}, ensure_ascii=False).encode('utf-8')
+        atomic_write(path, zlib.compress(data, 6))
+    
+    def load(self, path, open_tab_ids):
+        """Поднять индекс с диска; вкладки, которых больше нет, считаются закрытыми"""
+        try:
+            docs = json.loads(zlib.decompress(Path(path).read_bytes()))['docs']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, zlib.error) as e:
+            log.warning("Индекс страниц не прочитан: %s", e)
+            return
+        closed = []
+        for doc in sorted(docs, key=lambda doc: doc.get('time', 0)):
+            tab_id = doc.get('tab_id')
+            if tab_id in open_tab_ids:
+                self.add(tab_id, doc['url'], doc['title'], doc['text'])
+            else:
+                closed.append(doc)
+        for i, doc in enumerate(closed):
+            self.add(('closed', i), doc['url'], doc['title'], doc['text'])
+            self.tab_closed(('closed', i))
+
+class PageIndexer(QObject):
+    """Снимает текст вкладок после загрузки и скармливает его PageTextIndex.
+    
+    Вкладки ставятся в очередь по loadFinished и обрабатываются таймером
+    по одной и не раньше, чем через SETTLE секунд после загрузки: текст
+    страницы запрашивается у рендерера, и пачка одновременно загруженных
+    вкладок не должна занимать его разом. Разбор текста идёт в фоновом
+    потоке. Вкладки инкогнито не индексируются.
+    """
+    INTERVAL = 500
+    SETTLE = 2.0
+    # Ответ на toPlainText может не прийти, если страницу успели закрыть
+    EXTRACT_TIMEOUT = 10.0
+    SAVE_DELAY = 30 * 1000
+    
+    def __init__(self, registry, index_path, settings=None, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.index_path = Path(index_path)
+        self.index = PageTextIndex(settings)
+        self.pending = OrderedDict()
+        self.extracting = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-index")
+        self.saved_generation = 0
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.process)
+        self.timer.start(self.INTERVAL)
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.timeout.connect(self.save)
+    
+    def apply_settings(self, settings):
+        self.index.settings.update(settings)
+    
+    def load(self):
+        if self.index.settings['persist']:
+            open_ids = set(self.registry.tabs)
+            self.executor.submit(self._load, open_ids)
+    
+    def _load(self, open_ids):
+        self.index.load(self.index_path, open_ids)
+        self.saved_generation = self.index.generation
+    
+    def schedule(self, tab):
+        if tab.incognito or not self.index.settings['enabled']:
+            return
+        self.pending.pop(tab.tab_id, None)
+        self.pending[tab.tab_id] = time.monotonic()
+    
+    def tab_closed(self, tab):
+        self.pending.pop(tab.tab_id, None)
+        if not tab.incognito:
+            self.executor.submit(self.index.tab_closed, tab.tab_id)
+            self.save_timer.start(self.SAVE_DELAY)
+    
+    def process(self):
+        now = time.monotonic()
+        if self.extracting is not None and now - self.extracting < self.EXTRACT_TIMEOUT:
+            return
+        self.extracting = None
+        if not self.pending:
+            return
+        tab_id, queued = next(iter(self.pending.items()))
+        if now - queued < self.SETTLE:
+            return
+        del self.pending[tab_id]
+        tab = self.registry.get(tab_id)
+        if tab is None or tab.browser is None or tab.incognito:
+            return
+        url = tab.current_url()
+        if QUrl(url).scheme() not in ('http', 'https', 'file'):
+            return
+        self.extracting = now
+        title = tab.current_title()
+        tab.browser.page().toPlainText(lambda text: self.extracted(tab_id, url, title, text))
+    
+    def extracted(self, tab_id, url, title, text):
+        self.extracting = None
+        if tab_id in self.registry and text:
+            self.executor.submit(self.index.add, tab_id, url, title, text)
+            self.save_timer.start(self.SAVE_DELAY)
+    
+    def save(self):
+        if self.index.settings['persist']:
+            self.executor.submit(self._save)
+    
+    def _save(self):
+        generation = self.index.generation
+        if generation == self.saved_generation:
+            return
+        try:
+            self.index.save(self.index_path)
+            self.saved_generation = generation
+        except OSError as e:
+            log.warning("Индекс страниц не сохранён: %s", e)
+    
+    def close(self):
+        self.timer.stop()
+        self.save_timer.stop()
+        self.save()
+        self.executor.shutdown(wait=True)
+
+class PageSearchDialog(QDialog):
+    """Поиск по тексту открытых и недавно закрытых страниц"""
+    LIMIT = 50
+    
+    def __init__(self, index, registry, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Поиск по страницам")
+        self.resize(700, 450)
+        self.index = index
+        self.registry = registry
+        self.selected = None
+        
+        self.input = QLineEdit()
+        self.input.setPlaceholderText("Слова со страницы")
+        self.list = QListWidget()
+        self.status = QLabel()
+        layout = QVBoxLayout()
+        layout.addWidget(self.input)
+        layout.addWidget(self.list)
+        layout.addWidget(self.status)
+        self.setLayout(layout)
+        
+        self.input.textChanged.connect(self.refresh)
+        self.input.returnPressed.connect(self.accept_current)
+        self.list.itemActivated.connect(lambda _: self.accept_current())
+        self.input.installEventFilter(self)
+        self.refresh("")
+    
+    def eventFilter(self, obj, event):
+        if (obj is self.input and event.type() == QEvent.KeyPress
+                and event.key() in (Qt.Key_Up, Qt.Key_Down, Qt.Key_PageUp, Qt.Key_PageDown)):
+            QApplication.sendEvent(self.list, event)
             return True
-        return False
+        return super().eventFilter(obj, event)
     
-    def is_blocked(self, url):
-        url_str = url.toString().lower()
-        for site in self.blocked_sites:
-            if site.lower() in url_str:
-                return True
-        return False
+    def refresh(self, text):
+        started = time.perf_counter()
+        hits = self.index.search(text, self.LIMIT)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.list.clear()
+        for _, doc, snippet in hits:
+            is_open = doc['tab_id'] in self.registry
+            where = "" if is_open else " (закрыта)"
+            item = QListWidgetItem(f"{doc['title'] or doc['url']}{where}\n{snippet}")
+            item.setToolTip(doc['url'])
+            item.setData(Qt.UserRole, (doc['tab_id'] if is_open else None, doc['url']))
+            self.list.addItem(item)
+        if self.list.count():
+            self.list.setCurrentRow(0)
+        self.status.setText(f"Страниц в индексе: {len(self.index)}; найдено {len(hits)}"
+                            f" за {elapsed:.1f} мс" if text.strip() else
+                            f"Страниц в индексе: {len(self.index)}")
+    
+    def accept_current(self):
+        item = self.list.currentItem()
+        if item is not None:
+            self.selected = item.data(Qt.UserRole)
+            self.accept()
 
-class PortableBrowser(QMainWindow):
-    def __init__(self):
-        super().__init__()
+def atomic_write(path, data):
+    """Записать файл целиком через временный файл и rename: читатель видит
+    либо старое, либо новое содержимое, но не обрывок"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class ConfigStore(QObject):
+    """Файлы в config/: отложенная атомарная запись в фоне и перечитывание.
+    
+    save() только запоминает новое содержимое; частые изменения подряд
+    сливаются в одну запись через WRITE_DELAY мс, а сама запись идёт в
+    отдельном потоке. QFileSystemWatcher следит за файлами, и если их
+    изменило другое окно или другой экземпляр браузера, испускается changed.
+    Файлы сравниваются сначала по stat(), содержимое хешируется, только
+    если он изменился (и не хешируется вовсе для watch(..., hashed=False)).
+    """
+    changed = pyqtSignal(str)
+    
+    WRITE_DELAY = 300
+    CHECK_DELAY = 100
+    
+    def __init__(self, config_dir, parent=None):
+        super().__init__(parent)
+        self.config_dir = Path(config_dir)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config-writer")
+        self._pending = {}
+        self._known = {}
+        self._inflight = defaultdict(int)
+        self._lock = threading.Lock()
+        self._watched = set()
+        self._unhashed = set()
         
-        # Инициализация папок
-        self.app_dir = Path(__file__).parent
-        self.data_dir = self.app_dir / "browser_data"
-        self.config_dir = self.data_dir / "config"
+        self._write_timer = QTimer(self)
+        self._write_timer.setSingleShot(True)
+        self._write_timer.setInterval(self.WRITE_DELAY)
+        self._write_timer.timeout.connect(self._write_pending)
         
-        # Настройки домашней страницы
-        self.home_page = "https://www.google.com"  # Фиксированная домашняя страница
+        self._check_timer = QTimer(self)
+        self._check_timer.setSingleShot(True)
+        self._check_timer.setInterval(self.CHECK_DELAY)
+        self._check_timer.timeout.connect(self._check_files)
         
-        # Менеджер заблокированных сайтов
-        self.block_manager = BlockedSitesManager(self.config_dir)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(lambda _: self._check_timer.start())
+        self.watcher.directoryChanged.connect(lambda _: self._check_timer.start())
+    
+    def path(self, name):
+        return self.config_dir / name
+    
+    @staticmethod
+    def _digest(data):
+        return hashlib.sha1(data).digest() if data is not None else None
+    
+    def _stat(self, name):
+        try:
+            st = self.path(name).stat()
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns, st.st_ino
+    
+    def load(self, name, default=None):
+        """Прочитать JSON-файл; при ошибке - предупреждение в лог и default"""
+        path = self.path(name)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return default
+        except OSError as e:
+            log.warning("Не удалось прочитать %s: %s", path, e)
+            return default
+        with self._lock:
+            self._known[name] = (self._stat(name), self._digest(data))
+        try:
+            return json.loads(data.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            log.warning("Повреждённый файл настроек %s: %s", path, e)
+            return default
+    
+    def save(self, name, value):
+        data = json.dumps(value, ensure_ascii=False, indent=2).encode('utf-8')
+        self._pending[name] = data
+        self._write_timer.start()
+    
+    def submit(self, names, fn, *args):
+        """Выполнить запись fn(*args) в потоке записи. Файлы names, которые
+        она меняет, не считаются изменёнными извне ни во время, ни после неё"""
+        with self._lock:
+            for name in names:
+                self._inflight[name] += 1
         
-        # Состояние браузера
-        self.incognito_mode = False
-        self.dark_mode = False
+        def run():
+            try:
+                fn(*args)
+            except OSError as e:
+                log.warning("Ошибка записи в %s: %s", self.config_dir, e)
+            finally:
+                known = {name: self._snapshot(name) for name in names}
+                with self._lock:
+                    self._known.update(known)
+                    for name in names:
+                        self._inflight[name] -= 1
         
-        # Интерфейс
-        self.setWindowTitle("Portable Browser - Домашняя страница: Google")
-        self.setGeometry(100, 100, 1200, 800)
+        return self.executor.submit(run)
+    
+    def _read_digest(self, name):
+        if name in self._unhashed:
+            return None
+        try:
+            return self._digest(self.path(name).read_bytes())
+        except OSError:
+            return None
+    
+    def _snapshot(self, name):
+        return self._stat(name), self._read_digest(name)
+    
+    def remember(self, *names):
+        """Принять текущее состояние файлов как своё: их только что изменил этот экземпляр"""
+        known = {name: self._snapshot(name) for name in names}
+        with self._lock:
+            self._known.update(known)
+    
+    def _write_pending(self):
+        pending, self._pending = self._pending, {}
+        for name, data in pending.items():
+            self.submit((name,), atomic_write, self.path(name), data)
+    
+    def flush(self, timeout=5):
+        """Записать всё отложенное и дождаться потока записи"""
+        self._write_timer.stop()
+        self._write_pending()
+        self.executor.submit(lambda: None).result(timeout=timeout)
+    
+    def watch(self, *names, hashed=True):
+        """Следить за файлами. Файлы, которые ещё не читались через load(),
+        считаются известными в текущем виде - по stat(), без чтения"""
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        self._watched.update(names)
+        if not hashed:
+            self._unhashed.update(names)
+        with self._lock:
+            for name in names:
+                if name not in self._known:
+                    self._known[name] = (self._stat(name), None)
+        # Атомарная замена файла - это новый inode, его видно по изменению каталога
+        if str(self.config_dir) not in self.watcher.directories():
+            self.watcher.addPath(str(self.config_dir))
+        self._rewatch()
+    
+    def _rewatch(self):
+        files = set(self.watcher.files())
+        for name in self._watched:
+            path = self.path(name)
+            if str(path) not in files and path.exists():
+                self.watcher.addPath(str(path))
+    
+    def _check_files(self):
+        self._rewatch()
+        for name in sorted(self._watched):
+            if name in self._pending:
+                continue
+            stat = self._stat(name)
+            with self._lock:
+                known = self._known.get(name)
+                if self._inflight[name] > 0 or (known is not None and known[0] == stat):
+                    continue
+            # stat() изменился; если содержимое то же (файл просто перезаписан), это не изменение
+            digest = self._read_digest(name)
+            with self._lock:
+                if self._inflight[name] > 0:
+                    continue
+                known = self._known.get(name)
+                self._known[name] = (stat, digest)
+                if digest is not None and known is not None and known[1] == digest:
+                    continue
+            self.changed.emit(name)
+
+BLOCKABLE_SCHEMES = ('http', 'https', 'ws', 'wss')
+
+def normalize_block_rule(site):
+    """Привести запись блокировщика к паре (хост, префикс пути)"""
+    site = site.strip().lower()
+    if '://' in site:
+        site = site.split('://', 1)[1]
+    host, _, path = site.partition('/')
+    host = host.rsplit('@', 1)[-1].split(':', 1)[0].strip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    return host, ('/' + path if path else '')
+
+def host_suffixes(host):
+    """sub.example.com -> sub.example.com, example.com, com"""
+    host = host.lower().strip('.')
+    while host:
+        yield host
+        dot = host.find('.')
+        if dot < 0:
+            break
+        host = host[dot + 1:]
+
+# Косметические правила и исключения EasyList (example.com##.ad) относятся
+# к элементам страницы, а не ко всему сайту
+COSMETIC_MARKERS = ('##', '#@#', '#?#', '#$#')
+HOSTNAME_RE = re.compile(r'^[a-z0-9_-]+(?:\.[a-z0-9_-]+)+$')
+
+def parse_filter_line(line):
+    """Хост из строки hosts-файла, списка доменов или правила EasyList вида ||host^"""
+    line = line.strip()
+    if not line or line[0] in '#![':
+        return None
+    if any(marker in line for marker in COSMETIC_MARKERS):
+        return None
+    if line.startswith('||'):
+        # Правила с опциями ($script, domain=...) и масками слишком узкие,
+        # чтобы блокировать по ним весь хост
+        if not line.endswith('^'):
+            return None
+        line = line[2:-1]
+    elif line.startswith('@@'):
+        return None
+    else:
+        parts = line.split('#', 1)[0].split()
+        if not parts:
+            return None
+        # Формат hosts: "0.0.0.0 ads.example.com"
+        line = parts[1] if len(parts) > 1 else parts[0]
+    host = line.lower().strip('.')
+    if not HOSTNAME_RE.match(host):
+        return None
+    if host in ('localhost', 'localhost.localdomain', 'local', 'broadcasthost'):
+        return None
+    return host
+
+class FilterListCache:
+    """Скомпилированный список фильтров, отображённый в память.
+    
+    Формат файла: заголовок, таблица смещений, хеш-таблица с открытой
+    адресацией и отсортированные хосты одной строкой байт. Файл не
+    разбирается при запуске: страницы подгружаются системой по мере
+    обращения, так что время старта и RSS не растут вместе со списком.
+    """
+    MAGIC = b'PBFC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHH32sII')
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        # Отображение держит собственный дескриптор, файл можно закрыть сразу
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byteorder, self.signature, self.count, self.table_size = \
+            self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION or byteorder != self._byteorder_flag():
+            self.close()
+            raise ValueError(f"Несовместимый кеш фильтров: {self.path}")
+        view = memoryview(self._map)
+        offsets_start = self.HEADER.size
+        table_start = offsets_start + (self.count + 1) * 4
+        self._blob_start = table_start + self.table_size * 4
+        self._offsets = view[offsets_start:table_start].cast('I')
+        self._table = view[table_start:self._blob_start].cast('I')
+    
+    @staticmethod
+    def _byteorder_flag():
+        return 1 if sys.byteorder == 'little' else 2
+    
+    @staticmethod
+    def read_signature(path):
+        """Подпись источников из заголовка без отображения всего файла"""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(FilterListCache.HEADER.size)
+            magic, version, _, signature, _, _ = FilterListCache.HEADER.unpack(header)
+        except (OSError, struct.error):
+            return None
+        if magic != FilterListCache.MAGIC or version != FilterListCache.VERSION:
+            return None
+        return signature
+    
+    @classmethod
+    def build(cls, hosts, path, signature):
+        """Записать кеш для набора хостов"""
+        entries = sorted({host.encode('utf-8') for host in hosts})
+        count = len(entries)
+        table_size = 8
+        while table_size < count * 2:
+            table_size *= 2
+        mask = table_size - 1
         
-        # Установка иконки
-        self.setWindowIcon(QIcon(self.create_browser_icon()))
+        offsets = array.array('I', [0]) * (count + 1)
+        table = array.array('I', [0]) * table_size
+        position = 0
+        for i, entry in enumerate(entries):
+            offsets[i] = position
+            position += len(entry)
+            slot = zlib.crc32(entry) & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = i + 1
+        offsets[count] = position
         
-        # Создание интерфейса
-        self.setup_ui()
+        with open(path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls._byteorder_flag(),
+                                    signature, count, table_size))
+            offsets.tofile(f)
+            table.tofile(f)
+            f.write(b''.join(entries))
+        return count
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        start = self._blob_start + self._offsets[index]
+        end = self._blob_start + self._offsets[index + 1]
+        return self._map[start:end].decode('utf-8')
+    
+    def __contains__(self, host):
+        key = host.encode('utf-8')
+        mask = self.table_size - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            index = self._table[slot]
+            if not index:
+                return False
+            start = self._blob_start + self._offsets[index - 1]
+            end = self._blob_start + self._offsets[index]
+            if end - start == len(key) and self._map[start:end] == key:
+                return True
+            slot = (slot + 1) & mask
+    
+    def close(self):
+        for view in ('_offsets', '_table'):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self._map.close()
+
+class HostIndex:
+    """Хешированный индекс правил по суффиксам хоста.
+    
+    Поиск проверяет только суффиксы самого хоста (sub.example.com,
+    example.com, com), поэтому время не зависит от размера списка.
+    """
+    def __init__(self):
+        self.hosts = {}
+    
+    def __len__(self):
+        return len(self.hosts)
+    
+    def __contains__(self, host):
+        return host in self.hosts
+    
+    def get(self, host, default=None):
+        return self.hosts.get(host, default)
+    
+    def set(self, host, value):
+        self.hosts[host] = value
+    
+    def discard(self, host):
+        self.hosts.pop(host, None)
+    
+    def clear(self):
+        self.hosts.clear()
+    
+    def matches(self, host):
+        """Все совпавшие суффиксы хоста, от самого точного к общему"""
+        for suffix in host_suffixes(host):
+            value = self.hosts.get(suffix)
+            if value is not None:
+                yield suffix, value
+
+class BlockedSitesManager:
+    # После стольких записей в журнале он сворачивается в blocked_sites.json
+    JOURNAL_COMPACT_LIMIT = 500
+    WATCHED_FILES = ("blocked_sites.json", "blocked_sites.log", "filters.cache")
+    
+    def __init__(self, config_dir, store=None):
+        self.config_dir = Path(config_dir)
+        self.store = store  # ConfigStore: запись в фоне; без него - сразу
+        self.config_file = self.config_dir / "blocked_sites.json"
+        self.journal_file = self.config_dir / "blocked_sites.log"
+        self.compacting_file = self.config_dir / "blocked_sites.log.compacting"
+        self.filters_dir = self.config_dir / "filters"
+        self.cache_file = self.config_dir / "filters.cache"
+        self.journal_lines = 0
+        self.blocked_sites = self.load_blocked_sites()
         
-        # Загрузка настроек
-        self.load_settings()
+        # Правила с точкой компилируются в индекс хостов, остальные
+        # (например "casino") остаются подстроками, как раньше. Значения -
+        # число записей, давших правило: записи с www. и без дают одно и то же
+        self.rebuild_index()
         
-        # Текущие вкладки
-        self.tabs = QTabWidget()
-        self.tabs.setTabsClosable(True)
-        self.tabs.tabCloseRequested.connect(self.close_tab)
-        self.tabs.currentChanged.connect(self.tab_changed)
+        # Импортированные списки фильтров
+        self.filter_cache = None
+        self.load_filter_cache()
+    
+    def load_blocked_sites(self):
+        """Список с диска: снимок плюс журнал (и журнал, который сейчас сворачивается)"""
+        sites, lines = self.read_sites()
+        self.journal_lines = lines
+        return sites
+    
+    def read_sites(self):
+        """Записи в порядке добавления: словарь служит упорядоченным множеством,
+        так что проверка, добавление и удаление не зависят от размера списка"""
+        sites = {}
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                sites = dict.fromkeys(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            log.warning("Не удалось прочитать %s: %s", self.config_file, e)
         
-        # Создаем первую вкладку с Google в качестве домашней страницы
-        self.add_new_tab()
+        # Изменения пользователя после последнего сохранения лежат в журнале
+        lines = 0
+        for journal in (self.compacting_file, self.journal_file):
+            try:
+                with open(journal, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.rstrip('\n')
+                        if len(line) < 2:
+                            continue
+                        lines += 1
+                        op, site = line[0], line[1:]
+                        if op == '+':
+                            sites.setdefault(site)
+                        elif op == '-':
+                            sites.pop(site, None)
+            except FileNotFoundError:
+                continue
+        return sites, lines
+    
+    def reload(self):
+        """Перечитать список после изменения другим окном или экземпляром"""
+        self.blocked_sites = self.load_blocked_sites()
+        self.rebuild_index()
+        cache = self.filter_cache
+        if cache is None or FilterListCache.read_signature(self.cache_file) != cache.signature:
+            self.load_filter_cache()
+    
+    def _write(self, fn, *args):
+        if self.store is not None:
+            self.store.submit(self.WATCHED_FILES[:2], fn, *args)
+        else:
+            fn(*args)
+    
+    def save_blocked_sites(self):
+        """Полностью переписать список и очистить журнал"""
+        self.journal_lines = 0
+        # Копия списка, а сериализация - в потоке записи
+        self._write(self._replace_sites, list(self.blocked_sites))
+    
+    def _replace_sites(self, sites):
+        atomic_write(self.config_file, json.dumps(sites, ensure_ascii=False).encode('utf-8'))
+        for journal in (self.journal_file, self.compacting_file):
+            if journal.exists():
+                journal.unlink()
+    
+    def _append_journal(self, line):
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(line)
+    
+    def _compact_journal(self):
+        """Свернуть журнал в blocked_sites.json по состоянию на диске.
         
-        self.setCentralWidget(self.tabs)
+        Журнал сначала переименовывается, поэтому записи других
+        экземпляров, пришедшие во время сворачивания, попадут в новый журнал.
+        """
+        if not self.journal_file.exists():
+            return
+        os.replace(self.journal_file, self.compacting_file)
+        sites, _ = self.read_sites()
+        atomic_write(self.config_file, json.dumps(list(sites), ensure_ascii=False).encode('utf-8'))
+        self.compacting_file.unlink()
+    
+    def compact(self):
+        """Свернуть журнал, если в нём есть записи"""
+        try:
+            if self.journal_file.stat().st_size == 0:
+                return
+        except FileNotFoundError:
+            return
+        self.journal_lines = 0
+        self._write(self._compact_journal)
+    
+    def filter_sources(self):
+        if not self.filters_dir.is_dir():
+            return []
+        return sorted(p for p in self.filters_dir.iterdir() if p.is_file())
+    
+    def filter_signature(self, sources=None):
+        """Подпись источников по именам, размерам и времени изменения"""
+        digest = hashlib.sha256()
+        for source in sources if sources is not None else self.filter_sources():
+            stat = source.stat()
+            digest.update(f"{source.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+        return digest.digest()
+    
+    def load_filter_cache(self):
+        """Отобразить кеш фильтров в память, пересобрав его только при смене источников"""
+        sources = self.filter_sources()
+        if not sources:
+            self.set_filter_cache(None)
+            return
+        signature = self.filter_signature(sources)
+        if FilterListCache.read_signature(self.cache_file) != signature:
+            # Текущий файл может быть отображён: собираем рядом и подменяем целиком
+            pending = self.pending_cache_file()
+            self.build_filter_cache(pending, sources)
+            self.replace_cache_file(pending)
+        try:
+            self.set_filter_cache(FilterListCache(self.cache_file))
+        except (OSError, ValueError):
+            self.set_filter_cache(None)
+    
+    def build_filter_cache(self, path, sources=None):
+        """Скомпилировать все списки из filters/ в файл кеша. Можно вызывать
+        из фонового потока: текущий кеш при этом не трогается"""
+        sources = self.filter_sources() if sources is None else sources
+        hosts = set()
+        for source in sources:
+            with open(source, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    host = parse_filter_line(line)
+                    if host:
+                        hosts.add(host)
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        return FilterListCache.build(hosts, path, self.filter_signature(sources))
+    
+    def import_filter_list(self, source_path):
+        """Скопировать список в filters/ и собрать новый кеш рядом с текущим.
+        Возвращает путь к новому кешу; подключает его install_filter_cache"""
+        self.filters_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source_path, self.filters_dir / Path(source_path).name)
+        pending = self.pending_cache_file()
+        self.build_filter_cache(pending)
+        return pending
+    
+    def pending_cache_file(self):
+        # Своё имя у каждого процесса и потока: два экземпляра на одной флешке
+        # или импорт в фоне и пересборка в потоке GUI не пишут в один файл
+        return self.cache_file.with_name(
+            f"{self.cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    
+    def install_filter_cache(self, pending):
+        """Заменить текущий кеш собранным (в потоке GUI)"""
+        self.replace_cache_file(pending)
+        self.load_filter_cache()
+    
+    def replace_cache_file(self, pending):
+        try:
+            os.replace(pending, self.cache_file)
+        except PermissionError:
+            # Под Windows отображённый файл заменить нельзя: сначала отпускаем его
+            self.set_filter_cache(None)
+            os.replace(pending, self.cache_file)
+        self._remember_cache()
+    
+    def _remember_cache(self):
+        # Свой новый кеш - не изменение из другого экземпляра
+        if self.store is not None:
+            self.store.remember(self.WATCHED_FILES[2])
+    
+    def clear_filter_lists(self):
+        self.set_filter_cache(None)
+        for source in self.filter_sources():
+            source.unlink()
+        if self.cache_file.exists():
+            self.cache_file.unlink()
+        self._remember_cache()
+    
+    def set_filter_cache(self, cache):
+        """Подключить кеш. Прежний явно не закрывается: перехватчик мог уже взять
+        ссылку на него, и отображение освободится вместе с последней ссылкой"""
+        self.filter_cache = cache
+    
+    def filter_rule_count(self):
+        return len(self.filter_cache) if self.filter_cache is not None else 0
+    
+    def rebuild_index(self):
+        """Собрать индекс заново и подставить его одной заменой ссылок:
+        перехватчик читает индекс из потока IO и не должен застать его пустым"""
+        host_index, keywords = HostIndex(), {}
+        for site in self.blocked_sites:
+            key = self._rule_key(site)
+            if key is None:
+                continue
+            if key[0] is None:
+                keywords[key[1]] = keywords.get(key[1], 0) + 1
+                continue
+            paths = host_index.get(key[0])
+            if paths is None:
+                paths = {}
+                host_index.set(key[0], paths)
+            paths[key[1]] = paths.get(key[1], 0) + 1
+        self.host_index, self.keywords = host_index, keywords
+    
+    @staticmethod
+    def _rule_key(site):
+        """(хост, путь) для правила индекса, (None, слово) для подстроки или None"""
+        host, path = normalize_block_rule(site)
+        if not host:
+            return None
+        if '.' not in host and not path:
+            return None, site.strip().lower()
+        return host, path
+    
+    def _update_index(self, sites, delta):
+        """Учесть записи в индексе (delta +1 или -1). Словари, которые может
+        обходить перехватчик, не меняются на месте: изменённые копии
+        подставляются целиком"""
+        keywords = None
+        changed = {}
+        for site in sites:
+            key = self._rule_key(site)
+            if key is None:
+                continue
+            if key[0] is None:
+                if keywords is None:
+                    keywords = dict(self.keywords)
+                counts = keywords
+            else:
+                counts = changed.get(key[0])
+                if counts is None:
+                    counts = changed[key[0]] = dict(self.host_index.get(key[0]) or {})
+            count = counts.get(key[1], 0) + delta
+            if count > 0:
+                counts[key[1]] = count
+            else:
+                counts.pop(key[1], None)
+        for host, paths in changed.items():
+            if paths:
+                self.host_index.set(host, paths)
+            else:
+                self.host_index.discard(host)
+        if keywords is not None:
+            self.keywords = keywords
+    
+    def add_site(self, site):
+        return bool(self.add_sites([site]))
+    
+    def remove_site(self, site):
+        return bool(self.remove_sites([site]))
+    
+    def add_sites(self, sites, save=True):
+        """Добавить записи пачкой; возвращает действительно добавленные"""
+        added = []
+        for site in sites:
+            if site not in self.blocked_sites:
+                self.blocked_sites[site] = None
+                added.append(site)
+        self._update_index(added, 1)
+        if save and added:
+            self.save_changes('+', added)
+        return added
+    
+    def remove_sites(self, sites, save=True):
+        removed = []
+        for site in sites:
+            if site in self.blocked_sites:
+                del self.blocked_sites[site]
+                removed.append(site)
+        self._update_index(removed, -1)
+        if save and removed:
+            self.save_changes('-', removed)
+        return removed
+    
+    def save_changes(self, op, sites):
+        """Дописать изменения в журнал вместо перезаписи всего списка.
+        Пачка не меньше JOURNAL_COMPACT_LIMIT записей сразу сохраняется снимком"""
+        if len(sites) >= self.JOURNAL_COMPACT_LIMIT:
+            self.save_blocked_sites()
+            return
+        self._write(self._append_journal, ''.join(f"{op}{site}\n" for site in sites))
+        self.journal_lines += len(sites)
+        if self.journal_lines >= self.JOURNAL_COMPACT_LIMIT:
+            self.journal_lines = 0
+            self._write(self._compact_journal)
+    
+    def clear(self):
+        self.blocked_sites = {}
+        self.rebuild_index()
+        self.save_blocked_sites()
+    
+    def is_blocked_host(self, host, path='/'):
+        """Проверка хоста и пути по индексу правил"""
+        for _, paths in self.host_index.matches(host):
+            if '' in paths:
+                return True
+            for prefix in paths:
+                if path.startswith(prefix):
+                    return True
+        cache = self.filter_cache
+        if cache is not None:
+            for suffix in host_suffixes(host):
+                if suffix in cache:
+                    return True
+        return False
+    
+    def is_blocked(self, url):
+        # Служебные схемы (data:, about:, file:) не блокируются: через data:
+        # показывается сама заглушка
+        if url.scheme() not in BLOCKABLE_SCHEMES:
+            return False
+        if self.is_blocked_host(url.host(), url.path().lower() or '/'):
+            return True
+        if self.keywords:
+            url_str = url.toString().lower()
+            for keyword in self.keywords:
+                if keyword in url_str:
+                    return True
+        return False
+
+LAZY_LOAD_SCRIPT_NAME = "portable-lazy-load"
+
+# Картинки и фреймы, которые ещё не начали грузиться, откладываются до прокрутки
+LAZY_LOAD_JS = """
+(function() {
+    function mark(node) {
+        if ((node.tagName === 'IMG' || node.tagName === 'IFRAME') && !node.hasAttribute('loading')) {
+            node.loading = 'lazy';
+        }
+    }
+    new MutationObserver(function(mutations) {
+        mutations.forEach(function(mutation) {
+            mutation.addedNodes.forEach(function(node) {
+                if (node.nodeType !== 1) return;
+                mark(node);
+                node.querySelectorAll('img:not([loading]), iframe:not([loading])').forEach(mark);
+            });
+        });
+    }).observe(document, {childList: true, subtree: true});
+})();
+"""
+
+def lazy_load_script():
+    script = QWebEngineScript()
+    script.setName(LAZY_LOAD_SCRIPT_NAME)
+    script.setSourceCode(LAZY_LOAD_JS)
+    script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+    script.setWorldId(QWebEngineScript.ApplicationWorld)
+    return script
+
+class SitePolicyManager:
+    """Правила сайтов: что разрешено странице (скрипты, картинки, автовоспроизведение...).
+    
+    Правила лежат в config/site_policies.json и ищутся по тому же индексу
+    суффиксов хоста, что и блокировщик. Итоговая политика складывается из
+    значений по умолчанию, облегчённого режима и правил от общего
+    суффикса к точному, так что правило для sub.example.com сильнее
+    правила для example.com.
+    """
+    CONFIG_FILE = "site_policies.json"
+    CACHE_LIMIT = 4096
+    DEFAULTS = {
+        'javascript': True,
+        'images': True,
+        'autoplay': True,
+        'webgl': True,
+        'fonts': True,
+        'lazy': False,
+    }
+    # Облегчённый режим для медленных и лимитных подключений
+    LITE_PRESET = {
+        'images': False,
+        'autoplay': False,
+        'webgl': False,
+        'fonts': False,
+        'lazy': True,
+    }
+    LABELS = {
+        'javascript': "JavaScript",
+        'images': "Картинки",
+        'autoplay': "Автовоспроизведение",
+        'webgl': "WebGL",
+        'fonts': "Веб-шрифты",
+        'lazy': "Ленивая загрузка",
+    }
+    
+    def __init__(self, store):
+        self.store = store
+        self.lite_mode = False
+        self.rules = {}
+        self.index = HostIndex()
+        self._cache = {}
+        self.reload()
+    
+    def reload(self):
+        rules = self.store.load(self.CONFIG_FILE, {})
+        self.rules = {}
+        if isinstance(rules, dict):
+            for host, rule in rules.items():
+                if isinstance(rule, dict):
+                    self.rules[normalize_block_rule(host)[0]] = {
+                        key: bool(value) for key, value in rule.items() if key in self.DEFAULTS}
+        self.rebuild_index()
+    
+    def rebuild_index(self):
+        self.index.clear()
+        for host, rule in self.rules.items():
+            self.index.set(host, rule)
+        # Новый словарь вместо clear(): кеш читается и из потока перехватчика
+        self._cache = {}
+    
+    def save(self):
+        self.store.save(self.CONFIG_FILE, self.rules)
+    
+    def set_rule(self, host, rule):
+        host = normalize_block_rule(host)[0]
+        if not host:
+            return False
+        self.rules[host] = {key: bool(value) for key, value in rule.items() if key in self.DEFAULTS}
+        self.rebuild_index()
+        self.save()
+        return True
+    
+    def remove_rule(self, host):
+        if self.rules.pop(host, None) is not None:
+            self.rebuild_index()
+            self.save()
+    
+    def set_lite_mode(self, enabled):
+        if enabled != self.lite_mode:
+            self.lite_mode = enabled
+            self._cache = {}
+    
+    def policy_for_host(self, host):
+        host = host.lower()
+        policy = self._cache.get(host)
+        if policy is None:
+            if len(self._cache) >= self.CACHE_LIMIT:
+                self._cache = {}
+            policy = dict(self.DEFAULTS)
+            if self.lite_mode:
+                policy.update(self.LITE_PRESET)
+            for _, rule in reversed(list(self.index.matches(host))):
+                policy.update(rule)
+            self._cache[host] = policy
+        return policy
+    
+    def policy_for(self, url):
+        return self.policy_for_host(url.host())
+    
+    def base_rule(self, host):
+        """Начальное правило для нового хоста: значения по умолчанию и правила
+        родительских доменов, но не облегчённый режим - иначе он остался бы
+        в правиле и после выключения"""
+        host = normalize_block_rule(host)[0]
+        rule = dict(self.DEFAULTS)
+        for _, parent in reversed(list(self.index.matches(host))):
+            rule.update(parent)
+        return rule
+
+class UrlBlockInterceptor(QWebEngineUrlRequestInterceptor):
+    """Блокирует запросы к заблокированным сайтам до выхода в сеть,
+    включая подресурсы страницы (скрипты, реклама, счётчики), а также
+    веб-шрифты на сайтах, где правила их запрещают"""
+    def __init__(self, block_manager, parent=None, site_policies=None):
+        super().__init__(parent)
+        self.block_manager = block_manager
+        self.site_policies = site_policies
+    
+    def interceptRequest(self, info):
+        url = info.requestUrl()
+        if self.block_manager.is_blocked(url):
+            info.block(True)
+        elif (self.site_policies is not None
+                and info.resourceType() == QWebEngineUrlRequestInfo.ResourceTypeFontResource
+                and not self.site_policies.policy_for(info.firstPartyUrl())['fonts']):
+            info.block(True)
+
+class BrowserPage(QWebEnginePage):
+    """Страница вкладки: вместо заблокированного сайта показывает заглушку,
+    а без сети - сохранённую копию страницы, если она есть"""
+    def __init__(self, profile, parent=None, block_manager=None, blocked_page_html=None,
+                 offline_archive=None, site_policies=None):
+        super().__init__(profile, parent)
+        self.block_manager = block_manager
+        self.blocked_page_html = blocked_page_html
+        self.offline_archive = offline_archive
+        self.site_policies = site_policies
+        self._blocked_url = None
+        self._offline_url = None
+        self._policy = None
+    
+    def acceptNavigationRequest(self, url, nav_type, is_main_frame):
+        # Заглушка нужна только для основной навигации; подресурсы и
+        # фреймы отсекает UrlBlockInterceptor
+        if is_main_frame and self.block_manager and self.block_manager.is_blocked(url):
+            self._blocked_url = url.toString()
+            QTimer.singleShot(0, self.show_blocked_page)
+            return False
+        archive = self.offline_archive
+        if is_main_frame and archive is not None and not archive.online and archive.has(url.toString()):
+            self._offline_url = url.toString()
+            QTimer.singleShot(0, self.show_offline_copy)
+            return False
+        # Правила сайта применяются до того, как новый документ начнёт грузиться
+        if is_main_frame and self.site_policies is not None and url.scheme() in BLOCKABLE_SCHEMES:
+            self.apply_policy(self.site_policies.policy_for(url))
+        return super().acceptNavigationRequest(url, nav_type, is_main_frame)
+    
+    def apply_policy(self, policy):
+        if policy == self._policy:
+            return
+        self._policy = policy
+        settings = self.settings()
+        settings.setAttribute(QWebEngineSettings.JavascriptEnabled, policy['javascript'])
+        settings.setAttribute(QWebEngineSettings.AutoLoadImages, policy['images'])
+        settings.setAttribute(QWebEngineSettings.PlaybackRequiresUserGesture, not policy['autoplay'])
+        settings.setAttribute(QWebEngineSettings.WebGLEnabled, policy['webgl'])
+        scripts = self.scripts()
+        script = scripts.findScript(LAZY_LOAD_SCRIPT_NAME)
+        if policy['lazy'] and script.isNull():
+            scripts.insert(lazy_load_script())
+        elif not policy['lazy'] and not script.isNull():
+            scripts.remove(script)
+    
+    def show_offline_copy(self):
+        if self._offline_url is not None:
+            local_url = self.offline_archive.open_url(self._offline_url)
+            if local_url is not None:
+                self.setUrl(local_url)
+        self._offline_url = None
+    
+    def show_blocked_page(self):
+        if self._blocked_url is not None and self.blocked_page_html:
+            self.setHtml(self.blocked_page_html(self._blocked_url))
+        self._blocked_url = None
+
+class FilterImportWorker(QThread):
+    """Компиляция импортированного списка фильтров в фоновом потоке"""
+    imported = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, block_manager, source_path, parent=None):
+        super().__init__(parent)
+        self.block_manager = block_manager
+        self.source_path = source_path
+    
+    def run(self):
+        try:
+            pending = self.block_manager.import_filter_list(self.source_path)
+        except (OSError, ValueError) as e:
+            self.failed.emit(str(e))
+            return
+        self.imported.emit(str(pending))
+
+class BlockListModel(QAbstractListModel):
+    """Записи блокировщика для QListView без элемента виджета на каждую запись.
+    
+    Модель держит список видимых записей (все или совпавшие с фильтром) и
+    меняет его точечно: добавление - вставка строк в конец, удаление -
+    диапазоны строк. Фильтр, продолжающий предыдущий, просматривает лишь
+    прошлые совпадения. Большие пачки (импорт, удаление выделенного)
+    идут порциями по таймеру, поэтому окно отвечает и на миллионе записей.
+    """
+    progress = pyqtSignal(int)
+    running = pyqtSignal(bool)
+    
+    CHUNK = 20000
+    # Больше стольких разрозненных диапазонов дешевле пересобрать модель
+    MAX_RANGES = 200
+    
+    def __init__(self, manager, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.query = ""
+        self.rows = list(manager.blocked_sites)
+        self._bulk = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._step)
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.rows[index.row()]
+        return None
+    
+    def is_running(self):
+        return self._bulk is not None
+    
+    def reload(self):
+        """Пересобрать после изменения списка другим окном или экземпляром"""
+        self.finish()
+        self.beginResetModel()
+        self.rows = self._filtered(self.manager.blocked_sites, self.query)
+        self.endResetModel()
+    
+    @staticmethod
+    def _filtered(sites, query):
+        if not query:
+            return list(sites)
+        return [site for site in sites if query in site.lower()]
+    
+    def set_filter(self, text):
+        query = text.strip().lower()
+        if query == self.query:
+            return
+        # Номера строк пачки удаления относятся к прежнему фильтру
+        self.finish()
+        narrowing = self.query and query.startswith(self.query)
+        self.beginResetModel()
+        self.rows = self._filtered(self.rows if narrowing else self.manager.blocked_sites, query)
+        self.query = query
+        self.endResetModel()
+    
+    def _append_rows(self, sites):
+        if self.query:
+            sites = [site for site in sites if self.query in site.lower()]
+        if sites:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(sites) - 1)
+            self.rows.extend(sites)
+            self.endInsertRows()
+    
+    def _remove_rows(self, rows):
+        """Убрать строки (номера по возрастанию) диапазонами снизу вверх"""
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            elif len(ranges) < self.MAX_RANGES:
+                ranges.append([row, row])
+            else:
+                ranges = None
+                break
+        if ranges is None:
+            keep = bytearray(b'\x01') * len(self.rows)
+            for row in rows:
+                keep[row] = 0
+            self.beginResetModel()
+            self.rows = list(itertools.compress(self.rows, keep))
+            self.endResetModel()
+            return
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.rows[first:last + 1]
+            self.endRemoveRows()
+    
+    def add_sites(self, sites):
+        """Добавить записи; большой поток (например, файл) обрабатывается порциями"""
+        self._start('+', iter(sites), None)
+    
+    def remove_rows(self, rows):
+        rows = sorted(set(rows))
+        self._start('-', iter([self.rows[row] for row in rows]), rows)
+    
+    def _start(self, op, sites, rows):
+        if self._bulk is not None:
+            return
+        self._bulk = (op, sites, rows, [])
+        self.running.emit(True)
+        # Небольшая пачка укладывается в одну порцию и применяется сразу
+        self._step()
+        if self._bulk is not None:
+            self.timer.start(0)
+    
+    def _step(self):
+        op, sites, rows, changed = self._bulk
+        chunk = list(itertools.islice(sites, self.CHUNK))
+        if op == '+':
+            added = self.manager.add_sites(chunk, save=False)
+            changed.extend(added)
+            self._append_rows(added)
+        else:
+            changed.extend(self.manager.remove_sites(chunk, save=False))
+        self.progress.emit(len(changed))
+        if len(chunk) < self.CHUNK:
+            self._finish()
+    
+    def _finish(self):
+        op, _, rows, changed = self._bulk
+        self.timer.stop()
+        self._bulk = None
+        if rows:
+            self._remove_rows(rows)
+        if changed:
+            self.manager.save_changes(op, changed)
+        self.running.emit(False)
+    
+    def finish(self):
+        """Доделать текущую пачку сразу (например, при закрытии окна)"""
+        while self._bulk is not None:
+            self._step()
+
+def read_block_list(path):
+    """Хосты из файла по одному на запись: домены, hosts или EasyList.
+    Строки, которые parse_filter_line отвергает (комментарии, косметические
+    правила, исключения), пропускаются"""
+    # Файл открывается сразу, чтобы ошибку чтения получил вызывающий,
+    # а не порция добавления, которая разбирает поток позже
+    f = open(path, 'r', encoding='utf-8', errors='replace')
+    def hosts():
+        with f:
+            for line in f:
+                host = parse_filter_line(line)
+                if host and "google" not in host:
+                    yield host
+    return hosts()
+
+def read_meminfo():
+    """Содержимое /proc/meminfo в килобайтах (пустой словарь вне Linux)"""
+    info = {}
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                parts = value.split()
+                if parts:
+                    info[name] = int(parts[0])
+    except (OSError, ValueError):
+        pass
+    return info
+
+def process_rss_kb(pid):
+    """Резидентная память процесса по /proc/<pid>/status, 0 если недоступна"""
+    if not pid:
+        return 0
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+class TabHibernator(QObject):
+    """Усыпление фоновых вкладок через состояния жизненного цикла страницы.
+    
+    Неактивная вкладка сначала замораживается (Frozen), затем выгружается
+    (Discarded). Выгруженная страница сохраняет URL и историю и
+    перезагружается при выборе вкладки. Выгрузка ускоряется, когда
+    рендереры превышают бюджет памяти или в системе мало свободной памяти.
+    """
+    DEFAULT_SETTINGS = {
+        'enabled': True,
+        'freeze_after': 300,          # секунд в фоне до заморозки
+        'discard_after': 1800,        # секунд в фоне до выгрузки
+        'memory_budget_mb': 1500,     # суммарный RSS рендереров, 0 - без ограничения
+        'min_available_percent': 15,  # порог MemAvailable/MemTotal
+    }
+    CHECK_INTERVAL = 15000
+    
+    restored = pyqtSignal(object, float)
+    
+    def __init__(self, tabs, settings=None, parent=None):
+        super().__init__(parent)
+        self.tabs = tabs
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.restore_latencies = []
+        self._pending_restore = {}
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.apply_settings(self.settings)
+    
+    def apply_settings(self, settings):
+        self.settings.update(settings)
+        if self.settings['enabled']:
+            self.timer.start(self.CHECK_INTERVAL)
+        else:
+            self.timer.stop()
+    
+    def state(self, tab):
+        if tab.browser is None:
+            return QWebEnginePage.LifecycleState.Active
+        return tab.browser.page().lifecycleState()
+    
+    def background_tabs(self):
+        current = self.tabs.currentWidget()
+        for i in range(self.tabs.count()):
+            tab = self.tabs.widget(i)
+            if tab is not current and tab.browser is not None:
+                yield tab
+    
+    def can_sleep(self, tab):
+        page = tab.browser.page()
+        # Играющие звук и видимые страницы Chromium усыпить не даст
+        return not page.isVisible() and not page.recentlyAudible()
+    
+    def memory_pressure(self):
+        info = read_meminfo()
+        total = info.get('MemTotal')
+        available = info.get('MemAvailable')
+        if not total or available is None:
+            return False
+        return available * 100 / total < self.settings['min_available_percent']
+    
+    def renderer_usage_kb(self):
+        """RSS рендереров по вкладкам; общий процесс учитывается один раз"""
+        usage = {}
+        pids = set()
+        total = 0
+        for i in range(self.tabs.count()):
+            tab = self.tabs.widget(i)
+            if tab.browser is None:
+                continue
+            pid = tab.browser.page().renderProcessPid()
+            rss = process_rss_kb(pid)
+            usage[tab] = rss
+            if pid not in pids:
+                pids.add(pid)
+                total += rss
+        return usage, total
+    
+    def check(self):
+        now = time.monotonic()
+        for tab in list(self.background_tabs()):
+            if not self.can_sleep(tab):
+                continue
+            idle = now - tab.last_active
+            state = self.state(tab)
+            if idle >= self.settings['discard_after']:
+                self.discard(tab)
+            elif idle >= self.settings['freeze_after'] and state == QWebEnginePage.LifecycleState.Active:
+                tab.browser.page().setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+        self.enforce_budget()
+    
+    def enforce_budget(self):
+        budget_kb = self.settings['memory_budget_mb'] * 1024
+        pressure = self.memory_pressure()
+        if not budget_kb and not pressure:
+            return
+        usage, total = self.renderer_usage_kb()
+        if not pressure and total <= budget_kb:
+            return
+        
+        # Выгружаем дольше всех неактивные вкладки, пока не уложимся в бюджет;
+        # при нехватке памяти в системе - по одной за проверку
+        candidates = sorted(
+            (tab for tab in self.background_tabs()
+             if self.can_sleep(tab) and self.state(tab) != QWebEnginePage.LifecycleState.Discarded),
+            key=lambda tab: tab.last_active)
+        for tab in candidates:
+            self.discard(tab)
+            total -= usage.get(tab, 0)
+            if pressure or (budget_kb and total <= budget_kb):
+                break
+    
+    def discard(self, tab):
+        page = tab.browser.page()
+        if page.lifecycleState() == QWebEnginePage.LifecycleState.Discarded:
+            return
+        # В выгруженное состояние можно перейти только из замороженного
+        if page.lifecycleState() == QWebEnginePage.LifecycleState.Active:
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+        page.setLifecycleState(QWebEnginePage.LifecycleState.Discarded)
+    
+    def activate(self, tab):
+        """Вызывается при выборе вкладки: будит её и замеряет время восстановления"""
+        tab.last_active = time.monotonic()
+        if tab.browser is None:
+            return
+        page = tab.browser.page()
+        state = page.lifecycleState()
+        if state == QWebEnginePage.LifecycleState.Active:
+            return
+        started = time.perf_counter()
+        page.setLifecycleState(QWebEnginePage.LifecycleState.Active)
+        if state == QWebEnginePage.LifecycleState.Frozen:
+            self.record_restore(tab, started)
+        else:
+            # Выгруженная страница перезагружается - ждём окончания загрузки
+            self._pending_restore[tab] = started
+            page.loadFinished.connect(self._restore_finished)
+    
+    def _restore_finished(self, ok):
+        page = self.sender()
+        page.loadFinished.disconnect(self._restore_finished)
+        for tab, started in list(self._pending_restore.items()):
+            if tab.browser is not None and tab.browser.page() is page:
+                del self._pending_restore[tab]
+                self.record_restore(tab, started)
+    
+    def forget(self, tab):
+        self._pending_restore.pop(tab, None)
+    
+    def record_restore(self, tab, started):
+        latency = (time.perf_counter() - started) * 1000
+        self.restore_latencies = (self.restore_latencies + [latency])[-50:]
+        self.restored.emit(tab, latency)
+
+class IncognitoProfileManager(QObject):
+    """Один профиль инкогнито на окно вместо отдельного профиля на вкладку.
+    
+    Профиль без имени работает в режиме off-the-record: куки, кеш и
+    хранилище живут только в памяти и ничего не пишут на диск. Профиль
+    создаётся для первой вкладки инкогнито и удаляется вместе с последней.
+    """
+    profile_created = pyqtSignal(object)
+    
+    def __init__(self, url_interceptor, parent=None):
+        super().__init__(parent)
+        self.url_interceptor = url_interceptor
+        self.profile = None
+        self.users = 0
+    
+    def acquire(self):
+        if self.profile is None:
+            self.profile = QWebEngineProfile(self)
+            self.profile.setHttpCacheType(QWebEngineProfile.MemoryHttpCache)
+            self.profile.setPersistentCookiesPolicy(QWebEngineProfile.NoPersistentCookies)
+            self.profile.setUrlRequestInterceptor(self.url_interceptor)
+            self.profile_created.emit(self.profile)
+        self.users += 1
+        return self.profile
+    
+    def release(self, profile):
+        if profile is None or profile is not self.profile:
+            return
+        self.users -= 1
+        if self.users <= 0:
+            # Страницы вкладки удаляются раньше: deleteLater обрабатывается по порядку
+            self.profile.deleteLater()
+            self.profile = None
+            self.users = 0
+    
+    @staticmethod
+    def sweep_leftovers(data_dir):
+        """Удалить каталоги incognito_* от прежних версий в фоновом потоке"""
+        def sweep():
+            for path in Path(data_dir).glob('incognito_*'):
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+        thread = threading.Thread(target=sweep, name="incognito-sweep", daemon=True)
+        thread.start()
+        return thread
+
+class Preconnector(QObject):
+    """Заранее открывает соединения к частым источникам.
+    
+    Скрытая страница без вида состоит только из подсказок preconnect и
+    dns-prefetch: Chromium разрешает имена и устанавливает TCP/TLS
+    соединения в пуле профиля, и первая настоящая загрузка с этих
+    источников обходится без рукопожатий. Неиспользованные соединения
+    живут недолго, поэтому подсказки повторяются не чаще MIN_INTERVAL.
+    """
+    MIN_INTERVAL = 30
+    
+    def __init__(self, profile, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.page = None
+        self.last = None
+    
+    def due(self):
+        return self.last is None or time.monotonic() - self.last >= self.MIN_INTERVAL
+    
+    def preconnect(self, origins):
+        origins = list(dict.fromkeys(origin for origin in origins if origin))
+        if not origins:
+            return
+        self.last = time.monotonic()
+        if self.page is None:
+            self.page = QWebEnginePage(self.profile, self)
+        links = ''.join(
+            f'<link rel="preconnect" href="{html.escape(origin)}">'
+            f'<link rel="dns-prefetch" href="{html.escape(origin)}">'
+            for origin in origins)
+        self.page.setHtml(f"<!DOCTYPE html><html><head>{links}</head></html>")
+
+def network_is_metered():
+    """Лимитное ли подключение по данным NetworkManager; None, если неизвестно"""
+    try:
+        from PyQt5.QtDBus import QDBusConnection, QDBusInterface
+    except ImportError:
+        return None
+    bus = QDBusConnection.systemBus()
+    if not bus.isConnected():
+        return None
+    manager = QDBusInterface("org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager",
+                             "org.freedesktop.NetworkManager", bus)
+    if not manager.isValid():
+        return None
+    metered = manager.property("Metered")
+    # NMMetered: 1 - да, 3 - предположительно да, 2 и 4 - нет, 0 - неизвестно
+    if metered in (1, 3):
+        return True
+    if metered in (2, 4):
+        return False
+    return None
+
+class NavigationPredictor(QObject):
+    """Угадывает адрес по набранному в адресной строке и готовит его заранее.
+    
+    По прошлым переходам копится статистика "набранный префикс - открытый
+    адрес". Кандидаты берутся из подсказок истории: выше PRECONNECT_AT к
+    источнику открывается соединение, выше PRERENDER_AT страница целиком
+    загружается в скрытую QWebEnginePage и по Enter подменяет страницу
+    вкладки. На лимитном подключении предсказания выключены, при нехватке
+    памяти - только предзагрузка страниц.
+    """
+    DEFAULT_SETTINGS = {
+        'enabled': True,
+        'allow_metered': False,
+        'min_total_ram_mb': 4096,
+        'min_available_mb': 1024,
+        'prerenders_per_minute': 6,
+    }
+    PRECONNECT_AT = 0.3
+    PRERENDER_AT = 0.6
+    PRERENDER_TTL = 60
+    MAX_PREFIX = 16
+    MAX_PREFIXES = 5000
+    MAX_URLS_PER_PREFIX = 8
+    METERED_CHECK_INTERVAL = 300
+    
+    def __init__(self, state_file, preconnector, page_factory, settings=None, parent=None):
+        super().__init__(parent)
+        self.state_file = Path(state_file)
+        self.preconnector = preconnector
+        self.page_factory = page_factory
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.counts = OrderedDict()  # префикс -> {адрес: число переходов}
+        self.prerendered = None  # (вкладка, адрес, страница)
+        self.prerender_times = deque()
+        self.preconnected = {}
+        self.dirty = False
+        self._metered = (None, None)
+        
+        self.expire_timer = QTimer(self)
+        self.expire_timer.setSingleShot(True)
+        self.expire_timer.timeout.connect(self.discard)
+        self.load()
+    
+    @staticmethod
+    def url_key(url):
+        qurl = QUrl(url).adjusted(QUrl.StripTrailingSlash | QUrl.NormalizePathSegments)
+        if qurl.path() == '/':
+            qurl.setPath('')
+        return qurl.toString()
+    
+    def load(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.counts = OrderedDict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Статистика предсказаний не прочитана: %s", e)
+    
+    def save(self):
+        if self.dirty:
+            atomic_write(self.state_file, json.dumps(self.counts, ensure_ascii=False).encode('utf-8'))
+            self.dirty = False
+    
+    def apply_settings(self, settings):
+        self.settings.update(settings)
+        if not self.settings['enabled']:
+            self.discard()
+    
+    def learn(self, text, url):
+        """Запомнить, куда привёл набранный текст"""
+        text = text.strip().lower()
+        key = self.url_key(url)
+        for length in range(1, min(len(text), self.MAX_PREFIX) + 1):
+            prefix = text[:length]
+            urls = self.counts.pop(prefix, {})
+            urls[key] = urls.get(key, 0) + 1
+            if len(urls) > self.MAX_URLS_PER_PREFIX:
+                del urls[min(urls, key=urls.get)]
+            self.counts[prefix] = urls
+        while len(self.counts) > self.MAX_PREFIXES:
+            self.counts.popitem(last=False)
+        self.dirty = True
+    
+    def best(self, text, candidates):
+        """Самый вероятный адрес из кандидатов и уверенность от 0 до 1"""
+        text = text.strip().lower()
+        if not text or not candidates:
+            return None, 0.0
+        stats = self.counts.get(text[:self.MAX_PREFIX], {})
+        # +1 в знаменателе оставляет место адресу, которого ещё не открывали
+        total = sum(stats.values()) + 1
+        best, confidence = None, 0.0
+        for rank, url in enumerate(candidates):
+            score = stats.get(self.url_key(url), 0) / total
+            host = QUrl(url).host().lower()
+            if host.startswith('www.'):
+                host = host[4:]
+            if host.startswith(text):
+                score = max(score, 0.5 / (rank + 1))
+            if score > confidence:
+                best, confidence = url, score
+        return best, confidence
+    
+    def metered(self):
+        checked, value = self._metered
+        now = time.monotonic()
+        if checked is None or now - checked > self.METERED_CHECK_INTERVAL:
+            value = network_is_metered()
+            self._metered = (now, value)
+        return bool(value)
+    
+    def can_prerender(self):
+        meminfo = read_meminfo()
+        if meminfo.get('MemTotal', 1 << 40) < self.settings['min_total_ram_mb'] * 1024:
+            return False
+        if meminfo.get('MemAvailable', 1 << 40) < self.settings['min_available_mb'] * 1024:
+            return False
+        now = time.monotonic()
+        while self.prerender_times and now - self.prerender_times[0] > 60:
+            self.prerender_times.popleft()
+        return len(self.prerender_times) < self.settings['prerenders_per_minute']
+    
+    def prepare(self, tab, url, confidence):
+        """Соединение или предзагрузка для кандидата в зависимости от уверенности"""
+        if url is None or confidence < self.PRECONNECT_AT or not self.settings['enabled']:
+            return
+        if not self.settings['allow_metered'] and self.metered():
+            return
+        
+        # Подменить страницу можно только у вкладки без истории: иначе
+        # пропала бы навигация назад
+        if (confidence >= self.PRERENDER_AT and tab.browser.history().count() <= 1
+                and self.can_prerender()):
+            self.prerender(tab, url)
+            return
+        
+        origin = url_origin(url)
+        now = time.monotonic()
+        if origin and now - self.preconnected.get(origin, -Preconnector.MIN_INTERVAL) >= Preconnector.MIN_INTERVAL:
+            self.preconnected[origin] = now
+            self.preconnector.preconnect([origin])
+    
+    def prerender(self, tab, url):
+        if self.prerendered is not None:
+            current_tab, current_url, page = self.prerendered
+            if current_tab is tab and current_url == url:
+                return
+            self.discard()
+        page = self.page_factory(tab.profile, self)
+        page.setAudioMuted(True)
+        page.setUrl(QUrl(url))
+        self.prerendered = (tab, url, page)
+        self.prerender_times.append(time.monotonic())
+        self.expire_timer.start(self.PRERENDER_TTL * 1000)
+    
+    def take(self, tab, url):
+        """Готовая страница для перехода по Enter или None"""
+        if self.prerendered is None:
+            return None
+        current_tab, current_url, page = self.prerendered
+        if current_tab is not tab or self.url_key(current_url) != self.url_key(url):
+            return None
+        self.prerendered = None
+        self.expire_timer.stop()
+        page.setAudioMuted(False)
+        return page
+    
+    def discard(self):
+        if self.prerendered is not None:
+            self.prerendered[2].deleteLater()
+            self.prerendered = None
+        self.expire_timer.stop()
+    
+    def forget(self, tab):
+        if self.prerendered is not None and self.prerendered[0] is tab:
+            self.discard()
+
+class SessionStore:
+    """Открытые вкладки: журнал событий только на дозапись плюс снимок.
+    
+    Каждое открытие, закрытие и переход дописывает в journal.jsonl одну
+    короткую строку, так что цена записи не зависит от числа вкладок.
+    Время от времени журнал сворачивается в snapshot.json. Оборванная при
+    сбое последняя строка журнала при загрузке пропускается.
+    """
+    COMPACT_EVERY = 200
+    
+    def __init__(self, session_dir):
+        self.session_dir = Path(session_dir)
+        self.snapshot_file = self.session_dir / "snapshot.json"
+        self.journal_file = self.session_dir / "journal.jsonl"
+        self.tabs = {}
+        self.current = None
+        self.events = 0
+        self.loaded = False
+        self._journal = None
+    
+    def has_state(self):
+        return self.snapshot_file.exists() or (
+            self.journal_file.exists() and self.journal_file.stat().st_size > 0)
+    
+    def load(self):
+        """Снимок плюс события журнала; возвращает вкладки по порядку открытия"""
+        if self.loaded:
+            return list(self.tabs.values())
+        self.loaded = True
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            for entry in snapshot.get('tabs', []):
+                self.tabs[entry['id']] = entry
+            self.current = snapshot.get('current')
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError):
+            self.tabs.clear()
+        
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, AttributeError, TypeError):
+                        continue
+                    self.events += 1
+        except OSError:
+            pass
+        return list(self.tabs.values())
+    
+    def _apply(self, event):
+        op = event.get('op')
+        tab_id = event.get('id')
+        if op == 'open':
+            self.tabs[tab_id] = {'id': tab_id, 'url': event.get('url', ''),
+                                 'title': event.get('title', ''), 'history': None}
+        elif op == 'close':
+            self.tabs.pop(tab_id, None)
+            if self.current == tab_id:
+                self.current = None
+        elif op == 'current':
+            self.current = tab_id
+        elif tab_id in self.tabs:
+            entry = self.tabs[tab_id]
+            if op == 'nav':
+                entry['url'] = event.get('url', entry['url'])
+                entry['title'] = event.get('title', entry['title'])
+            elif op == 'hist':
+                entry['history'] = event.get('data')
+    
+    def record(self, op, tab_id, **fields):
+        """Дописать событие в журнал"""
+        if not self.loaded:
+            self.load()
+        event = {'op': op, 'id': tab_id}
+        event.update(fields)
+        self._apply(event)
+        if self._journal is None:
+            self.session_dir.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._journal.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        self.events += 1
+        if self.events >= self.COMPACT_EVERY:
+            self.compact()
+    
+    def compact(self):
+        """Свернуть журнал в снимок (атомарно: временный файл и rename)"""
+        if not self.loaded or not self.events:
+            return
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        snapshot = {
+            'tabs': list(self.tabs.values()),
+            'current': self.current,
+            'saved_at': datetime.now().isoformat()
+        }
+        atomic_write(self.snapshot_file, json.dumps(snapshot, ensure_ascii=False).encode('utf-8'))
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        open(self.journal_file, 'w').close()
+        self.events = 0
+    
+    def close(self):
+        self.compact()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+def compact_sqlite(conn, min_free_ratio=0.2):
+    """VACUUM, если свободных страниц в базе не меньше min_free_ratio, и усечение WAL"""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    vacuum = page_count > 0 and free_count / page_count >= min_free_ratio
+    if vacuum:
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return vacuum
+
+class HistoryStore:
+    """История посещений в SQLite (WAL) с индексом FTS5 и оценкой frecency.
+    
+    Посещения копятся в очереди и пишутся пачками из отдельного потока,
+    поэтому поток интерфейса никогда не ждёт диск. frecency хранится в
+    логарифмическом виде ln(оценка) + t * ln2 / период_полураспада: так
+    порядок по столбцу совпадает с порядком по затухающей оценке в любой
+    момент времени, и сортировку обслуживает обычный индекс.
+    """
+    HALF_LIFE = 30 * 24 * 3600
+    DECAY = math.log(2) / HALF_LIFE
+    FLUSH_INTERVAL = 1.0
+    BATCH_SIZE = 200
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS places (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE,
+            title TEXT NOT NULL DEFAULT '',
+            visit_count INTEGER NOT NULL DEFAULT 0,
+            last_visit REAL NOT NULL DEFAULT 0,
+            frecency REAL NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS places_frecency ON places(frecency DESC);
+        CREATE VIRTUAL TABLE IF NOT EXISTS places_fts USING fts5(
+            title, url, content='places', content_rowid='id', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS places_ai AFTER INSERT ON places BEGIN
+            INSERT INTO places_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+        END;
+        CREATE TRIGGER IF NOT EXISTS places_ad AFTER DELETE ON places BEGIN
+            INSERT INTO places_fts(places_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+        END;
+        CREATE TRIGGER IF NOT EXISTS places_au AFTER UPDATE OF title, url ON places BEGIN
+            INSERT INTO places_fts(places_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+            INSERT INTO places_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+        END;
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+    
+    @classmethod
+    def connect(cls, db_path):
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.create_function('frecency_bump', 2, cls.frecency_bump, deterministic=True)
+        return conn
+    
+    @classmethod
+    def frecency_bump(cls, key, now):
+        """Добавить посещение к затухающей оценке, хранящейся как ключ"""
+        score = math.exp(key - now * cls.DECAY) if key else 0.0
+        return math.log(score + 1.0) + now * cls.DECAY
+    
+    def add_visit(self, url, title=''):
+        self._queue.put(('visit', url, title, time.time()))
+    
+    def update_title(self, url, title):
+        self._queue.put(('title', url, title, None))
+    
+    def compact(self):
+        """Сжать базу отдельным соединением; поток записи при этом не останавливается"""
+        conn = self.connect(self.db_path)
+        try:
+            return compact_sqlite(conn)
+        finally:
+            conn.close()
+    
+    def close(self):
+        """Дописать очередь и остановить поток записи"""
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+    
+    def _write_loop(self):
+        conn = self.connect(self.db_path)
+        conn.executescript(self.SCHEMA)
+        running = True
+        while running:
+            batch = []
+            try:
+                item = self._queue.get()
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.BATCH_SIZE:
+                        break
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                else:
+                    running = False
+            except queue.Empty:
+                pass
+            if batch:
+                self._write_batch(conn, batch)
+        conn.close()
+    
+    def _write_batch(self, conn, batch):
+        with conn:
+            for op, url, title, when in batch:
+                if op == 'visit':
+                    conn.execute(
+                        "INSERT INTO places(url, title, visit_count, last_visit, frecency) "
+                        "VALUES (?, ?, 1, ?, frecency_bump(0, ?)) "
+                        "ON CONFLICT(url) DO UPDATE SET "
+                        "visit_count = visit_count + 1, last_visit = excluded.last_visit, "
+                        "title = CASE WHEN excluded.title != '' THEN excluded.title ELSE title END, "
+                        "frecency = frecency_bump(frecency, excluded.last_visit)",
+                        (url, title, when, when))
+                elif op == 'title':
+                    conn.execute("UPDATE places SET title = ? WHERE url = ? AND title != ?",
+                                 (title, url, title))
+
+class HistoryQueryWorker(QObject):
+    """Подсказки адресной строки в отдельном потоке со своим соединением.
+    
+    Самые частые адреса держатся в памяти и проверяются первыми, затем
+    выполняется добор через FTS5. Обработчик прогресса SQLite прерывает
+    запрос по истечении бюджета времени, поэтому ответ приходит за
+    миллисекунды даже на истории в полмиллиона строк.
+    """
+    results = pyqtSignal(int, list)
+    origins = pyqtSignal(list)
+    
+    TOP_SIZE = 5000
+    TOP_REFRESH = 30.0
+    TIME_BUDGET = 0.008
+    
+    def __init__(self, db_path, limit=10):
+        super().__init__()
+        self.db_path = Path(db_path)
+        self.limit = limit
+        self.latest = 0
+        self._conn = None
+        self._deadline = 0
+        self._top = []
+        self._top_loaded = 0
+    
+    @staticmethod
+    def fts_query(text):
+        tokens = re.findall(r'\w+', text.lower())
+        return ' '.join(f'"{token}"*' for token in tokens)
+    
+    def _over_budget(self):
+        return 1 if time.perf_counter() > self._deadline else 0
+    
+    @pyqtSlot()
+    def warm_up(self):
+        """Открыть базу и загрузить частые адреса до первого запроса"""
+        if self._conn is not None or not self.db_path.exists():
+            return
+        try:
+            self._conn = HistoryStore.connect(self.db_path)
+            self._conn.set_progress_handler(self._over_budget, 1000)
+            self._refresh_top()
+        except sqlite3.OperationalError:
+            self._conn = None
+    
+    def _refresh_top(self):
+        self._deadline = time.perf_counter() + 1.0
+        rows = self._conn.execute(
+            "SELECT url, title FROM places ORDER BY frecency DESC LIMIT ?", (self.TOP_SIZE,))
+        self._top = [(url, title, url.lower() + '\n' + title.lower()) for url, title in rows]
+        self._top_loaded = time.monotonic()
+    
+    @pyqtSlot(int)
+    def top_origins(self, count):
+        """Источники самых частых адресов - для предварительного соединения"""
+        self.warm_up()
+        found = []
+        for url, title, haystack in self._top:
+            origin = url_origin(url)
+            if origin and origin.startswith(('http://', 'https://')) and origin not in found:
+                found.append(origin)
+                if len(found) >= count:
+                    break
+        self.origins.emit(found)
+    
+    @pyqtSlot(int, str)
+    def query(self, seq, text):
+        # Пока запрос стоял в очереди, пользователь мог напечатать ещё
+        if seq != self.latest:
+            return
+        text = text.strip().lower()
+        if not text or not self.db_path.exists():
+            self.results.emit(seq, [])
+            return
+        self.warm_up()
+        if self._conn is None:
+            self.results.emit(seq, [])
+            return
+        
+        found = []
+        seen = set()
+        for url, title, haystack in self._top:
+            if text in haystack:
+                seen.add(url)
+                found.append((url, title))
+                if len(found) >= self.limit:
+                    break
+        
+        match = self.fts_query(text)
+        if match and len(found) < self.limit:
+            self._deadline = time.perf_counter() + self.TIME_BUDGET
+            try:
+                rows = self._conn.execute(
+                    "SELECT p.url, p.title FROM places_fts JOIN places p ON p.id = places_fts.rowid "
+                    "WHERE places_fts MATCH ? ORDER BY p.frecency DESC LIMIT ?",
+                    (match, self.limit * 2)).fetchall()
+            except sqlite3.OperationalError:
+                # Слишком общий запрос прерван по бюджету времени
+                rows = []
+            for url, title in rows:
+                if url not in seen and len(found) < self.limit:
+                    seen.add(url)
+                    found.append((url, title))
+        self.results.emit(seq, found)
+        
+        # Список частых адресов обновляется уже после ответа
+        if time.monotonic() - self._top_loaded > self.TOP_REFRESH:
+            try:
+                self._refresh_top()
+            except sqlite3.OperationalError:
+                pass
+
+def url_origin(url):
+    """Источник (схема, хост, порт) адреса - ключ кеша значков"""
+    qurl = QUrl(url)
+    if not qurl.host():
+        return None
+    port = qurl.port()
+    return f"{qurl.scheme()}://{qurl.host()}" + (f":{port}" if port > 0 else "")
+
+def elide_title(title, limit=20):
+    return title[:limit] + "..." if len(title) > limit else title
+
+class IconStore:
+    """Значки сайтов и миниатюры вкладок: LRU в памяти и ограниченный кеш на диске.
+    
+    Ключ - источник страницы, поэтому значок известен ещё до того, как
+    страница пришлёт iconChanged. При превышении лимита с диска удаляются
+    давно не использованные файлы (по времени изменения, которое
+    обновляется при чтении).
+    """
+    ICON_SIZE = 32
+    THUMB_SIZE = QSize(320, 200)
+    
+    def __init__(self, cache_dir, max_icons=256, max_thumbnails=64, max_disk_mb=32):
+        self.cache_dir = Path(cache_dir)
+        self.max_icons = max_icons
+        self.max_thumbnails = max_thumbnails
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+        self.icons = OrderedDict()
+        self.thumbnails = OrderedDict()
+        self._disk_usage = None
+    
+    def _path(self, key, suffix):
+        return self.cache_dir / (hashlib.sha1(key.encode('utf-8')).hexdigest()[:20] + suffix)
+    
+    @staticmethod
+    def _remember(lru, key, value, limit):
+        lru[key] = value
+        lru.move_to_end(key)
+        while len(lru) > limit:
+            lru.popitem(last=False)
+    
+    def _load(self, lru, key, suffix, limit):
+        if key is None:
+            return None
+        value = lru.get(key)
+        if value is not None:
+            lru.move_to_end(key)
+            return value
+        path = self._path(key, suffix)
+        pixmap = QPixmap()
+        if not path.exists() or not pixmap.load(str(path)):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._remember(lru, key, pixmap, limit)
+        return pixmap
+    
+    def _save(self, key, suffix, pixmap, fmt, quality=-1):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key, suffix)
+        old_size = path.stat().st_size if path.exists() else 0
+        if pixmap.save(str(path), fmt, quality):
+            self._account(path.stat().st_size - old_size)
+    
+    def pixmap(self, key):
+        return self._load(self.icons, key, '.png', self.max_icons)
+    
+    def icon(self, origin):
+        pixmap = self.pixmap(origin)
+        return QIcon(pixmap) if pixmap is not None else None
+    
+    def store_icon(self, origin, icon):
+        if origin is None or icon.isNull():
+            return
+        pixmap = icon.pixmap(self.ICON_SIZE, self.ICON_SIZE)
+        self._remember(self.icons, origin, pixmap, self.max_icons)
+        self._save(origin, '.png', pixmap, 'PNG')
+    
+    def store_pixmap(self, key, pixmap):
+        self._remember(self.icons, key, pixmap, self.max_icons)
+        self._save(key, '.png', pixmap, 'PNG')
+    
+    def thumbnail(self, origin):
+        return self._load(self.thumbnails, origin, '.thumb.jpg', self.max_thumbnails)
+    
+    def store_thumbnail(self, origin, pixmap):
+        if origin is None or pixmap.isNull():
+            return
+        thumb = pixmap.scaled(self.THUMB_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self._remember(self.thumbnails, origin, thumb, self.max_thumbnails)
+        self._save(origin, '.thumb.jpg', thumb, 'JPG', 70)
+    
+    def disk_usage(self):
+        if self._disk_usage is None:
+            self._disk_usage = 0
+            if self.cache_dir.is_dir():
+                for entry in os.scandir(self.cache_dir):
+                    if entry.is_file():
+                        self._disk_usage += entry.stat().st_size
+        return self._disk_usage
+    
+    def _account(self, delta):
+        self._disk_usage = self.disk_usage() + delta
+        if self._disk_usage > self.max_disk_bytes:
+            self.evict(int(self.max_disk_bytes * 0.8))
+    
+    def evict(self, target_bytes):
+        """Удалять самые старые файлы, пока кеш не станет меньше target_bytes"""
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.cache_dir) if entry.is_file())
+        usage = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if usage <= target_bytes:
+                break
+            try:
+                os.remove(path)
+                usage -= size
+            except OSError:
+                pass
+        self._disk_usage = usage
+        # Вытесненные с диска записи остаются в памяти до своего вытеснения из LRU
+
+class OfflineArchive(QObject):
+    """Страницы, сохранённые для офлайна: MHTML, разобранный на части.
+    
+    Каждая часть MHTML (документ, стили, картинки) сжимается и хранится
+    один раз под своим SHA-256 в blobs/, а запись страницы в index.sqlite
+    содержит только заголовки частей и ссылки на них. Повторное сохранение
+    той же страницы добавляет лишь изменившиеся части - обычно один HTML.
+    Для открытия MHTML собирается обратно байт в байт.
+    """
+    saved = pyqtSignal(str, str)
+    failed = pyqtSignal(str, str)
+    
+    # Части меньше этого размера хранятся прямо в описи страницы
+    INLINE_LIMIT = 1024
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL,
+            title TEXT NOT NULL DEFAULT '',
+            saved_at REAL NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            manifest_hash TEXT NOT NULL,
+            manifest TEXT NOT NULL,
+            UNIQUE(url, manifest_hash)
+        );
+        CREATE INDEX IF NOT EXISTS pages_url ON pages(url, saved_at DESC);
+        CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+            title, url, content='pages', content_rowid='id', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+            INSERT INTO pages_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+        END;
+        CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+            INSERT INTO pages_fts(pages_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+        END;
+        CREATE TRIGGER IF NOT EXISTS pages_au AFTER UPDATE OF title ON pages BEGIN
+            INSERT INTO pages_fts(pages_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+            INSERT INTO pages_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+        END;
+    """
+    
+    def __init__(self, archive_dir, parent=None):
+        super().__init__(parent)
+        self.archive_dir = Path(archive_dir)
+        self.blobs_dir = self.archive_dir / "blobs"
+        self.incoming_dir = self.archive_dir / "incoming"
+        self.open_dir = self.archive_dir / "open"
+        for path in (self.blobs_dir, self.incoming_dir, self.open_dir):
+            path.mkdir(parents=True, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.archive_dir / "index.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self.urls = {url for url, in self.conn.execute("SELECT DISTINCT url FROM pages")}
+        self.pending = {}
+        self.online = True
+        # Недописанные сохранения прошлого запуска
+        self.executor.submit(lambda: [path.unlink() for path in self.incoming_dir.glob('*.mhtml')])
+    
+    @staticmethod
+    def url_key(url):
+        return QUrl(url).adjusted(QUrl.RemoveFragment).toString()
+    
+    def has(self, url):
+        return self.url_key(url) in self.urls
+    
+    def set_online(self, online):
+        self.online = online
+    
+    @staticmethod
+    def split_mhtml(data):
+        """Разобрать MHTML на заголовок и части (заголовки, тело) без потерь"""
+        header_end = data.find(b"\r\n\r\n")
+        match = re.search(rb'boundary="?([^";\r\n]+)"?', data[:header_end], re.IGNORECASE)
+        if header_end < 0 or match is None:
+            raise ValueError("не MHTML")
+        header_end += 4
+        delimiter = b"--" + match.group(1)
+        chunks = data[header_end:].split(delimiter)
+        parts = []
+        for chunk in chunks[1:]:
+            head, sep, body = chunk.partition(b"\r\n\r\n")
+            parts.append((head + sep, body) if sep else (chunk, b""))
+        return data[:header_end] + chunks[0], delimiter, parts
+    
+    @staticmethod
+    def join_mhtml(header, delimiter, parts):
+        return header + b"".join(delimiter + head + body for head, body in parts)
+    
+    def _blob_path(self, digest):
+        return self.blobs_dir / digest[:2] / f"{digest}.z"
+    
+    def _store_blob(self, body):
+        """Сохранить тело части, если такого ещё нет; вернуть хеш и новые байты"""
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        if path.exists():
+            return digest, 0
+        data = zlib.compress(body, 6)
+        atomic_write(path, data)
+        return digest, len(data)
+    
+    def save_page(self, page):
+        """Сохранить страницу; запись в архив продолжится по завершении MHTML"""
+        url = page.url()
+        if url.scheme() not in ('http', 'https'):
+            return False
+        path = os.path.abspath(self.incoming_dir / f"{uuid.uuid4().hex}.mhtml")
+        self.pending[path] = (self.url_key(url.toString()), page.title())
+        page.save(path, QWebEngineDownloadItem.MimeHtmlSaveFormat)
+        return True
+    
+    def attach_profile(self, profile):
+        profile.downloadRequested.connect(self.download_requested)
+    
+    def download_requested(self, item):
+        if not item.isSavePageDownload():
+            return
+        entry = self.pending.pop(os.path.abspath(item.path()), None)
+        if entry is not None:
+            item.finished.connect(lambda: self._save_finished(item, entry))
+    
+    def _save_finished(self, item, entry):
+        url, title = entry
+        if item.state() == QWebEngineDownloadItem.DownloadCompleted:
+            self.executor.submit(self._ingest, Path(item.path()), url, title)
+        else:
+            self.failed.emit(url, item.interruptReasonString())
+    
+    def _ingest(self, path, url, title):
+        try:
+            header, delimiter, parts = self.split_mhtml(path.read_bytes())
+            added = 0
+            manifest_parts = []
+            for head, body in parts:
+                if len(body) < self.INLINE_LIMIT:
+                    manifest_parts.append([head.decode('latin-1'), None, body.decode('latin-1')])
+                else:
+                    digest, size = self._store_blob(body)
+                    added += size
+                    manifest_parts.append([head.decode('latin-1'), digest])
+            manifest = json.dumps({'header': header.decode('latin-1'),
+                                   'delimiter': delimiter.decode('latin-1'),
+                                   'parts': manifest_parts}, ensure_ascii=False)
+            manifest_hash = hashlib.sha256(manifest.encode('utf-8')).hexdigest()
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO pages(url, title, saved_at, size, manifest_hash, manifest) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(url, manifest_hash) DO UPDATE SET "
+                    "saved_at = excluded.saved_at, title = excluded.title",
+                    (url, title, time.time(), added + len(manifest), manifest_hash, manifest))
+            self.urls.add(url)
+            self.saved.emit(url, title)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.failed.emit(url, str(e))
+        finally:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+    
+    def open_url(self, url):
+        """Локальный адрес собранного MHTML последней копии страницы"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT manifest_hash, manifest FROM pages WHERE url = ? ORDER BY saved_at DESC LIMIT 1",
+                (self.url_key(url),)).fetchone()
+        if row is None:
+            return None
+        return self.open_manifest(*row)
+    
+    def open_page(self, page_id):
+        with self._lock:
+            row = self.conn.execute("SELECT manifest_hash, manifest FROM pages WHERE id = ?",
+                                    (page_id,)).fetchone()
+        return self.open_manifest(*row) if row else None
+    
+    def open_manifest(self, manifest_hash, manifest):
+        path = self.open_dir / f"{manifest_hash}.mhtml"
+        if not path.exists():
+            manifest = json.loads(manifest)
+            parts = []
+            for entry in manifest['parts']:
+                head = entry[0].encode('latin-1')
+                if entry[1] is None:
+                    parts.append((head, entry[2].encode('latin-1')))
+                else:
+                    parts.append((head, zlib.decompress(self._blob_path(entry[1]).read_bytes())))
+            atomic_write(path, self.join_mhtml(manifest['header'].encode('latin-1'),
+                                               manifest['delimiter'].encode('latin-1'), parts))
+        return QUrl.fromLocalFile(str(path))
+    
+    def search(self, text="", limit=500):
+        """Сохранённые страницы (id, url, title, saved_at), свежие первыми"""
+        match = HistoryQueryWorker.fts_query(text)
+        with self._lock:
+            if match:
+                return self.conn.execute(
+                    "SELECT p.id, p.url, p.title, p.saved_at FROM pages_fts "
+                    "JOIN pages p ON p.id = pages_fts.rowid WHERE pages_fts MATCH ? "
+                    "ORDER BY p.saved_at DESC LIMIT ?", (match, limit)).fetchall()
+            return self.conn.execute(
+                "SELECT id, url, title, saved_at FROM pages ORDER BY saved_at DESC LIMIT ?",
+                (limit,)).fetchall()
+    
+    def delete(self, page_ids):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM pages WHERE id = ?", [(i,) for i in page_ids])
+            self.urls = {url for url, in self.conn.execute("SELECT DISTINCT url FROM pages")}
+        return self.executor.submit(self.collect_garbage)
+    
+    def evict(self, excess):
+        """Удалить самые старые страницы, освободив не меньше excess байт.
+        
+        Размер страницы - это части, которые она добавила в архив, поэтому
+        оценка точна, пока части не разделяются с более новыми копиями.
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT id, size FROM pages ORDER BY saved_at").fetchall()
+        page_ids, freed = [], 0
+        for page_id, size in rows:
+            if freed >= excess:
+                break
+            page_ids.append(page_id)
+            freed += size
+        if page_ids:
+            self.delete(page_ids).result()
+        return len(page_ids)
+    
+    def compact(self):
+        with self._lock:
+            return compact_sqlite(self.conn)
+    
+    def collect_garbage(self):
+        """Удалить части и собранные MHTML, на которые больше не ссылается ни одна страница"""
+        referenced, manifests = set(), set()
+        with self._lock:
+            rows = self.conn.execute("SELECT manifest_hash, manifest FROM pages").fetchall()
+        for manifest_hash, manifest in rows:
+            manifests.add(manifest_hash)
+            referenced.update(entry[1] for entry in json.loads(manifest)['parts'] if entry[1])
+        for path in self.blobs_dir.glob('*/*.z'):
+            if path.stem not in referenced:
+                path.unlink()
+        for path in self.open_dir.glob('*.mhtml'):
+            if path.stem not in manifests:
+                path.unlink()
+    
+    def disk_usage(self):
+        return sum(path.stat().st_size for path in self.archive_dir.rglob('*') if path.is_file())
+    
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.conn.close()
+
+def percentile(values, pct):
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+class PageLoadMonitor(QObject):
+    """Замер загрузки страницы вкладки.
+    
+    Время от loadStarted до отметок прогресса и loadFinished плюс данные
+    Navigation Timing и Resource Timing, которые после загрузки
+    забираются скриптом в изолированном мире страницы.
+    """
+    measured = pyqtSignal(dict)
+    
+    PROGRESS_MARKS = (10, 50, 90, 100)
+    MAX_RESOURCES = 50
+    TIMING_SCRIPT = """
+        (function() {
+            var nav = performance.getEntriesByType('navigation')[0];
+            var resources = performance.getEntriesByType('resource').map(function(r) {
+                return {name: r.name, type: r.initiatorType, start: Math.round(r.startTime),
+                        duration: Math.round(r.duration), size: r.transferSize || 0};
+            });
+            resources.sort(function(a, b) { return b.duration - a.duration; });
+            return JSON.stringify({
+                navigation: nav ? {
+                    dns: Math.round(nav.domainLookupEnd - nav.domainLookupStart),
+                    connect: Math.round(nav.connectEnd - nav.connectStart),
+                    ttfb: Math.round(nav.responseStart - nav.requestStart),
+                    response: Math.round(nav.responseEnd - nav.responseStart),
+                    dom_interactive: Math.round(nav.domInteractive),
+                    dom_content_loaded: Math.round(nav.domContentLoadedEventEnd),
+                    load_event: Math.round(nav.loadEventEnd),
+                    transfer_size: nav.transferSize || 0
+                } : null,
+                resource_count: resources.length,
+                resources: resources.slice(0, %d)
+            });
+        })()
+    """
+    
+    def __init__(self, view, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.started = None
+        self.progress = {}
+        view.loadStarted.connect(self.load_started)
+        view.loadProgress.connect(self.load_progress)
+        view.loadFinished.connect(self.load_finished)
+    
+    def load_started(self):
+        self.started = time.perf_counter()
+        self.progress = {}
+    
+    def load_progress(self, value):
+        if self.started is None:
+            return
+        for mark in self.PROGRESS_MARKS:
+            if value >= mark and str(mark) not in self.progress:
+                self.progress[str(mark)] = round((time.perf_counter() - self.started) * 1000, 1)
+    
+    def load_finished(self, ok):
+        if self.started is None:
+            return
+        url = self.view.url().toString()
+        record = {
+            'ts': datetime.now().isoformat(timespec='seconds'),
+            'url': url,
+            'origin': url_origin(url),
+            'ok': ok,
+            'load_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'progress': self.progress,
+        }
+        self.started = None
+        if not ok or not url.startswith(('http://', 'https://')):
+            self.measured.emit(record)
+            return
+        self.view.page().runJavaScript(
+            self.TIMING_SCRIPT % self.MAX_RESOURCES, QWebEngineScript.ApplicationWorld,
+            lambda result: self.timing_received(record, result))
+    
+    def timing_received(self, record, result):
+        try:
+            record.update(json.loads(result))
+        except (TypeError, ValueError):
+            pass
+        self.measured.emit(record)
+
+class PerfLog:
+    """Журнал загрузок страниц в JSONL с ротацией и сводкой p50/p95 по источникам"""
+    MAX_BYTES = 2 * 1024 * 1024
+    BACKUPS = 3
+    WINDOW = 500  # последних замеров на источник
+    
+    def __init__(self, log_dir):
+        self.log_dir = Path(log_dir)
+        self.log_file = self.log_dir / "pageloads.jsonl"
+        self.pages = defaultdict(lambda: deque(maxlen=self.WINDOW))
+        self.resources = defaultdict(lambda: deque(maxlen=self.WINDOW))
+        self.recent = deque(maxlen=100)
+        self.loaded = False
+    
+    def load(self):
+        """Набрать сводку из уже записанных журналов (лениво, при открытии панели)"""
+        if self.loaded:
+            return
+        self.loaded = True
+        for path in reversed(self.log_files()):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            self._aggregate(json.loads(line))
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+    
+    def log_files(self):
+        files = [self.log_file]
+        files += [self.log_dir / f"pageloads.{i}.jsonl" for i in range(1, self.BACKUPS + 1)]
+        return [path for path in files if path.exists()]
+    
+    def add(self, record):
+        # До load() запись только попадает в файл: load() прочтёт её вместе с остальными
+        if self.loaded:
+            self._aggregate(record)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        if self.log_file.exists() and self.log_file.stat().st_size + len(line) > self.MAX_BYTES:
+            self.rotate()
+        with open(self.log_file, 'a', encoding='utf-8') as f:
+            f.write(line)
+    
+    def rotate(self):
+        for i in range(self.BACKUPS, 0, -1):
+            source = self.log_file if i == 1 else self.log_dir / f"pageloads.{i - 1}.jsonl"
+            if source.exists():
+                os.replace(source, self.log_dir / f"pageloads.{i}.jsonl")
+    
+    def _aggregate(self, record):
+        self.recent.append(record)
+        if record.get('ok') and record.get('origin'):
+            self.pages[record['origin']].append(record['load_ms'])
+        for resource in record.get('resources', []):
+            origin = url_origin(resource.get('name', ''))
+            if origin:
+                self.resources[origin].append(resource.get('duration', 0))
+    
+    @staticmethod
+    def summarize(samples):
+        """[(источник, число, p50, p95)] по убыванию p95"""
+        rows = [(origin, len(values), percentile(values, 50), percentile(values, 95))
+                for origin, values in samples.items() if values]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+    
+    def export(self, path):
+        """Сводка для сбора с разных установок"""
+        summary = {
+            'exported_at': datetime.now().isoformat(timespec='seconds'),
+            'pages': [dict(zip(('origin', 'count', 'p50_ms', 'p95_ms'), row))
+                      for row in self.summarize(self.pages)],
+            'resources': [dict(zip(('origin', 'count', 'p50_ms', 'p95_ms'), row))
+                          for row in self.summarize(self.resources)],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+class PerfPanel(QDockWidget):
+    """Панель разработчика: сводка загрузок по сайтам и ресурсам"""
+    def __init__(self, perf_log, parent=None):
+        super().__init__("Производительность страниц", parent)
+        self.perf_log = perf_log
+        
+        self.pages_table = self._table(["Сайт", "Загрузок", "p50, мс", "p95, мс"])
+        self.resources_table = self._table(["Источник ресурсов", "Запросов", "p50, мс", "p95, мс"])
+        self.recent_table = self._table(["Время", "Адрес", "Загрузка, мс", "TTFB, мс", "Ресурсов"])
+        
+        tabs = QTabWidget()
+        tabs.addTab(self.pages_table, "Сайты")
+        tabs.addTab(self.resources_table, "Ресурсы")
+        tabs.addTab(self.recent_table, "Последние")
+        
+        export_btn = QPushButton("Экспорт сводки...")
+        export_btn.clicked.connect(self.export)
+        
+        container = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(tabs)
+        layout.addWidget(export_btn)
+        container.setLayout(layout)
+        self.setWidget(container)
+    
+    @staticmethod
+    def _table(headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        return table
+    
+    @staticmethod
+    def _fill(table, rows):
+        table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                table.setItem(r, c, QTableWidgetItem(str(value)))
+    
+    def refresh(self):
+        if not self.isVisible():
+            return
+        self.perf_log.load()
+        self._fill(self.pages_table, self.perf_log.summarize(self.perf_log.pages))
+        self._fill(self.resources_table, self.perf_log.summarize(self.perf_log.resources)[:200])
+        recent = []
+        for record in reversed(self.perf_log.recent):
+            navigation = record.get('navigation') or {}
+            recent.append((record['ts'], record['url'], record['load_ms'],
+                           navigation.get('ttfb', ''), record.get('resource_count', '')))
+        self._fill(self.recent_table, recent)
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+    
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт сводки", "perf-summary.json", "JSON (*.json)")
+        if path:
+            self.perf_log.export(path)
+
+class TokenBucket:
+    """Общее ограничение скорости загрузок в байтах в секунду; 0 - без ограничения"""
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def consume(self, amount):
+        with self.lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class DownloadTask:
+    """Одна загрузка: сегменты [начало, конец, позиция] и их состояние.
+    
+    Данные пишутся в файл .part, состояние сегментов - в .part.json рядом,
+    поэтому прерванную загрузку можно продолжить и после перезапуска.
+    """
+    def __init__(self, url, path, size=None, ranges=False, segments=None, created=None):
+        self.url = url
+        self.path = Path(path)
+        self.size = size
+        self.ranges = ranges
+        self.segments = segments or []
+        self.created = created or time.time()
+        self.state = 'queued'  # queued, running, paused, failed, done, cancelled
+        self.error = ""
+        self.headers = {}
+        self.cookie = ""
+        self.jar = None
+        self.active = 0
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.speed = 0.0
+        self._sample = (time.monotonic(), 0)
+    
+    @property
+    def part_file(self):
+        return self.path.with_name(self.path.name + '.part')
+    
+    @property
+    def state_file(self):
+        return self.path.with_name(self.path.name + '.part.json')
+    
+    def received(self):
+        return sum(pos - start for start, end, pos in self.segments)
+    
+    def complete(self):
+        return bool(self.segments) and all(end is not None and pos >= end
+                                           for start, end, pos in self.segments)
+    
+    def update_speed(self):
+        now, received = time.monotonic(), self.received()
+        then, before = self._sample
+        if now - then >= 0.5:
+            self.speed = max(0.0, (received - before) / (now - then))
+            self._sample = (now, received)
+        return self.speed
+    
+    def save_state(self):
+        data = {'url': self.url, 'size': self.size, 'ranges': self.ranges,
+                'segments': [list(segment) for segment in self.segments],
+                'created': self.created}
+        atomic_write(self.state_file, json.dumps(data).encode('utf-8'))
+    
+    @classmethod
+    def from_state(cls, state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        path = Path(state_file).with_name(Path(state_file).name[:-len('.part.json')])
+        task = cls(data['url'], path, data.get('size'), data.get('ranges', False),
+                   [list(segment) for segment in data.get('segments', [])], data.get('created'))
+        task.state = 'paused'
+        return task
+
+class DownloadManager(QObject):
+    """Загрузки в browser_data/downloads.
+    
+    HTTP(S) скачивается своими силами в пуле потоков. Если сервер понимает
+    Range, большой файл делится на несколько сегментов, которые качаются
+    параллельно и докачиваются после обрыва с места остановки. Все
+    соединения делят одно ограничение скорости. Куки профиля передаются
+    только исходному хосту. Прочие схемы (blob:, data:) остаются WebEngine.
+    """
+    added = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    
+    MAX_CONNECTIONS = 6
+    SEGMENTS = 4
+    SEGMENT_MIN_SIZE = 4 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+    RETRIES = 3
+    TIMEOUT = 30
+    
+    def __init__(self, download_dir, parent=None):
+        super().__init__(parent)
+        self.download_dir = Path(download_dir)
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_CONNECTIONS, thread_name_prefix="download")
+        self.bucket = TokenBucket()
+        self.tasks = []
+        self.cookie_jars = {}
+        self.default_jar = {}
+        self.user_agent = ""
+        self.load_unfinished()
+    
+    def load_unfinished(self):
+        """Прерванные загрузки прошлого запуска появляются на паузе"""
+        if not self.download_dir.is_dir():
+            return
+        for state_file in sorted(self.download_dir.glob('*.part.json')):
+            try:
+                self.tasks.append(DownloadTask.from_state(state_file))
+            except (OSError, ValueError, KeyError) as e:
+                log.warning("Не удалось восстановить загрузку %s: %s", state_file, e)
+    
+    def set_rate_limit(self, kb_per_sec):
+        with self.bucket.lock:
+            self.bucket.rate = max(0, int(kb_per_sec)) * 1024
+    
+    def rate_limit(self):
+        return self.bucket.rate // 1024
+    
+    def attach_profile(self, profile):
+        """Перехватывать загрузки профиля и следить за его куками"""
+        jar = {}
+        self.cookie_jars[id(profile)] = jar
+        if not profile.isOffTheRecord():
+            self.default_jar = jar
+            self.user_agent = profile.httpUserAgent()
+        profile.downloadRequested.connect(self.download_requested)
+        store = profile.cookieStore()
+        store.cookieAdded.connect(lambda cookie: jar.__setitem__(self._cookie_key(cookie), cookie))
+        store.cookieRemoved.connect(lambda cookie: jar.pop(self._cookie_key(cookie), None))
+        store.loadAllCookies()
+        key = id(profile)
+        profile.destroyed.connect(lambda: self.cookie_jars.pop(key, None))
+    
+    @staticmethod
+    def _cookie_key(cookie):
+        return (cookie.domain(), cookie.path(), bytes(cookie.name()))
+    
+    @staticmethod
+    def cookie_header(jar, url):
+        """Заголовок Cookie для адреса из зеркала кук профиля"""
+        url = QUrl(url)
+        host, path = url.host().lower(), url.path() or '/'
+        secure = url.scheme() == 'https'
+        pairs = []
+        for cookie in list(jar.values()):
+            domain = cookie.domain().lower().lstrip('.')
+            if host != domain and not host.endswith('.' + domain):
+                continue
+            if not path.startswith(cookie.path() or '/') or (cookie.isSecure() and not secure):
+                continue
+            pairs.append(f"{bytes(cookie.name()).decode('latin-1')}={bytes(cookie.value()).decode('latin-1')}")
+        return '; '.join(pairs)
+    
+    def unique_path(self, name):
+        name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', name).strip(' .') or "download"
+        taken = {task.path for task in self.tasks if task.state != 'cancelled'}
+        stem, suffix = os.path.splitext(name)
+        path = self.download_dir / name
+        n = 1
+        while path in taken or path.exists() or path.with_name(path.name + '.part').exists():
+            path = self.download_dir / f"{stem} ({n}){suffix}"
+            n += 1
+        return path
+    
+    def download_requested(self, item):
+        if item.isSavePageDownload():
+            # Сохранение страницы (QWebEnginePage.save) уже принято самим WebEngine
+            return
+        url = item.url()
+        name = Path(item.path()).name
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        if url.scheme() not in ('http', 'https'):
+            item.setPath(str(self.unique_path(name)))
+            item.accept()
+            return
+        
+        # Загрузку ведём сами: WebEngine качает файл в один поток и без докачки
+        item.cancel()
+        jar = self.cookie_jars.get(id(item.page().profile()) if item.page() else None, self.default_jar)
+        task = DownloadTask(url.toString(), self.unique_path(name),
+                            size=item.totalBytes() if item.totalBytes() > 0 else None)
+        task.jar = jar
+        self.tasks.append(task)
+        self.start(task)
+        self.added.emit(task)
+    
+    def start(self, task):
+        task.stop.clear()
+        task.state = 'running'
+        task.error = ""
+        task.headers = {'User-Agent': self.user_agent} if self.user_agent else {}
+        task.cookie = self.cookie_header(task.jar if task.jar is not None else self.default_jar, task.url)
+        if task.segments and task.part_file.exists():
+            self._schedule(task)
+        else:
+            task.active = 1
+            self.executor.submit(self._probe, task)
+    
+    def _open(self, task, headers):
+        request = urllib.request.Request(task.url, headers=dict(task.headers, **headers))
+        if task.cookie:
+            # Такой заголовок не уходит на другой хост при переадресации
+            request.add_unredirected_header('Cookie', task.cookie)
+        return urllib.request.urlopen(request, timeout=self.TIMEOUT)
+    
+    def _probe(self, task):
+        """Узнать размер и поддержку Range одним запросом первого байта"""
+        response = None
+        try:
+            response = self._open(task, {'Range': 'bytes=0-0'})
+            final_url = response.geturl()
+            if QUrl(final_url).host() != QUrl(task.url).host():
+                task.cookie = ""
+            task.url = final_url
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if response.status == 206 and total.isdigit():
+                task.size, task.ranges = int(total), True
+                response.close()
+                response = None
+            elif response.status == 206:
+                # Частичный ответ без полного размера (bytes 0-0/*): это лишь
+                # первый байт, так что файл запрашивается заново без Range
+                task.size, task.ranges = None, False
+                response.close()
+                response = None
+            else:
+                length = response.headers.get('Content-Length')
+                task.size = int(length) if length and length.isdigit() else None
+                task.ranges = False
+            task.segments = self.plan_segments(task.size, task.ranges)
+            with open(task.part_file, 'wb') as f:
+                if task.size:
+                    f.truncate(task.size)
+            task.save_state()
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            if response is not None:
+                response.close()
+            self._segment_done(task, e)
+            return
+        
+        if response is None:
+            self._schedule(task, probing=True)
+        else:
+            # Сервер отдал файл целиком: продолжаем читать этот же ответ
+            self._run_segment(task, task.segments[0], response)
+    
+    def plan_segments(self, size, ranges):
+        if not ranges or not size:
+            return [[0, size, 0]]
+        count = max(1, min(self.SEGMENTS, size // self.SEGMENT_MIN_SIZE))
+        step = -(-size // count)
+        return [[start, min(size, start + step), start] for start in range(0, size, step)]
+    
+    def _schedule(self, task, probing=False):
+        pending = [segment for segment in task.segments if segment[1] is None or segment[2] < segment[1]]
+        with task.lock:
+            task.active += len(pending) - (1 if probing else 0)
+        for segment in pending:
+            self.executor.submit(self._run_segment, task, segment)
+        if not pending:
+            if not probing:
+                task.active += 1
+            self._segment_done(task, None)
+    
+    def _run_segment(self, task, segment, response=None):
+        error = None
+        for attempt in range(self.RETRIES + 1):
+            if task.stop.is_set():
+                break
+            try:
+                self._fetch(task, segment, response)
+                error = None
+                break
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                error = e
+                response = None
+                if attempt < self.RETRIES:
+                    task.stop.wait(2 ** attempt)
+        self._segment_done(task, error)
+    
+    def _fetch(self, task, segment, response=None):
+        start, end, pos = segment
+        if end is not None and pos >= end:
+            return
+        if response is None:
+            if task.ranges:
+                response = self._open(task, {'Range': f"bytes={pos}-{end - 1}"})
+                if response.status != 206:
+                    response.close()
+                    raise ValueError("сервер перестал поддерживать докачку")
+            else:
+                # Без Range докачка невозможна - только с начала
+                pos = segment[2] = 0
+                response = self._open(task, {})
+        
+        with response, open(task.part_file, 'r+b') as f:
+            f.seek(pos)
+            while not task.stop.is_set():
+                want = self.CHUNK_SIZE if end is None else min(self.CHUNK_SIZE, end - pos)
+                if want <= 0:
+                    break
+                self.bucket.consume(want)
+                data = response.read(want)
+                if not data:
+                    break
+                f.write(data)
+                pos += len(data)
+                segment[2] = pos
+        
+        if task.stop.is_set():
+            return
+        if end is None:
+            segment[1] = pos
+            task.size = pos
+        elif pos < end:
+            raise ValueError("соединение оборвалось")
+    
+    def _segment_done(self, task, error):
+        with task.lock:
+            task.active -= 1
+            if error is not None and not task.error:
+                task.error = str(error)
+                task.stop.set()
+            if task.active > 0:
+                return
+        
+        try:
+            if task.state == 'cancelled':
+                for path in (task.part_file, task.state_file):
+                    if path.exists():
+                        path.unlink()
+                return
+            if task.complete() and not task.error:
+                os.replace(task.part_file, task.path)
+                if task.state_file.exists():
+                    task.state_file.unlink()
+                task.state = 'done'
+            else:
+                task.state = 'failed' if task.error else 'paused'
+                if task.segments:
+                    task.save_state()
+        except OSError as e:
+            task.state, task.error = 'failed', str(e)
+        if task.state != 'cancelled':
+            self.finished.emit(task)
+    
+    def pause(self, task):
+        if task.state == 'running':
+            task.stop.set()
+    
+    def resume(self, task):
+        if task.state in ('paused', 'failed'):
+            self.start(task)
+    
+    def cancel(self, task):
+        running = task.state == 'running'
+        task.state = 'cancelled'
+        task.stop.set()
+        if not running:
+            for path in (task.part_file, task.state_file):
+                if path.exists():
+                    path.unlink()
+        self.tasks.remove(task)
+    
+    def clear_finished(self):
+        self.tasks = [task for task in self.tasks if task.state != 'done']
+    
+    def shutdown(self):
+        """Остановить загрузки; состояние сегментов сохранится для докачки"""
+        for task in self.tasks:
+            if task.state == 'running':
+                task.stop.set()
+        self.executor.shutdown(wait=False)
+
+def format_size(size):
+    if size is None:
+        return "?"
+    for unit in ("Б", "КБ", "МБ", "ГБ"):
+        if size < 1024 or unit == "ГБ":
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+
+class DownloadsPanel(QDockWidget):
+    """Список загрузок с прогрессом, скоростью и ограничением скорости"""
+    STATES = {'queued': "В очереди", 'running': "Загружается", 'paused': "Пауза",
+              'failed': "Ошибка", 'done': "Готово", 'cancelled': "Отменена"}
+    
+    def __init__(self, manager, parent=None):
+        super().__init__("Загрузки", parent)
+        self.manager = manager
+        
+        self.table = PerfPanel._table(["Файл", "Размер", "Готово", "Скорость", "Состояние"])
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        
+        buttons = QHBoxLayout()
+        for text, slot in (("Пауза", self.pause), ("Продолжить", self.resume),
+                           ("Отменить", self.cancel), ("Убрать завершённые", self.clear_finished),
+                           ("Открыть папку", self.open_folder)):
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        buttons.addStretch()
+        
+        self.limit_spin = QSpinBox()
+        self.limit_spin.setRange(0, 1024 * 1024)
+        self.limit_spin.setSingleStep(128)
+        self.limit_spin.setSuffix(" КБ/с")
+        self.limit_spin.setSpecialValueText("без ограничения")
+        self.limit_spin.setValue(manager.rate_limit())
+        buttons.addWidget(QLabel("Скорость:"))
+        buttons.addWidget(self.limit_spin)
+        
+        container = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        container.setLayout(layout)
+        self.setWidget(container)
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        manager.added.connect(lambda _: self.refresh())
+        manager.finished.connect(lambda _: self.refresh())
+    
+    def refresh(self):
+        if not self.isVisible():
+            return
+        rows = []
+        for task in self.manager.tasks:
+            received = task.received()
+            done = f"{received * 100 // task.size}%" if task.size else format_size(received)
+            speed = f"{format_size(task.update_speed())}/с" if task.state == 'running' else ""
+            state = self.STATES.get(task.state, task.state)
+            if task.error and task.state == 'failed':
+                state = f"{state}: {task.error}"
+            rows.append((task.path.name, format_size(task.size), done, speed, state))
+        PerfPanel._fill(self.table, rows)
+    
+    def selected_task(self):
+        row = self.table.currentRow()
+        if 0 <= row < len(self.manager.tasks):
+            return self.manager.tasks[row]
+        return None
+    
+    def pause(self):
+        task = self.selected_task()
+        if task:
+            self.manager.pause(task)
+    
+    def resume(self):
+        task = self.selected_task()
+        if task:
+            self.manager.resume(task)
+            self.refresh()
+    
+    def cancel(self):
+        task = self.selected_task()
+        if task:
+            self.manager.cancel(task)
+            self.refresh()
+    
+    def clear_finished(self):
+        self.manager.clear_finished()
+        self.refresh()
+    
+    def open_folder(self):
+        self.manager.download_dir.mkdir(parents=True, exist_ok=True)
+        QDesktopServices.openUrl(QUrl.fromLocalFile(str(self.manager.download_dir)))
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.timer.start(500)
+        self.refresh()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+def child_processes(pid):
+    """Дочерние процессы (pid, тип) по /proc; вне Linux - пустой список"""
+    children = []
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # Имя процесса в скобках может содержать пробелы
+                fields = f.read().rpartition(')')[2].split()
+            if int(fields[1]) != pid:
+                continue
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                args = f.read().split(b'\0')
+        except (OSError, ValueError, IndexError):
+            continue
+        kind = next((arg[len(b'--type='):].decode('utf-8', 'replace') for arg in args
+                     if arg.startswith(b'--type=')), "")
+        children.append((int(entry), kind))
+    return children
+
+class ProcessPanel(QDockWidget):
+    """Процессы Chromium: PID и память каждого рендерера и его вкладки"""
+    def __init__(self, tabs, parent=None):
+        super().__init__("Процессы", parent)
+        self.tabs = tabs
+        self.table = PerfPanel._table(["Вкладки", "PID", "Тип", "Память, МБ"])
+        self.total_label = QLabel()
+        
+        container = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.table)
+        layout.addWidget(self.total_label)
+        container.setLayout(layout)
+        self.setWidget(container)
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+    
+    def refresh(self):
+        if not self.isVisible():
+            return
+        # Несколько вкладок одного сайта могут делить рендерер
+        by_pid = defaultdict(list)
+        for i in range(self.tabs.count()):
+            tab = self.tabs.widget(i)
+            if tab.browser is None:
+                continue
+            pid = tab.browser.page().renderProcessPid()
+            by_pid[pid].append(elide_title(tab.current_title() or tab.current_url(), 40))
+        
+        rows = []
+        main_pid = os.getpid()
+        total = process_rss_kb(main_pid)
+        rows.append(("Браузер", main_pid, "browser", f"{total / 1024:.0f}"))
+        for pid, kind in sorted(child_processes(main_pid)):
+            rss = process_rss_kb(pid)
+            total += rss
+            titles = by_pid.pop(pid, [])
+            rows.append((", ".join(titles) or "-", pid, kind, f"{rss / 1024:.0f}"))
+        # Рендереры, не найденные в /proc (другая ОС) или ещё не запущенные
+        for pid, titles in sorted(by_pid.items()):
+            rss = process_rss_kb(pid)
+            total += rss
+            rows.append((", ".join(titles), pid or "-", "renderer", f"{rss / 1024:.0f}" if rss else "?"))
+        PerfPanel._fill(self.table, rows)
+        self.total_label.setText(f"Всего: {total / 1024:.0f} МБ, процессов: {len(rows)}")
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.timer.start(2000)
+        self.refresh()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+class StorageManager(QObject):
+    """Место, которое занимает browser_data, и квоты на него.
+    
+    Размеры по категориям считаются в фоновом потоке. Если категория или
+    вся папка выходит за квоту, кешу HTTP уменьшается предельный размер
+    (файлы открытого кеша убирает сам WebEngine), затем удаляются самые
+    старые страницы офлайн-архива. Когда окно
+    браузера долго неактивно, журналы сворачиваются, а базы SQLite
+    сжимаются: на медленной флешке длинный WAL и пустые страницы
+    замедляют каждое чтение.
+    """
+    measured = pyqtSignal(dict)
+    # Кеш HTTP больше квоты: до какого размера в байтах его сократить
+    cache_over_quota = pyqtSignal(int)
+    
+    DEFAULT_SETTINGS = {
+        'total_mb': 2048,    # вся папка browser_data, 0 - без ограничения
+        'cache_mb': 512,
+        'archive_mb': 512,
+        'idle_minutes': 5,   # столько окно должно быть неактивно до сжатия баз
+    }
+    # Категория: название и шаблоны имён верхнего уровня browser_data
+    CATEGORIES = {
+        'cache': ("Кеш HTTP", ("cache",)),
+        'archive': ("Офлайн-архив", ("archive",)),
+        'history': ("История", ("history.sqlite*",)),
+        'icons': ("Значки и миниатюры", ("icons",)),
+        'downloads': ("Незаконченные загрузки", ("downloads",)),
+        'session': ("Сессия и предсказания", ("session", "predictor.json")),
+        'page_index': ("Индекс текста страниц", ("page_index.json.z",)),
+        'perf': ("Замеры загрузок", ("perf",)),
+        'config': ("Настройки и блокировщик", ("config",)),
+        'profiles': ("Остатки профилей инкогнито", ("incognito_*",)),
+    }
+    CHECK_INTERVAL = 15 * 60 * 1000
+    IDLE_CHECK_INTERVAL = 60 * 1000
+    COMPACT_INTERVAL = 6 * 3600
+    # Освобождать с запасом, чтобы не чистить на каждой проверке
+    EVICT_TO = 0.9
+    # Недописанные файлы старше этого удаляются. Собранные MHTML в archive/open
+    # не трогаются: на них могут ссылаться открытые вкладки, их убирает сам архив
+    STALE_AGE = 24 * 3600
+    STALE_PATTERNS = ("archive/incoming/*", "config/*.tmp")
+    
+    def __init__(self, data_dir, settings=None, parent=None):
+        super().__init__(parent)
+        self.data_dir = Path(data_dir)
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.usage = {}
+        self.archive = None
+        # Сворачивание журналов идёт в потоке интерфейса, сжатие баз - в фоне
+        self.compactors = []
+        self.background_compactors = []
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self.future = None
+        self.inactive_since = None
+        self.last_compact = None
+        self.measured.connect(self._set_usage)
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.timer.start(self.CHECK_INTERVAL)
+        self.idle_timer = QTimer(self)
+        self.idle_timer.timeout.connect(self.check_idle)
+        self.idle_timer.start(self.IDLE_CHECK_INTERVAL)
+        QApplication.instance().applicationStateChanged.connect(self.application_state_changed)
+    
+    def apply_settings(self, settings):
+        self.settings.update(settings)
+    
+    def add_compactor(self, compactor, background=False):
+        (self.background_compactors if background else self.compactors).append(compactor)
+    
+    def _set_usage(self, usage):
+        self.usage = usage
+    
+    @classmethod
+    def category(cls, name):
+        for key, (_, patterns) in cls.CATEGORIES.items():
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                return key
+        return 'other'
+    
+    @staticmethod
+    def tree_size(path):
+        """Размер файла или каталога; исчезнувшие по ходу подсчёта файлы пропускаются"""
+        try:
+            if not os.path.isdir(path) or os.path.islink(path):
+                return os.lstat(path).st_size
+        except OSError:
+            return 0
+        total = 0
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            else:
+                                total += entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return total
+    
+    def measure(self):
+        """Байты по категориям; всё, что не попало ни в одну, - в 'other'"""
+        usage = dict.fromkeys(self.CATEGORIES, 0)
+        usage['other'] = 0
+        try:
+            names = os.listdir(self.data_dir)
+        except OSError:
+            return usage
+        for name in names:
+            usage[self.category(name)] += self.tree_size(os.path.join(self.data_dir, name))
+        return usage
+    
+    def check(self, enforce=True):
+        """Пересчитать занятое место в фоне и при превышении квот освободить его"""
+        if self.future is None or self.future.done():
+            self.future = self.executor.submit(self._check, dict(self.settings), enforce)
+        return self.future
+    
+    def _check(self, settings, enforce):
+        try:
+            usage = self.measure()
+            if enforce and self.enforce(usage, settings):
+                usage = self.measure()
+        except (OSError, sqlite3.Error) as e:
+            log.warning("Не удалось проверить место на диске: %s", e)
+            return
+        self.measured.emit(usage)
+    
+    @classmethod
+    def excess(cls, used, quota_mb):
+        quota = quota_mb * 1024 * 1024
+        if quota <= 0 or used <= quota:
+            return 0
+        return used - int(quota * cls.EVICT_TO)
+    
+    def enforce(self, usage, settings):
+        """Удалить устаревшее и лишнее сверх квот; True, если что-то удалено"""
+        removed = self.remove_stale()
+        cache_excess = self.excess(usage['cache'], settings['cache_mb'])
+        archive_excess = self.excess(usage['archive'], settings['archive_mb'])
+        # Превышение общей квоты сначала покрывает кеш, затем архив
+        extra = self.excess(sum(usage.values()), settings['total_mb']) - cache_excess - archive_excess
+        if extra > 0:
+            from_cache = min(extra, usage['cache'] - cache_excess)
+            cache_excess += from_cache
+            archive_excess += extra - from_cache
+        if cache_excess > 0:
+            self.cache_over_quota.emit(usage['cache'] - cache_excess)
+        if archive_excess > 0 and self.archive is not None and self.archive.evict(archive_excess):
+            removed = True
+        return removed
+    
+    def remove_stale(self):
+        deadline = time.time() - self.STALE_AGE
+        removed = False
+        for pattern in self.STALE_PATTERNS:
+            for path in self.data_dir.glob(pattern):
+                try:
+                    if path.is_file() and path.stat().st_mtime < deadline:
+                        path.unlink()
+                        removed = True
+                except OSError:
+                    continue
+        return removed
+    
+    def application_state_changed(self, state):
+        self.inactive_since = None if state == Qt.ApplicationActive else time.monotonic()
+    
+    def check_idle(self):
+        if self.inactive_since is None:
+            return
+        now = time.monotonic()
+        if now - self.inactive_since < self.settings['idle_minutes'] * 60:
+            return
+        if self.last_compact is not None and now - self.last_compact < self.COMPACT_INTERVAL:
+            return
+        self.compact()
+    
+    def compact(self):
+        """Свернуть журналы и сжать базы, затем пересчитать место"""
+        self.last_compact = time.monotonic()
+        for compactor in self.compactors:
+            try:
+                compactor()
+            except OSError as e:
+                log.warning("Не удалось свернуть журнал: %s", e)
+        return self.executor.submit(self._compact, list(self.background_compactors))
+    
+    def _compact(self, compactors):
+        for compactor in compactors:
+            try:
+                compactor()
+            except (OSError, sqlite3.Error) as e:
+                log.warning("Не удалось сжать базу: %s", e)
+        self._check(dict(self.settings), False)
+    
+    def close(self):
+        self.timer.stop()
+        self.idle_timer.stop()
+        self.executor.shutdown(wait=True)
+
+class SingleInstance(QObject):
+    """Один процесс браузера на каталог данных.
+    
+    Первый запуск слушает локальный сокет; повторный отправляет в него
+    свои адреса и флаги одной строкой JSON и сразу завершается.
+    """
+    message_received = pyqtSignal(dict)
+    
+    def __init__(self, data_dir, parent=None):
+        super().__init__(parent)
+        key = hashlib.sha1(str(Path(data_dir).resolve()).encode('utf-8')).hexdigest()[:16]
+        user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', '')
+        self.server_name = f"portable-browser-{user}-{key}"
+        self.server = None
+    
+    def send(self, message, timeout=500):
+        """Передать сообщение работающему экземпляру; False, если его нет"""
+        socket = QLocalSocket()
+        socket.connectToServer(self.server_name)
+        if not socket.waitForConnected(timeout):
+            return False
+        socket.write(json.dumps(message).encode('utf-8') + b'\n')
+        delivered = socket.waitForBytesWritten(timeout)
+        socket.disconnectFromServer()
+        return delivered
+    
+    def listen(self):
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        if not self.server.listen(self.server_name):
+            # Сокет остался от упавшего процесса: send() уже не смог к нему подключиться
+            QLocalServer.removeServer(self.server_name)
+            if not self.server.listen(self.server_name):
+                return False
+        self.server.newConnection.connect(self._accept)
+        return True
+    
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self._read(socket))
+            socket.disconnected.connect(socket.deleteLater)
+    
+    def _read(self, socket):
+        while socket.canReadLine():
+            line = bytes(socket.readLine()).strip()
+            try:
+                message = json.loads(line.decode('utf-8'))
+            except (UnicodeDecodeError, ValueError):
+                log.warning("Непонятное сообщение от другого экземпляра: %r", line[:200])
+                continue
+            if isinstance(message, dict):
+                self.message_received.emit(message)
+    
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+def setup_http_cache(profile, cache_dir, settings, quota_mb=0):
+    """Тип, каталог и размер кеша HTTP профиля по настройкам http_cache
+    и квоте на кеш из настроек места на диске"""
+    cache_type = PortableBrowser.HTTP_CACHE_TYPES.get(settings.get('type'),
+                                                      QWebEngineProfile.DiskHttpCache)
+    if profile.cachePath() != str(cache_dir):
+        profile.setCachePath(str(cache_dir))
+    profile.setHttpCacheType(cache_type)
+    # 0 - размер на усмотрение WebEngine
+    size_mb = max(0, int(settings.get('size_mb', 0)))
+    if quota_mb > 0:
+        size_mb = min(size_mb or quota_mb, quota_mb)
+    profile.setHttpCacheMaximumSize(size_mb * 1024 * 1024)
+
+def command_line_urls(args):
+    """Адреса из командной строки; относительные пути к файлам - от текущего каталога"""
+    cwd = os.getcwd()
+    return [QUrl.fromUserInput(arg, cwd).toString() for arg in args.urls]
+
+class PortableBrowser(QMainWindow):
+    history_query = pyqtSignal(int, str)
+    origins_query = pyqtSignal(int)
+    
+    # Сколько частых источников прогревать заранее
+    PRECONNECT_ORIGINS = 8
+    HTTP_CACHE_TYPES = {
+        'disk': QWebEngineProfile.DiskHttpCache,
+        'memory': QWebEngineProfile.MemoryHttpCache,
+        'none': QWebEngineProfile.NoCache,
+    }
+    HTTP_CACHE_DEFAULTS = {'type': 'disk', 'size_mb': 256}
+    
+    def __init__(self, data_dir=None):
+        super().__init__()
+        
+        # Инициализация папок
+        self.app_dir = Path(__file__).parent
+        self.data_dir = Path(data_dir) if data_dir else self.app_dir / "browser_data"
+        self.config_dir = self.data_dir / "config"
+        
+        # Настройки домашней страницы
+        self.home_page = "https://www.google.com"  # Фиксированная домашняя страница
+        
+        # Состояние браузера
+        self.incognito_mode = False
+        self.dark_mode = False
+        self.theme_generation = 0
+        self.hibernation_settings = dict(TabHibernator.DEFAULT_SETTINGS)
+        self.download_limit_kb = 0
+        self.http_cache_settings = dict(self.HTTP_CACHE_DEFAULTS)
+        self.prediction_settings = dict(NavigationPredictor.DEFAULT_SETTINGS)
+        self.storage_settings = dict(StorageManager.DEFAULT_SETTINGS)
+        self.page_index_settings = dict(PageTextIndex.DEFAULT_SETTINGS)
+        
+        # Интерфейс
+        self.setWindowTitle("Portable Browser - Домашняя страница: Google")
+        self.setGeometry(100, 100, 1200, 800)
+        
+        # Файлы настроек: отложенная запись в фоне и слежение за изменениями
+        self.config_store = ConfigStore(self.config_dir, self)
+        self.config_store.changed.connect(self.config_file_changed)
+        self.site_policies = SitePolicyManager(self.config_store)
+        
+        # Загрузки; незаконченные с прошлого запуска ждут на паузе
+        self.downloads = DownloadManager(self.data_dir / "downloads", self)
+        self.downloads.finished.connect(self.download_finished)
+        
+        # Значки сайтов и миниатюры вкладок
+        self.icon_store = IconStore(self.data_dir / "icons")
+        
+        # Установка иконки: нарисованная при первом запуске берётся из кеша
+        app_icon = self.icon_store.pixmap("app:icon")
+        if app_icon is None:
+            app_icon = self.create_browser_icon()
+            self.icon_store.store_pixmap("app:icon", app_icon)
+        self.setWindowIcon(QIcon(app_icon))
+        
+        # Создание интерфейса
+        self.setup_ui()
+        
+        # Загрузка настроек
+        self.load_settings()
+        
+        # Текущие вкладки
+        self.tabs = QTabWidget()
+        self.tabs.setTabsClosable(True)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.currentChanged.connect(self.tab_changed)
+        
+        # Вкладки по постоянным идентификаторам и индекс для Ctrl+K
+        self.tab_registry = TabRegistry()
+        
+        # Текст страниц для поиска по всем вкладкам (Ctrl+Shift+F)
+        self.page_indexer = PageIndexer(self.tab_registry, self.data_dir / "page_index.json.z",
+                                        self.page_index_settings, self)
+        
+        # Усыпление фоновых вкладок
+        self.hibernator = TabHibernator(self.tabs, self.hibernation_settings, self)
+        self.hibernator.restored.connect(self.tab_restored)
+        
+        self.suggestion_model = QStandardItemModel(self)
+        self.suggestion_seq = 0
+        self.suggestion_tab = None
+        self.suggestion_text = ""
+        
+        self.setCentralWidget(self.tabs)
+        
+        # Замеры загрузки страниц и панель разработчика
+        self.perf_log = PerfLog(self.data_dir / "perf")
+        self.perf_panel = PerfPanel(self.perf_log, self)
+        self.perf_panel.hide()
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.perf_panel)
+        self.perf_panel_action.setChecked(False)
+        self.perf_panel.visibilityChanged.connect(self.perf_panel_action.setChecked)
+        
+        self.process_panel = ProcessPanel(self.tabs, self)
+        self.process_panel.hide()
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.process_panel)
+        self.process_panel.visibilityChanged.connect(self.process_panel_action.setChecked)
+        
+        self.downloads_panel = DownloadsPanel(self.downloads, self)
+        self.downloads_panel.hide()
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.downloads_panel)
+        self.downloads_panel.visibilityChanged.connect(self.downloads_action.setChecked)
+        self.downloads_panel.limit_spin.valueChanged.connect(self.set_download_limit)
+        self.downloads.added.connect(lambda _: self.downloads_panel.show())
+        
+        # Адреса из командной строки и от других экземпляров до готовности WebEngine
+        self.pending_open = []
+        
+        # WebEngine, профили, блокировщик, история и вкладки - после первой отрисовки
+        self.initialized = False
+        self.first_paint_done = False
+        STARTUP.mark("окно создано")
+    
+    def event(self, event):
+        result = super().event(event)
+        if event.type() == QEvent.Paint and not self.first_paint_done:
+            self.first_paint_done = True
+            STARTUP.mark("первая отрисовка окна")
+            QTimer.singleShot(0, self.deferred_init)
+        return result
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        STARTUP.mark("окно показано")
+        # Запасной путь, если платформа не присылает событие отрисовки
+        QTimer.singleShot(500, self.deferred_init)
+    
+    def deferred_init(self):
+        """Тяжёлая инициализация, отложенная до появления окна на экране"""
+        if self.initialized:
+            return
+        self.initialized = True
+        
+        # Менеджер заблокированных сайтов
+        self.block_manager = BlockedSitesManager(self.config_dir, self.config_store)
+        self.config_store.watch("settings.json", SitePolicyManager.CONFIG_FILE,
+                                *BlockedSitesManager.WATCHED_FILES[:2])
+        # Кеш фильтров большой, а reload() сверяет его по подписи в заголовке
+        self.config_store.watch(BlockedSitesManager.WATCHED_FILES[2], hashed=False)
+        self.url_interceptor = UrlBlockInterceptor(self.block_manager, self, self.site_policies)
+        QWebEngineProfile.defaultProfile().setUrlRequestInterceptor(self.url_interceptor)
+        
+        # Кеш HTTP лежит в browser_data и переезжает вместе с браузером
+        self.apply_http_cache()
+        self.preconnector = Preconnector(QWebEngineProfile.defaultProfile(), self)
+        self.predictor = NavigationPredictor(self.data_dir / "predictor.json", self.preconnector,
+                                             self.create_page, self.prediction_settings, self)
+        
+        # Общий профиль инкогнито и уборка каталогов старых профилей
+        self.incognito_profiles = IncognitoProfileManager(self.url_interceptor, self)
+        IncognitoProfileManager.sweep_leftovers(self.data_dir)
+        self.downloads.attach_profile(QWebEngineProfile.defaultProfile())
+        self.incognito_profiles.profile_created.connect(self.downloads.attach_profile)
+        self.apply_page_dark_mode(QWebEngineProfile.defaultProfile())
+        self.incognito_profiles.profile_created.connect(self.apply_page_dark_mode)
+        
+        # Архив страниц для офлайна; без сети архивные адреса открываются из него
+        self.offline_archive = OfflineArchive(self.data_dir / "archive", self)
+        self.offline_archive.attach_profile(QWebEngineProfile.defaultProfile())
+        self.incognito_profiles.profile_created.connect(self.offline_archive.attach_profile)
+        self.offline_archive.saved.connect(self.page_archived)
+        self.offline_archive.failed.connect(self.page_archive_failed)
+        self.network_config = QNetworkConfigurationManager(self)
+        self.offline_archive.set_online(self.network_config.isOnline())
+        self.network_config.onlineStateChanged.connect(self.offline_archive.set_online)
+        STARTUP.mark("профили WebEngine")
+        
+        # История посещений; подсказки считаются в отдельном потоке
+        self.history_store = HistoryStore(self.data_dir / "history.sqlite")
+        self.history_thread = QThread(self)
+        self.history_worker = HistoryQueryWorker(self.history_store.db_path)
+        self.history_worker.moveToThread(self.history_thread)
+        self.history_thread.started.connect(self.history_worker.warm_up)
+        self.history_thread.finished.connect(self.history_worker.deleteLater)
+        self.history_query.connect(self.history_worker.query)
+        self.history_worker.results.connect(self.show_suggestions)
+        self.origins_query.connect(self.history_worker.top_origins)
+        self.history_worker.origins.connect(self.preconnect_origins)
+        self.history_thread.start()
+        
+        # Сессия: вкладки прошлого запуска восстанавливаются заглушками
+        self.session = SessionStore(self.data_dir / "session")
+        self.restoring_session = False
+        self.session_timer = QTimer(self)
+        self.session_timer.timeout.connect(self.session.compact)
+        self.session_timer.start(5 * 60 * 1000)
+        
+        # Квоты на browser_data и сжатие баз, пока окно неактивно
+        self.storage = StorageManager(self.data_dir, self.storage_settings, self)
+        self.storage.cache_over_quota.connect(self.shrink_http_cache)
+        self.storage.archive = self.offline_archive
+        self.storage.add_compactor(self.session.compact)
+        self.storage.add_compactor(self.block_manager.compact)
+        self.storage.add_compactor(self.history_store.compact, background=True)
+        self.storage.add_compactor(self.offline_archive.compact, background=True)
+        QTimer.singleShot(30 * 1000, self.storage.check)
+        
+        # Соединения к частым источникам открываются, пока создаются вкладки
+        self.preconnect_top_origins()
+        QApplication.instance().focusChanged.connect(self.focus_changed)
+        
+        if self.session.has_state():
+            self.restore_session()
+        self.page_indexer.load()
+        pending, self.pending_open = self.pending_open, []
+        for urls, incognito in pending:
+            self.open_urls(urls, incognito)
+        if self.tabs.count() == 0:
+            # Создаем первую вкладку с Google в качестве домашней страницы
+            self.add_new_tab()
+        STARTUP.mark("первая вкладка создана")
+        for control in self.deferred_controls:
+            control.setEnabled(True)
         
         # Показываем сообщение о домашней странице при запуске
         QTimer.singleShot(1000, self.show_home_page_notification)
     
+    def restore_session(self):
+        """Открыть вкладки прошлого запуска заглушками; загрузится только текущая"""
+        entries = [entry for entry in self.session.load() if entry['id'] not in self.tab_registry]
+        current_id = self.session.current
+        
+        self.restoring_session = True
+        current_tab = None
+        try:
+            for entry in entries:
+                # Вкладки сессии не инкогнито, даже если режим остался включён
+                tab = self.add_new_tab(url=entry['url'] or None, incognito=False,
+                                       title=entry['title'], background=True,
+                                       tab_id=entry['id'], history=entry.get('history'))
+                if entry['id'] == current_id or current_tab is None:
+                    current_tab = tab
+        finally:
+            self.restoring_session = False
+        
+        if current_tab is not None:
+            self.tabs.setCurrentWidget(current_tab)
+            self.statusBar().showMessage(f"Восстановлено вкладок: {len(entries)}", 2000)
+    
+    def open_urls(self, urls, incognito=False):
+        """Открыть адреса во вкладках; до отложенной инициализации - запомнить"""
+        if not self.initialized:
+            self.pending_open.append((urls, incognito))
+            return
+        for url in urls:
+            self.add_new_tab(url, incognito=incognito or None)
+        if incognito and not urls:
+            self.add_new_tab(incognito=True)
+    
+    def instance_message(self, message):
+        """Повторный запуск передал свои адреса"""
+        urls = [url for url in message.get('urls', []) if isinstance(url, str)]
+        self.open_urls(urls, bool(message.get('incognito')))
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+    
     def show_home_page_notification(self):
         """Показываем уведомление о домашней странице при запуске"""
         current_tab = self.tabs.currentWidget()
-        if current_tab and current_tab.browser.url().toString() == self.home_page:
+        if current_tab and current_tab.current_url() == self.home_page:
             self.statusBar().showMessage(f"Домашняя страница: {self.home_page}", 3000)
     
     def create_browser_icon(self):
@@ -187,7 +4483,7 @@ class PortableBrowser(QMainWindow):
         
         new_tab_action = QAction("Новая вкладка", self)
         new_tab_action.setShortcut("Ctrl+T")
-        new_tab_action.triggered.connect(self.add_new_tab)
+        new_tab_action.triggered.connect(lambda: self.add_new_tab())
         file_menu.addAction(new_tab_action)
         
         new_incognito_tab_action = QAction("Новое окно в режиме инкогнито", self)
@@ -195,6 +4491,42 @@ class PortableBrowser(QMainWindow):
         new_incognito_tab_action.triggered.connect(self.add_incognito_tab)
         file_menu.addAction(new_incognito_tab_action)
         
+        overview_action = QAction("Обзор вкладок", self)
+        overview_action.setShortcut("Ctrl+Shift+A")
+        overview_action.triggered.connect(self.show_tab_overview)
+        file_menu.addAction(overview_action)
+        
+        switcher_action = QAction("Перейти к вкладке...", self)
+        switcher_action.setShortcut("Ctrl+K")
+        switcher_action.triggered.connect(self.show_tab_switcher)
+        file_menu.addAction(switcher_action)
+        
+        page_search_action = QAction("Поиск по страницам...", self)
+        page_search_action.setShortcut("Ctrl+Shift+F")
+        page_search_action.triggered.connect(self.show_page_search)
+        file_menu.addAction(page_search_action)
+        
+        self.downloads_action = QAction("Загрузки", self)
+        self.downloads_action.setShortcut("Ctrl+J")
+        self.downloads_action.setCheckable(True)
+        self.downloads_action.triggered.connect(lambda checked: self.downloads_panel.setVisible(checked))
+        file_menu.addAction(self.downloads_action)
+        
+        save_offline_action = QAction("Сохранить для офлайна", self)
+        save_offline_action.setShortcut("Ctrl+S")
+        save_offline_action.triggered.connect(self.save_for_offline)
+        file_menu.addAction(save_offline_action)
+        
+        save_all_offline_action = QAction("Сохранить все вкладки для офлайна", self)
+        save_all_offline_action.setShortcut("Ctrl+Shift+S")
+        save_all_offline_action.triggered.connect(self.save_all_for_offline)
+        file_menu.addAction(save_all_offline_action)
+        
+        archive_action = QAction("Сохранённые страницы...", self)
+        archive_action.setShortcut("Ctrl+Shift+O")
+        archive_action.triggered.connect(self.show_offline_archive)
+        file_menu.addAction(archive_action)
+        
         home_action = QAction("Открыть домашнюю страницу", self)
         home_action.setShortcut("Ctrl+H")
         home_action.triggered.connect(self.open_home_page)
@@ -220,6 +4552,32 @@ class PortableBrowser(QMainWindow):
         incognito_action.triggered.connect(self.toggle_incognito_mode)
         settings_menu.addAction(incognito_action)
         
+        hibernation_action = QAction("Усыпление вкладок...", self)
+        hibernation_action.triggered.connect(self.configure_hibernation)
+        settings_menu.addAction(hibernation_action)
+        
+        http_cache_action = QAction("Кеш HTTP...", self)
+        http_cache_action.triggered.connect(self.configure_http_cache)
+        settings_menu.addAction(http_cache_action)
+        
+        storage_action = QAction("Место на диске...", self)
+        storage_action.triggered.connect(self.show_storage)
+        settings_menu.addAction(storage_action)
+        
+        engine_action = QAction("Процессы и движок...", self)
+        engine_action.triggered.connect(self.configure_engine)
+        settings_menu.addAction(engine_action)
+        
+        self.prediction_action = QAction("Предзагрузка страниц при наборе адреса", self)
+        self.prediction_action.setCheckable(True)
+        self.prediction_action.triggered.connect(self.toggle_prediction)
+        settings_menu.addAction(self.prediction_action)
+        
+        self.lite_mode_action = QAction("Облегчённый режим (без картинок, шрифтов и автовидео)", self)
+        self.lite_mode_action.setCheckable(True)
+        self.lite_mode_action.triggered.connect(self.toggle_lite_mode)
+        settings_menu.addAction(self.lite_mode_action)
+        
         # Меню Блокировщик
         block_menu = menubar.addMenu("Блокировщик")
         
@@ -227,6 +4585,29 @@ class PortableBrowser(QMainWindow):
         manage_blocks_action.triggered.connect(self.manage_blocked_sites)
         block_menu.addAction(manage_blocks_action)
         
+        import_filters_action = QAction("Импортировать список фильтров...", self)
+        import_filters_action.triggered.connect(self.import_filter_list)
+        block_menu.addAction(import_filters_action)
+        
+        site_policies_action = QAction("Правила сайтов...", self)
+        site_policies_action.triggered.connect(self.manage_site_policies)
+        block_menu.addAction(site_policies_action)
+        
+        # Меню Разработчик
+        dev_menu = menubar.addMenu("Разработчик")
+        
+        self.perf_panel_action = QAction("Производительность страниц", self)
+        self.perf_panel_action.setShortcut("Ctrl+Shift+P")
+        self.perf_panel_action.setCheckable(True)
+        self.perf_panel_action.triggered.connect(lambda checked: self.perf_panel.setVisible(checked))
+        dev_menu.addAction(self.perf_panel_action)
+        
+        self.process_panel_action = QAction("Процессы", self)
+        self.process_panel_action.setShortcut("Shift+Esc")
+        self.process_panel_action.setCheckable(True)
+        self.process_panel_action.triggered.connect(lambda checked: self.process_panel.setVisible(checked))
+        dev_menu.addAction(self.process_panel_action)
+        
         # Меню Справка
         help_menu = menubar.addMenu("Справка")
         
@@ -240,7 +4621,7 @@ class PortableBrowser(QMainWindow):
         
         new_tab_btn = QPushButton("+")
         new_tab_btn.setToolTip("Новая вкладка (Ctrl+T)")
-        new_tab_btn.clicked.connect(self.add_new_tab)
+        new_tab_btn.clicked.connect(lambda: self.add_new_tab())
         toolbar.addWidget(new_tab_btn)
         
         home_btn = QPushButton("🏠")
@@ -267,70 +4648,374 @@ class PortableBrowser(QMainWindow):
         home_label = QLabel(f"Домашняя страница: Google")
         home_label.setStyleSheet("color: #666; padding: 5px;")
         toolbar.addWidget(home_label)
+        
+        # Профили, блокировщик, сессия и хранилища появляются в deferred_init:
+        # до неё действия, которые к ним обращаются, выключены
+        self.deferred_controls = [
+            new_tab_action, new_incognito_tab_action, page_search_action,
+            save_offline_action, save_all_offline_action, archive_action,
+            storage_action, manage_blocks_action, import_filters_action,
+            about_action, new_tab_btn, block_btn]
+        for control in self.deferred_controls:
+            control.setEnabled(False)
     
     def open_home_page(self):
         """Открыть домашнюю страницу в текущей вкладке"""
         current_tab = self.tabs.currentWidget()
         if current_tab:
-            current_tab.browser.setUrl(QUrl(self.home_page))
+            current_tab.navigate(self.home_page)
             self.statusBar().showMessage(f"Открыта домашняя страница: {self.home_page}", 2000)
     
-    def add_new_tab(self, url=None, incognito=False):
+    def add_new_tab(self, url=None, incognito=None, title=None, background=False,
+                    tab_id=None, history=None):
         """Добавить новую вкладку"""
         # Всегда используем домашнюю страницу по умолчанию, если не указан другой URL
         if url is None:
             url = self.home_page
         
-        tab = BrowserTab(home_page=self.home_page)  # Передаем домашнюю страницу в таб
-        
-        # Устанавливаем профиль в зависимости от режима
-        if self.incognito_mode or incognito:
-            profile = QWebEngineProfile("incognito")
-            storage_name = f"incognito_{datetime.now().timestamp()}"
-            profile.setPersistentStoragePath(str(self.data_dir / storage_name))
-            profile.setHttpCacheType(QWebEngineProfile.NoCache)
-            profile.setPersistentCookiesPolicy(QWebEngineProfile.NoPersistentCookies)
+        # Устанавливаем профиль в зависимости от режима; явный incognito важнее него
+        if incognito is None:
+            incognito = self.incognito_mode
+        if incognito:
+            profile = self.incognito_profiles.acquire()
         else:
             profile = QWebEngineProfile.defaultProfile()
         
-        webpage = QWebEnginePage(profile, tab.browser)
-        tab.browser.setPage(webpage)
-        
-        # Устанавливаем URL
-        tab.browser.setUrl(QUrl(url))
+        # Вкладка создаётся заглушкой: вид и страница появятся при первом показе
+        tab = BrowserTab(home_page=self.home_page, url=url, title=title or "",
+                         icon=self.icon_store.icon(url_origin(url)),
+                         profile=profile, page_factory=self.create_page,
+                         tab_id=tab_id, history=history)
+        tab.materialized.connect(self.setup_tab_view)
+        self.tab_registry.add(tab)
         
-        # Подключаем обработчик для блокировки сайтов
-        def handle_url_change(q):
-            if self.block_manager.is_blocked(q):
-                tab.browser.setHtml(self.get_blocked_page_html(q.toString()))
-        
-        tab.browser.urlChanged.connect(handle_url_change)
+        # Вкладки инкогнито в сессию не попадают
+        if not tab.incognito and not self.restoring_session:
+            self.session.record('open', tab.tab_id, url=url, title=title or "")
         
         # Определяем название вкладки
-        if url == self.home_page:
+        if title:
+            tab_name = elide_title(title)
+        elif url == self.home_page:
             tab_name = "Google"
         else:
             tab_name = "Новая вкладка"
         
         index = self.tabs.addTab(tab, tab_name)
-        self.tabs.setCurrentIndex(index)
-        
-        # Обновляем заголовок при изменении
-        def update_title():
-            title = tab.browser.page().title()
-            if title:
-                # Для Google показываем просто "Google"
-                if "google" in tab.browser.url().toString().lower():
-                    self.tabs.setTabText(index, "Google")
-                else:
-                    self.tabs.setTabText(index, title[:20] + "..." if len(title) > 20 else title)
+        if tab.icon is not None:
+            self.tabs.setTabIcon(index, tab.icon)
+        if not background:
+            self.tabs.setCurrentIndex(index)
+            
+            # Показываем статус в статусной строке
+            self.statusBar().showMessage(f"Открыта новая вкладка", 1500)
+        
+        return tab
+    
+    def create_page(self, profile, view):
+        # Страница сама подменяет заблокированные сайты заглушкой
+        return BrowserPage(profile, view, self.block_manager, self.get_blocked_page_html,
+                           self.offline_archive, self.site_policies)
+    
+    def setup_tab_view(self, tab):
+        """Подключить сигналы только что созданного вида вкладки"""
+        # Первый документ вкладки затемнит скрипт профиля
+        tab.theme_generation = self.theme_generation
+        tab.browser.titleChanged.connect(lambda: self.update_tab_title(tab))
+        tab.browser.titleChanged.connect(lambda: self.tab_registry.update(tab))
+        tab.browser.urlChanged.connect(lambda: self.tab_registry.update(tab))
+        tab.browser.urlChanged.connect(lambda: self.show_cached_icon(tab))
+        tab.browser.iconChanged.connect(lambda icon: self.update_tab_icon(tab, icon))
+        tab.browser.loadFinished.connect(lambda ok: ok and self.schedule_thumbnail(tab))
+        tab.browser.loadFinished.connect(self.first_load_finished)
+        tab.browser.loadFinished.connect(lambda ok: ok or self.show_offline_copy(tab))
         
-        tab.browser.titleChanged.connect(update_title)
+        # Замеры загрузки; адреса из инкогнито в журнал не пишутся
+        if not tab.incognito:
+            tab.load_monitor = PageLoadMonitor(tab.browser, tab)
+            tab.load_monitor.measured.connect(self.page_load_measured)
         
-        # Показываем статус в статусной строке
-        self.statusBar().showMessage(f"Открыта новая вкладка", 1500)
+        # Подсказки из истории в адресной строке
+        completer = QCompleter(self.suggestion_model, tab.url_bar)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        completer.setCompletionRole(Qt.UserRole)
+        completer.activated[str].connect(lambda _: tab.navigate_to_url())
+        tab.url_bar.setCompleter(completer)
+        tab.url_bar.textEdited.connect(lambda text: self.request_suggestions(tab, text))
+        tab.navigation_handler = self.url_entered
         
-        return tab
+        if not tab.incognito:
+            tab.browser.urlChanged.connect(lambda: self.record_visit(tab))
+            tab.browser.titleChanged.connect(lambda: self.record_visit_title(tab))
+            tab.browser.urlChanged.connect(lambda: self.record_tab_navigation(tab))
+            tab.browser.titleChanged.connect(lambda: self.record_tab_navigation(tab))
+            tab.browser.loadFinished.connect(lambda: self.record_tab_history(tab))
+            tab.browser.loadFinished.connect(lambda ok: ok and self.page_indexer.schedule(tab))
+    
+    def show_cached_icon(self, tab):
+        """Значок из кеша сразу при смене источника, не дожидаясь iconChanged"""
+        icon = self.icon_store.icon(url_origin(tab.current_url()))
+        index = self.tabs.indexOf(tab)
+        if icon is not None and index >= 0:
+            tab.icon = icon
+            self.tabs.setTabIcon(index, icon)
+    
+    def update_tab_icon(self, tab, icon):
+        if icon.isNull():
+            return
+        tab.icon = icon
+        index = self.tabs.indexOf(tab)
+        if index >= 0:
+            self.tabs.setTabIcon(index, icon)
+        if not tab.incognito:
+            self.icon_store.store_icon(url_origin(tab.current_url()), icon)
+    
+    def schedule_thumbnail(self, tab):
+        # Снимок чуть позже загрузки, когда страница успела отрисоваться
+        QTimer.singleShot(1000, lambda: self.capture_thumbnail(tab))
+    
+    def capture_thumbnail(self, tab):
+        if tab.incognito or self.tabs.indexOf(tab) < 0 or tab.browser is None:
+            return
+        if tab.browser.isVisible():
+            self.icon_store.store_thumbnail(url_origin(tab.current_url()), tab.browser.grab())
+    
+    def save_for_offline(self):
+        tab = self.tabs.currentWidget()
+        if tab is None or tab.browser is None or not self.offline_archive.save_page(tab.browser.page()):
+            self.statusBar().showMessage("Эту страницу нельзя сохранить для офлайна", 2000)
+            return
+        self.statusBar().showMessage(f"Сохранение: {tab.current_title()}", 2000)
+    
+    def save_all_for_offline(self):
+        """Сохранить все загруженные вкладки; заглушки пропускаются"""
+        saved = 0
+        for i in range(self.tabs.count()):
+            tab = self.tabs.widget(i)
+            if tab.browser is not None and self.offline_archive.save_page(tab.browser.page()):
+                saved += 1
+        self.statusBar().showMessage(f"Сохраняется вкладок: {saved}", 3000)
+    
+    def page_archived(self, url, title):
+        self.statusBar().showMessage(f"Сохранено для офлайна: {title or url}", 3000)
+    
+    def page_archive_failed(self, url, reason):
+        self.statusBar().showMessage(f"Не удалось сохранить {url}: {reason}", 5000)
+    
+    def show_offline_copy(self, tab):
+        """Страница не загрузилась - открыть сохранённую копию, если есть"""
+        url = tab.current_url()
+        if not url.startswith(('http://', 'https://')) or not self.offline_archive.has(url):
+            return
+        local_url = self.offline_archive.open_url(url)
+        if local_url is not None:
+            tab.browser.setUrl(local_url)
+            self.statusBar().showMessage(f"Открыта сохранённая копия: {url}", 3000)
+    
+    def show_offline_archive(self):
+        """Поиск по сохранённым страницам"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Сохранённые страницы")
+        dialog.resize(700, 450)
+        layout = QVBoxLayout()
+        
+        search_input = QLineEdit()
+        search_input.setPlaceholderText("Поиск по заголовку и адресу")
+        layout.addWidget(search_input)
+        
+        page_list = QListWidget()
+        page_list.setSelectionMode(QListWidget.ExtendedSelection)
+        layout.addWidget(page_list)
+        
+        usage_label = QLabel()
+        layout.addWidget(usage_label)
+        
+        def refresh():
+            page_list.clear()
+            for page_id, url, title, saved_at in self.offline_archive.search(search_input.text()):
+                when = datetime.fromtimestamp(saved_at).strftime('%Y-%m-%d %H:%M')
+                item = QListWidgetItem(f"{title or url} — {when}")
+                item.setToolTip(url)
+                item.setData(Qt.UserRole, page_id)
+                page_list.addItem(item)
+            usage_label.setText(f"Страниц: {page_list.count()}, на диске: "
+                                f"{format_size(self.offline_archive.disk_usage())}")
+        
+        def open_selected():
+            for item in page_list.selectedItems():
+                local_url = self.offline_archive.open_page(item.data(Qt.UserRole))
+                if local_url is not None:
+                    self.add_new_tab(local_url.toString())
+        
+        def delete_selected():
+            ids = [item.data(Qt.UserRole) for item in page_list.selectedItems()]
+            if ids:
+                self.offline_archive.delete(ids)
+                refresh()
+        
+        search_input.textChanged.connect(refresh)
+        page_list.itemDoubleClicked.connect(lambda _: open_selected())
+        
+        buttons = QHBoxLayout()
+        open_btn = QPushButton("Открыть")
+        open_btn.clicked.connect(open_selected)
+        buttons.addWidget(open_btn)
+        delete_btn = QPushButton("Удалить")
+        delete_btn.clicked.connect(delete_selected)
+        buttons.addWidget(delete_btn)
+        buttons.addStretch()
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(dialog.accept)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+        
+        dialog.setLayout(layout)
+        refresh()
+        dialog.exec_()
+    
+    def show_tab_switcher(self):
+        switcher = TabSwitcher(self.tab_registry, self)
+        if switcher.exec_() == QDialog.Accepted:
+            tab = self.tab_registry.get(switcher.selected)
+            if tab is not None:
+                self.tabs.setCurrentWidget(tab)
+    
+    def show_page_search(self):
+        dialog = PageSearchDialog(self.page_indexer.index, self.tab_registry, self)
+        if dialog.exec_() == QDialog.Accepted:
+            tab_id, url = dialog.selected
+            tab = self.tab_registry.get(tab_id)
+            if tab is not None:
+                self.tabs.setCurrentWidget(tab)
+            else:
+                self.add_new_tab(url)
+    
+    def show_tab_overview(self):
+        """Обзор вкладок с миниатюрами из кеша"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Обзор вкладок")
+        dialog.resize(900, 600)
+        
+        view = QListWidget()
+        view.setViewMode(QListView.IconMode)
+        view.setIconSize(IconStore.THUMB_SIZE)
+        view.setResizeMode(QListView.Adjust)
+        view.setMovement(QListView.Static)
+        view.setSpacing(8)
+        view.setUniformItemSizes(True)
+        for i in range(self.tabs.count()):
+            tab = self.tabs.widget(i)
+            thumb = self.icon_store.thumbnail(url_origin(tab.current_url()))
+            icon = QIcon(thumb) if thumb is not None else (tab.icon or QIcon())
+            item = QListWidgetItem(icon, elide_title(tab.current_title() or tab.current_url(), 40))
+            item.setToolTip(tab.current_url())
+            item.setData(Qt.UserRole, tab)
+            view.addItem(item)
+        
+        def activate(item):
+            tab = item.data(Qt.UserRole)
+            if self.tabs.indexOf(tab) >= 0:
+                self.tabs.setCurrentWidget(tab)
+            dialog.accept()
+        
+        view.itemActivated.connect(activate)
+        layout = QVBoxLayout()
+        layout.addWidget(view)
+        dialog.setLayout(layout)
+        dialog.exec_()
+    
+    def page_load_measured(self, record):
+        self.perf_log.add(record)
+        self.perf_panel.refresh()
+    
+    def first_load_finished(self):
+        STARTUP.mark("первая страница загружена")
+        STARTUP.report()
+        self.sender().loadFinished.disconnect(self.first_load_finished)
+    
+    def record_visit(self, tab):
+        url = tab.current_url()
+        if url.startswith(('http://', 'https://')):
+            self.history_store.add_visit(url, tab.current_title())
+    
+    def record_visit_title(self, tab):
+        url = tab.current_url()
+        title = tab.current_title()
+        if title and url.startswith(('http://', 'https://')):
+            self.history_store.update_title(url, title)
+    
+    def request_suggestions(self, tab, text):
+        """Запросить подсказки; устаревшие запросы воркер пропустит"""
+        self.suggestion_seq += 1
+        self.suggestion_tab = tab
+        self.suggestion_text = text
+        self.history_worker.latest = self.suggestion_seq
+        self.history_query.emit(self.suggestion_seq, text)
+    
+    def show_suggestions(self, seq, results):
+        tab = self.suggestion_tab
+        if seq != self.suggestion_seq or tab is None or tab.browser is None:
+            return
+        self.suggestion_model.clear()
+        for url, title in results:
+            item = QStandardItem(f"{title} — {url}" if title else url)
+            item.setData(url, Qt.UserRole)
+            item.setToolTip(url)
+            self.suggestion_model.appendRow(item)
+        if results and tab.url_bar.hasFocus():
+            tab.url_bar.completer().complete()
+        
+        if not tab.incognito and not self.incognito_mode:
+            url, confidence = self.predictor.best(self.suggestion_text, [url for url, _ in results])
+            self.predictor.prepare(tab, url, confidence)
+    
+    def url_entered(self, tab, url):
+        """Enter в адресной строке: подставить страницу, загруженную заранее"""
+        if tab.incognito:
+            return False
+        if self.suggestion_tab is tab and self.suggestion_text:
+            self.predictor.learn(self.suggestion_text, url)
+            self.suggestion_text = ""
+        page = self.predictor.take(tab, url)
+        if page is None:
+            return False
+        old_page = tab.browser.page()
+        page.setParent(tab.browser)
+        tab.browser.setPage(page)
+        old_page.deleteLater()
+        self.schedule_thumbnail(tab)
+        return True
+    
+    def record_tab_navigation(self, tab):
+        url = tab.current_url()
+        title = tab.current_title()
+        # Страница-заглушка блокировщика, пустые адреса и повторы в сессию не пишутся
+        if not url or url.startswith('data:'):
+            return
+        entry = self.session.tabs.get(tab.tab_id)
+        if entry is None or entry['url'] != url or entry['title'] != title:
+            self.session.record('nav', tab.tab_id, url=url, title=title)
+    
+    def record_tab_history(self, tab):
+        if tab.browser is None or tab.current_url().startswith('data:'):
+            return
+        # История целиком занимает в журнале много места: пишем её только при изменении
+        data = serialize_history(tab.browser.history())
+        entry = self.session.tabs.get(tab.tab_id)
+        if entry is None or entry['history'] != data:
+            self.session.record('hist', tab.tab_id, data=data)
+    
+    def update_tab_title(self, tab):
+        """Обновить название вкладки по заголовку страницы"""
+        index = self.tabs.indexOf(tab)
+        title = tab.current_title()
+        if index < 0 or not title:
+            return
+        # Для Google показываем просто "Google"
+        if "google" in tab.current_url().lower():
+            self.tabs.setTabText(index, "Google")
+        else:
+            self.tabs.setTabText(index, elide_title(title))
     
     def add_incognito_tab(self):
         """Добавить вкладку в режиме инкогнито"""
@@ -339,7 +5024,19 @@ class PortableBrowser(QMainWindow):
     
     def close_tab(self, index):
         if self.tabs.count() > 1:
+            tab = self.tabs.widget(index)
+            profile = tab.profile
+            self.hibernator.forget(tab)
+            if not tab.incognito:
+                self.session.record('close', tab.tab_id)
+            if self.suggestion_tab is tab:
+                self.suggestion_tab = None
+            self.predictor.forget(tab)
+            self.page_indexer.tab_closed(tab)
+            self.tab_registry.remove(tab)
             self.tabs.removeTab(index)
+            tab.teardown()
+            self.incognito_profiles.release(profile)
             self.statusBar().showMessage("Вкладка закрыта", 1500)
         else:
             self.close()
@@ -348,72 +5045,417 @@ class PortableBrowser(QMainWindow):
         if index >= 0:
             tab = self.tabs.widget(index)
             if tab:
-                current_url = tab.browser.url().toString()
+                # Заглушка превратится в полноценную вкладку в showEvent
+                self.hibernator.activate(tab)
+                self.sync_tab_theme(tab)
+                if not tab.incognito and not self.restoring_session:
+                    self.session.record('current', tab.tab_id)
+                current_url = tab.current_url()
                 if current_url == self.home_page:
                     self.statusBar().showMessage(f"Текущая вкладка: Домашняя страница (Google)", 2000)
                 else:
-                    self.statusBar().showMessage(f"Текущая вкладка: {tab.browser.page().title()}", 2000)
+                    self.statusBar().showMessage(f"Текущая вкладка: {tab.current_title()}", 2000)
     
-    def toggle_dark_mode(self):
-        self.dark_mode = not self.dark_mode
-        self.dark_mode_action.setChecked(self.dark_mode)
+    def tab_restored(self, tab, latency):
+        index = self.tabs.indexOf(tab)
+        if index >= 0:
+            self.tabs.setTabToolTip(index, f"Восстановлена за {latency:.0f} мс")
+        self.statusBar().showMessage(f"Вкладка восстановлена за {latency:.0f} мс", 3000)
+    
+    def apply_http_cache(self):
+        setup_http_cache(QWebEngineProfile.defaultProfile(), self.data_dir / "cache",
+                         self.http_cache_settings, self.storage_settings['cache_mb'])
+    
+    def shrink_http_cache(self, size):
+        """Кеш вышел за квоту. Файлы работающего кеша не удаляются в обход
+        WebEngine: ему задаётся меньший предел, и лишнее он убирает сам"""
+        profile = QWebEngineProfile.defaultProfile()
+        if size < 1024 * 1024:
+            profile.clearHttpCache()
+        elif not profile.httpCacheMaximumSize() or size < profile.httpCacheMaximumSize():
+            profile.setHttpCacheMaximumSize(size)
+    
+    def configure_http_cache(self):
+        """Тип и размер кеша HTTP основного профиля"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Кеш HTTP")
         
-        if self.dark_mode:
-            self.setStyleSheet("""
-                QMainWindow, QWidget {
-                    background-color: #2b2b2b;
-                    color: #ffffff;
-                }
-                QTabWidget::pane {
-                    border: 1px solid #444;
-                    background-color: #2b2b2b;
-                }
-                QTabBar::tab {
-                    background-color: #3b3b3b;
-                    color: #ffffff;
-                    padding: 8px;
-                }
-                QTabBar::tab:selected {
-                    background-color: #4b4b4b;
-                }
-                QLineEdit {
-                    background-color: #3b3b3b;
-                    color: #ffffff;
-                    border: 1px solid #555;
-                    padding: 5px;
-                }
-                QPushButton {
-                    background-color: #4b4b4b;
-                    color: #ffffff;
-                    border: none;
-                    padding: 5px 10px;
-                }
-                QPushButton:hover {
-                    background-color: #5b5b5b;
-                }
-                QToolBar {
-                    background-color: #3b3b3b;
-                    border: none;
-                }
-                QStatusBar {
-                    background-color: #3b3b3b;
-                    color: #ffffff;
-                }
-                QLabel {
-                    color: #ffffff;
-                }
-            """)
+        form = QFormLayout()
+        type_box = QComboBox()
+        for key, label in (('disk', "На диске (browser_data/cache)"), ('memory', "В памяти"),
+                           ('none', "Без кеша")):
+            type_box.addItem(label, key)
+        type_box.setCurrentIndex(max(0, type_box.findData(self.http_cache_settings['type'])))
+        form.addRow("Тип:", type_box)
+        
+        size_spin = QSpinBox()
+        size_spin.setRange(0, 16384)
+        size_spin.setSingleStep(64)
+        size_spin.setSuffix(" МБ")
+        size_spin.setSpecialValueText("автоматически")
+        size_spin.setValue(self.http_cache_settings['size_mb'])
+        form.addRow("Размер:", size_spin)
+        
+        cache_dir = self.data_dir / "cache"
+        used = sum(f.stat().st_size for f in cache_dir.rglob('*') if f.is_file()) if cache_dir.exists() else 0
+        form.addRow("Занято:", QLabel(format_size(used)))
+        
+        clear_btn = QPushButton("Очистить кеш")
+        clear_btn.clicked.connect(QWebEngineProfile.defaultProfile().clearHttpCache)
+        form.addRow(clear_btn)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        dialog.setLayout(form)
+        
+        if dialog.exec_() == QDialog.Accepted:
+            self.http_cache_settings = {'type': type_box.currentData(), 'size_mb': size_spin.value()}
+            self.apply_http_cache()
+            self.save_settings()
+    
+    def show_storage(self):
+        """Занятое место по категориям и квоты на папку browser_data"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Место на диске")
+        dialog.resize(500, 480)
+        layout = QVBoxLayout()
+        
+        table = PerfPanel._table(["Категория", "Размер"])
+        total_label = QLabel()
+        labels = {key: label for key, (label, _) in StorageManager.CATEGORIES.items()}
+        labels['other'] = "Прочее"
+        
+        def fill(usage):
+            rows = sorted(usage.items(), key=lambda item: -item[1])
+            PerfPanel._fill(table, [(labels[key], format_size(size)) for key, size in rows])
+            total_label.setText(f"Всего: {format_size(sum(usage.values()))} в {self.data_dir}")
+        
+        self.storage.measured.connect(fill, Qt.QueuedConnection)
+        dialog.finished.connect(lambda _: self.storage.measured.disconnect(fill))
+        if self.storage.usage:
+            fill(self.storage.usage)
         else:
-            self.setStyleSheet("""
-                QStatusBar {
-                    background-color: #f0f0f0;
-                    color: #000000;
-                }
-            """)
+            total_label.setText("Считается...")
+        self.storage.check(enforce=False)
+        layout.addWidget(table)
+        layout.addWidget(total_label)
+        
+        form = QFormLayout()
+        spins = {}
+        for key, label in (('total_mb', "Вся папка:"), ('cache_mb', "Кеш HTTP:"),
+                           ('archive_mb', "Офлайн-архив:")):
+            spin = QSpinBox()
+            spin.setRange(0, 1024 * 1024)
+            spin.setSingleStep(128)
+            spin.setSuffix(" МБ")
+            spin.setSpecialValueText("без ограничения")
+            spin.setValue(self.storage_settings[key])
+            form.addRow(label, spin)
+            spins[key] = spin
+        idle_spin = QSpinBox()
+        idle_spin.setRange(1, 240)
+        idle_spin.setSuffix(" мин")
+        idle_spin.setValue(self.storage_settings['idle_minutes'])
+        form.addRow("Сжимать базы после простоя:", idle_spin)
+        spins['idle_minutes'] = idle_spin
+        layout.addLayout(form)
         
+        buttons_layout = QHBoxLayout()
+        for text, slot in (("Пересчитать", lambda: self.storage.check(enforce=False)),
+                           ("Освободить место", lambda: self.storage.check()),
+                           ("Сжать базы", lambda: self.storage.compact())):
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            buttons_layout.addWidget(button)
+        layout.addLayout(buttons_layout)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        dialog.setLayout(layout)
+        
+        if dialog.exec_() == QDialog.Accepted:
+            self.storage_settings = {key: spin.value() for key, spin in spins.items()}
+            self.storage.apply_settings(self.storage_settings)
+            self.apply_http_cache()
+            self.save_settings()
+            self.storage.check()
+    
+    def configure_engine(self):
+        """Модель процессов и ограничения Chromium; действуют после перезапуска"""
+        settings = load_engine_settings(self.config_dir)
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Процессы и движок")
+        form = QFormLayout()
+        
+        model_box = QComboBox()
+        for key, label in (('default', "По умолчанию"),
+                           ('process-per-site-instance', "Процесс на экземпляр сайта"),
+                           ('process-per-site', "Процесс на сайт"),
+                           ('single-process', "Один процесс (экономно, но нестабильно)")):
+            model_box.addItem(label, key)
+        model_box.setCurrentIndex(max(0, model_box.findData(settings['process_model'])))
+        form.addRow("Модель процессов:", model_box)
+        
+        limit_spin = QSpinBox()
+        limit_spin.setRange(0, 64)
+        limit_spin.setSpecialValueText("без ограничения")
+        limit_spin.setValue(settings['renderer_process_limit'])
+        form.addRow("Не больше рендереров:", limit_spin)
+        
+        heap_spin = QSpinBox()
+        heap_spin.setRange(0, 16384)
+        heap_spin.setSingleStep(128)
+        heap_spin.setSuffix(" МБ")
+        heap_spin.setSpecialValueText("по умолчанию")
+        heap_spin.setValue(settings['js_heap_mb'])
+        form.addRow("Куча JavaScript:", heap_spin)
+        
+        gpu_box = QCheckBox("Использовать GPU")
+        gpu_box.setChecked(settings['gpu'])
+        form.addRow(gpu_box)
+        
+        raster_box = QComboBox()
+        for key, label in (('auto', "Автоматически"), ('on', "Включена"), ('off', "Выключена")):
+            raster_box.addItem(label, key)
+        raster_box.setCurrentIndex(max(0, raster_box.findData(settings['gpu_rasterization'])))
+        form.addRow("Растеризация на GPU:", raster_box)
+        
+        form.addRow(QLabel("Изменения вступят в силу после перезапуска браузера."))
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        dialog.setLayout(form)
+        
+        if dialog.exec_() == QDialog.Accepted:
+            settings.update({
+                'process_model': model_box.currentData(),
+                'renderer_process_limit': limit_spin.value(),
+                'js_heap_mb': heap_spin.value(),
+                'gpu': gpu_box.isChecked(),
+                'gpu_rasterization': raster_box.currentData(),
+            })
+            self.config_store.save(ENGINE_SETTINGS_FILE, settings)
+            self.statusBar().showMessage("Настройки движка сохранены; нужен перезапуск", 3000)
+    
+    def preconnect_top_origins(self):
+        if self.incognito_mode or not self.preconnector.due():
+            return
+        self.origins_query.emit(self.PRECONNECT_ORIGINS)
+    
+    def preconnect_origins(self, origins):
+        self.preconnector.preconnect([url_origin(self.home_page)] + origins)
+    
+    def focus_changed(self, old, now):
+        """Фокус в адресной строке - скорее всего, сейчас будет переход"""
+        tab = self.tabs.currentWidget()
+        if tab is not None and tab.browser is not None and now is tab.url_bar and not tab.incognito:
+            self.preconnect_top_origins()
+    
+    def set_download_limit(self, kb_per_sec):
+        if kb_per_sec == self.download_limit_kb:
+            return
+        self.download_limit_kb = kb_per_sec
+        self.downloads.set_rate_limit(kb_per_sec)
+        self.save_settings()
+    
+    def download_finished(self, task):
+        if task.state == 'done':
+            self.statusBar().showMessage(f"Загружено: {task.path.name}", 3000)
+        elif task.state == 'failed':
+            self.statusBar().showMessage(f"Ошибка загрузки {task.path.name}: {task.error}", 5000)
+    
+    def toggle_lite_mode(self, checked):
+        """Облегчённый режим действует на следующие переходы во всех вкладках"""
+        self.site_policies.set_lite_mode(checked)
+        self.statusBar().showMessage(f"Облегчённый режим: {'ВКЛ' if checked else 'ВЫКЛ'}", 2000)
+        self.save_settings()
+    
+    def manage_site_policies(self):
+        """Таблица правил: строка - хост, флажок - разрешено ли"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Правила сайтов")
+        dialog.resize(750, 400)
+        layout = QVBoxLayout()
+        keys = list(SitePolicyManager.DEFAULTS)
+        
+        table = QTableWidget(0, len(keys) + 1)
+        table.setHorizontalHeaderLabels(["Сайт"] + [SitePolicyManager.LABELS[key] for key in keys])
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(table)
+        
+        def fill():
+            table.blockSignals(True)
+            table.setRowCount(0)
+            for host, rule in sorted(self.site_policies.rules.items()):
+                row = table.rowCount()
+                table.insertRow(row)
+                host_item = QTableWidgetItem(host)
+                host_item.setFlags(host_item.flags() & ~Qt.ItemIsEditable)
+                table.setItem(row, 0, host_item)
+                policy = dict(SitePolicyManager.DEFAULTS, **rule)
+                for column, key in enumerate(keys, 1):
+                    item = QTableWidgetItem()
+                    item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+                    item.setCheckState(Qt.Checked if policy[key] else Qt.Unchecked)
+                    table.setItem(row, column, item)
+            table.blockSignals(False)
+        
+        def item_changed(item):
+            if item.column() == 0:
+                return
+            host = table.item(item.row(), 0).text()
+            rule = {key: table.item(item.row(), column).checkState() == Qt.Checked
+                    for column, key in enumerate(keys, 1)}
+            self.site_policies.set_rule(host, rule)
+        
+        table.itemChanged.connect(item_changed)
+        
+        input_layout = QHBoxLayout()
+        host_input = QLineEdit()
+        host_input.setPlaceholderText("example.com")
+        current = self.tabs.currentWidget()
+        if current is not None:
+            host_input.setText(QUrl(current.current_url()).host())
+        input_layout.addWidget(host_input)
+        
+        def add_rule():
+            host = host_input.text().strip()
+            if host and self.site_policies.set_rule(host, self.site_policies.base_rule(host)):
+                fill()
+        
+        def remove_rule():
+            for row in sorted({index.row() for index in table.selectedIndexes()}, reverse=True):
+                self.site_policies.remove_rule(table.item(row, 0).text())
+            fill()
+        
+        add_btn = QPushButton("Добавить")
+        add_btn.clicked.connect(add_rule)
+        input_layout.addWidget(add_btn)
+        remove_btn = QPushButton("Удалить выбранные")
+        remove_btn.clicked.connect(remove_rule)
+        input_layout.addWidget(remove_btn)
+        layout.addLayout(input_layout)
+        layout.addWidget(QLabel("Правила действуют со следующего перехода на сайт."))
+        
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(dialog.accept)
+        layout.addWidget(close_btn)
+        dialog.setLayout(layout)
+        fill()
+        dialog.exec_()
+    
+    def toggle_prediction(self, checked):
+        self.prediction_settings['enabled'] = checked
+        if self.initialized:
+            self.predictor.apply_settings(self.prediction_settings)
+        self.save_settings()
+    
+    def configure_hibernation(self):
+        """Настройки усыпления фоновых вкладок"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Усыпление вкладок")
+        
+        settings = self.hibernator.settings
+        form = QFormLayout()
+        enabled_box = QCheckBox("Усыплять фоновые вкладки")
+        enabled_box.setChecked(settings['enabled'])
+        form.addRow(enabled_box)
+        
+        freeze_spin = QSpinBox()
+        freeze_spin.setRange(1, 1440)
+        freeze_spin.setSuffix(" мин")
+        freeze_spin.setValue(max(1, settings['freeze_after'] // 60))
+        form.addRow("Заморозка через:", freeze_spin)
+        
+        discard_spin = QSpinBox()
+        discard_spin.setRange(1, 1440)
+        discard_spin.setSuffix(" мин")
+        discard_spin.setValue(max(1, settings['discard_after'] // 60))
+        form.addRow("Выгрузка через:", discard_spin)
+        
+        budget_spin = QSpinBox()
+        budget_spin.setRange(0, 65536)
+        budget_spin.setSingleStep(256)
+        budget_spin.setSuffix(" МБ")
+        budget_spin.setSpecialValueText("без ограничения")
+        budget_spin.setValue(settings['memory_budget_mb'])
+        form.addRow("Бюджет памяти вкладок:", budget_spin)
+        
+        pressure_spin = QSpinBox()
+        pressure_spin.setRange(0, 90)
+        pressure_spin.setSuffix(" %")
+        pressure_spin.setValue(settings['min_available_percent'])
+        form.addRow("Выгружать при свободной памяти ниже:", pressure_spin)
+        
+        latencies = self.hibernator.restore_latencies
+        if latencies:
+            form.addRow(QLabel(f"Последнее восстановление: {latencies[-1]:.0f} мс, "
+                               f"в среднем: {sum(latencies) / len(latencies):.0f} мс"))
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        dialog.setLayout(form)
+        
+        if dialog.exec_() == QDialog.Accepted:
+            self.hibernation_settings = {
+                'enabled': enabled_box.isChecked(),
+                'freeze_after': freeze_spin.value() * 60,
+                'discard_after': max(discard_spin.value(), freeze_spin.value()) * 60,
+                'memory_budget_mb': budget_spin.value(),
+                'min_available_percent': pressure_spin.value(),
+            }
+            self.hibernator.apply_settings(self.hibernation_settings)
+            self.save_settings()
+    
+    def toggle_dark_mode(self):
+        self.dark_mode = not self.dark_mode
+        self.apply_dark_mode()
         self.statusBar().showMessage(f"Темная тема: {'Включена' if self.dark_mode else 'Выключена'}", 2000)
         self.save_settings()
     
+    def apply_dark_mode(self):
+        """Сменить тему: готовая палитра для интерфейса и скрипт профиля для страниц.
+        
+        Стоимость не зависит от числа вкладок: палитры построены заранее,
+        новые документы затемняет скрипт профиля, а уже открытые страницы
+        фоновых вкладок исправляются при переключении на них.
+        """
+        self.dark_mode_action.setChecked(self.dark_mode)
+        QApplication.setPalette(theme_palette(self.dark_mode))
+        self.theme_generation += 1
+        if self.initialized:
+            self.apply_page_dark_mode(QWebEngineProfile.defaultProfile())
+            if self.incognito_profiles.profile is not None:
+                self.apply_page_dark_mode(self.incognito_profiles.profile)
+            tab = self.tabs.currentWidget()
+            if tab is not None:
+                self.sync_tab_theme(tab)
+    
+    def apply_page_dark_mode(self, profile):
+        """Вставить или убрать скрипт затемнения страниц в профиле"""
+        scripts = profile.scripts()
+        script = scripts.findScript(DARK_MODE_SCRIPT_NAME)
+        if not script.isNull():
+            scripts.remove(script)
+        if self.dark_mode:
+            scripts.insert(dark_mode_script())
+    
+    def sync_tab_theme(self, tab):
+        """Привести уже загруженную страницу вкладки к текущей теме"""
+        if tab.browser is None or tab.theme_generation == self.theme_generation:
+            return
+        tab.theme_generation = self.theme_generation
+        tab.browser.page().runJavaScript(dark_mode_toggle_js(self.dark_mode),
+                                         QWebEngineScript.ApplicationWorld)
+    
     def toggle_incognito_mode(self):
         self.incognito_mode = not self.incognito_mode
         status = "ВКЛ" if self.incognito_mode else "ВЫКЛ"
@@ -434,11 +5476,30 @@ class PortableBrowser(QMainWindow):
         info_label.setStyleSheet("color: #4285F4; font-weight: bold; padding: 5px;")
         layout.addWidget(info_label)
         
-        # Список заблокированных сайтов
-        self.block_list_widget = QListWidget()
-        self.update_block_list()
-        layout.addWidget(QLabel("Заблокированные сайты:"))
-        layout.addWidget(self.block_list_widget)
+        # Список заблокированных сайтов: модель отдаёт представлению только видимые строки
+        self.block_list_model = BlockListModel(self.block_manager, dialog)
+        self.block_list_view = QListView()
+        self.block_list_view.setUniformItemSizes(True)
+        # Раскладка порциями: вставка строк не пересчитывает весь список сразу
+        self.block_list_view.setLayoutMode(QListView.Batched)
+        self.block_list_view.setSelectionMode(QListView.ExtendedSelection)
+        self.block_list_view.setModel(self.block_list_model)
+        self.block_count_label = QLabel()
+        layout.addWidget(self.block_count_label)
+        
+        filter_input = QLineEdit()
+        filter_input.setPlaceholderText("Поиск по списку")
+        filter_input.setClearButtonEnabled(True)
+        # Фильтр пересчитывается, когда пользователь перестал печатать
+        filter_timer = QTimer(dialog)
+        filter_timer.setSingleShot(True)
+        filter_timer.setInterval(150)
+        filter_timer.timeout.connect(lambda: self.block_list_model.set_filter(filter_input.text()))
+        filter_timer.timeout.connect(self.update_block_count)
+        filter_input.textChanged.connect(filter_timer.start)
+        layout.addWidget(filter_input)
+        layout.addWidget(self.block_list_view)
+        self.update_block_count()
         
         # Поле для добавления нового сайта
         add_layout = QHBoxLayout()
@@ -454,12 +5515,35 @@ class PortableBrowser(QMainWindow):
         btn_layout = QHBoxLayout()
         remove_btn = QPushButton("Удалить выбранное")
         remove_btn.clicked.connect(self.remove_selected_site)
+        add_file_btn = QPushButton("Добавить из файла...")
+        add_file_btn.clicked.connect(self.add_sites_from_file)
         clear_btn = QPushButton("Очистить все")
         clear_btn.clicked.connect(self.clear_all_sites)
         btn_layout.addWidget(remove_btn)
+        btn_layout.addWidget(add_file_btn)
         btn_layout.addWidget(clear_btn)
         layout.addLayout(btn_layout)
         
+        # Пока идёт большая пачка, новые правки не начинаются
+        for widget in (remove_btn, add_file_btn, clear_btn, add_btn):
+            self.block_list_model.running.connect(lambda running, w=widget: w.setEnabled(not running))
+        self.block_list_model.running.connect(lambda running: running or self.update_block_count())
+        self.block_list_model.progress.connect(
+            lambda count: self.block_count_label.setText(f"Обработано записей: {count}"))
+        
+        # Импортированные списки фильтров (hosts, EasyList)
+        filters_layout = QHBoxLayout()
+        self.filter_count_label = QLabel()
+        self.update_filter_count()
+        import_btn = QPushButton("Импорт списка...")
+        import_btn.clicked.connect(self.import_filter_list)
+        clear_filters_btn = QPushButton("Удалить списки")
+        clear_filters_btn.clicked.connect(self.clear_filter_lists)
+        filters_layout.addWidget(self.filter_count_label)
+        filters_layout.addWidget(import_btn)
+        filters_layout.addWidget(clear_filters_btn)
+        layout.addLayout(filters_layout)
+        
         # Кнопки закрытия
         close_btn = QPushButton("Закрыть")
         close_btn.clicked.connect(dialog.accept)
@@ -467,11 +5551,71 @@ class PortableBrowser(QMainWindow):
         
         dialog.setLayout(layout)
         dialog.exec_()
+        self.block_list_model.finish()
+        self.block_list_model = None
+        self.filter_count_label = None
+    
+    def update_filter_count(self):
+        if getattr(self, 'filter_count_label', None) is not None:
+            self.filter_count_label.setText(
+                f"Правил из списков фильтров: {self.block_manager.filter_rule_count()}")
+    
+    def import_filter_list(self):
+        """Импортировать hosts-файл или список доменов в формате EasyList"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Импорт списка фильтров", "",
+            "Списки фильтров (*.txt *.hosts hosts);;Все файлы (*)")
+        if not path:
+            return
+        worker = FilterImportWorker(self.block_manager, path, self)
+        worker.imported.connect(self.filter_list_imported)
+        worker.failed.connect(
+            lambda error: QMessageBox.warning(self, "Ошибка", f"Не удалось импортировать список: {error}"))
+        worker.finished.connect(worker.deleteLater)
+        self.statusBar().showMessage("Импорт списка фильтров...")
+        worker.start()
+    
+    def filter_list_imported(self, pending):
+        self.block_manager.install_filter_cache(pending)
+        self.update_filter_count()
+        self.statusBar().showMessage(
+            f"Список импортирован, правил: {self.block_manager.filter_rule_count()}", 3000)
+    
+    def clear_filter_lists(self):
+        reply = QMessageBox.question(
+            self, "Подтверждение",
+            "Удалить все импортированные списки фильтров?",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            self.block_manager.clear_filter_lists()
+            self.update_filter_count()
     
     def update_block_list(self):
-        self.block_list_widget.clear()
-        for site in self.block_manager.blocked_sites:
-            self.block_list_widget.addItem(site)
+        if getattr(self, 'block_list_model', None) is not None:
+            self.block_list_model.reload()
+            self.update_block_count()
+    
+    def update_block_count(self):
+        model = self.block_list_model
+        total = len(self.block_manager.blocked_sites)
+        if model.query:
+            self.block_count_label.setText(f"Заблокированные сайты: {total}, найдено: {len(model.rows)}")
+        else:
+            self.block_count_label.setText(f"Заблокированные сайты: {total}")
+    
+    def add_sites_from_file(self):
+        """Добавить в свой список все хосты из файла (домены по строке, hosts, EasyList)"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Добавить сайты из файла", "",
+            "Списки сайтов (*.txt *.hosts hosts);;Все файлы (*)")
+        if not path:
+            return
+        try:
+            sites = read_block_list(path)
+            self.block_list_model.add_sites(sites)
+        except OSError as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать файл: {e}")
     
     def add_site_to_block(self):
         site = self.new_site_input.text().strip()
@@ -481,17 +5625,18 @@ class PortableBrowser(QMainWindow):
                 QMessageBox.warning(self, "Ошибка", "Google не может быть заблокирован - это домашняя страница браузера")
                 return
             
-            if self.block_manager.add_site(site):
-                self.update_block_list()
+            if site not in self.block_manager.blocked_sites:
+                self.block_list_model.add_sites([site])
+                self.update_block_count()
                 self.new_site_input.clear()
                 QMessageBox.information(self, "Успех", f"Сайт {site} добавлен в список блокировки")
     
     def remove_selected_site(self):
-        current_item = self.block_list_widget.currentItem()
-        if current_item:
-            site = current_item.text()
-            if self.block_manager.remove_site(site):
-                self.update_block_list()
+        rows = [index.row() for index in self.block_list_view.selectionModel().selectedRows()]
+        if rows:
+            self.block_list_view.clearSelection()
+            self.block_list_model.remove_rows(rows)
+            self.update_block_count()
     
     def clear_all_sites(self):
         reply = QMessageBox.question(
@@ -500,14 +5645,13 @@ class PortableBrowser(QMainWindow):
             QMessageBox.Yes | QMessageBox.No
         )
         if reply == QMessageBox.Yes:
-            self.block_manager.blocked_sites = []
-            self.block_manager.save_blocked_sites()
+            self.block_manager.clear()
             self.update_block_list()
     
     def get_blocked_page_html(self, url):
         return f"""
         <!DOCTYPE html>
-        <html>
+        <html data-native-theme>
         <head>
             <style>
                 body {{
@@ -573,6 +5717,8 @@ class PortableBrowser(QMainWindow):
         <p><b>Домашняя страница:</b> {self.home_page}</p>
         <p><b>Режим инкогнито:</b> {'Включен' if self.incognito_mode else 'Выключен'}</p>
         <p><b>Заблокированных сайтов:</b> {len(self.block_manager.blocked_sites)}</p>
+        <p><b>Правил из списков фильтров:</b> {self.block_manager.filter_rule_count()}</p>
+        <p><b>Занято на диске:</b> {format_size(sum(self.storage.usage.values())) if self.storage.usage else 'считается...'}</p>
         <hr>
         <p>Все данные сохраняются в папке: {self.data_dir}</p>
         <p>Google всегда доступен как домашняя страница.</p>
@@ -580,49 +5726,436 @@ class PortableBrowser(QMainWindow):
         QMessageBox.about(self, "О браузере", about_text)
     
     def load_settings(self):
-        settings_file = self.config_dir / "settings.json"
-        if settings_file.exists():
-            try:
-                with open(settings_file, 'r') as f:
-                    settings = json.load(f)
-                    self.dark_mode = settings.get('dark_mode', False)
-                    self.incognito_mode = settings.get('incognito_mode', False)
-                    
-                    if self.dark_mode:
-                        self.dark_mode_action.setChecked(True)
-                        self.toggle_dark_mode()
-            except:
-                pass
+        self.apply_settings(self.config_store.load("settings.json", {}))
+    
+    def apply_settings(self, settings):
+        if not isinstance(settings, dict):
+            return
+        self.incognito_mode = settings.get('incognito_mode', False)
+        self.hibernation_settings.update(settings.get('hibernation', {}))
+        self.download_limit_kb = settings.get('download_limit_kb', 0)
+        self.http_cache_settings.update(settings.get('http_cache', {}))
+        self.prediction_settings.update(settings.get('prediction', {}))
+        self.storage_settings.update(settings.get('storage', {}))
+        self.page_index_settings.update(settings.get('page_index', {}))
+        self.site_policies.set_lite_mode(bool(settings.get('lite_mode', False)))
+        self.lite_mode_action.setChecked(self.site_policies.lite_mode)
+        self.prediction_action.setChecked(self.prediction_settings['enabled'])
+        self.downloads.set_rate_limit(self.download_limit_kb)
+        if hasattr(self, 'downloads_panel'):
+            self.downloads_panel.limit_spin.setValue(self.download_limit_kb)
+        dark_mode = settings.get('dark_mode', False)
+        if dark_mode != self.dark_mode:
+            self.dark_mode = dark_mode
+            self.apply_dark_mode()
     
     def save_settings(self):
-        settings_file = self.config_dir / "settings.json"
-        self.config_dir.mkdir(parents=True, exist_ok=True)
-        
         settings = {
             'dark_mode': self.dark_mode,
             'incognito_mode': self.incognito_mode,
             'home_page': self.home_page,  # Сохраняем домашнюю страницу
+            'hibernation': self.hibernation_settings,
+            'download_limit_kb': self.download_limit_kb,
+            'http_cache': self.http_cache_settings,
+            'prediction': self.prediction_settings,
+            'lite_mode': self.site_policies.lite_mode,
+            'storage': self.storage_settings,
+            'page_index': self.page_index_settings,
             'saved_at': datetime.now().isoformat()
         }
-        
-        with open(settings_file, 'w') as f:
-            json.dump(settings, f, indent=2)
+        self.config_store.save("settings.json", settings)
+    
+    def config_file_changed(self, name):
+        """Файл в config/ изменило другое окно или другой экземпляр"""
+        if name == "settings.json":
+            self.apply_settings(self.config_store.load(name, {}))
+            if self.initialized:
+                self.hibernator.apply_settings(self.hibernation_settings)
+                self.apply_http_cache()
+                self.predictor.apply_settings(self.prediction_settings)
+                self.storage.apply_settings(self.storage_settings)
+                self.page_indexer.apply_settings(self.page_index_settings)
+        elif name == SitePolicyManager.CONFIG_FILE:
+            self.site_policies.reload()
+        elif name in BlockedSitesManager.WATCHED_FILES and self.initialized:
+            self.block_manager.reload()
+            if getattr(self, 'filter_count_label', None) is not None:
+                self.update_block_list()
+                self.update_filter_count()
+            self.statusBar().showMessage("Список блокировки обновлён", 2000)
     
     def closeEvent(self, event):
         self.save_settings()
+        self.config_store.flush()
+        self.downloads.shutdown()
+        if self.initialized:
+            self.predictor.save()
+            self.storage.close()
+            self.page_indexer.close()
+            self.session.close()
+            self.history_store.close()
+            self.history_thread.quit()
+            self.history_thread.wait(1000)
+            self.offline_archive.close()
         self.statusBar().showMessage("Сохранение настроек...", 1000)
         event.accept()
 
+ENGINE_SETTINGS_FILE = "engine.json"
+ENGINE_DEFAULTS = {
+    'process_model': 'default',
+    'renderer_process_limit': 0,
+    'js_heap_mb': 0,
+    'gpu': True,
+    'gpu_rasterization': 'auto',
+    'extra_flags': [],
+}
+
+def load_engine_settings(config_dir):
+    """Настройки движка из config/engine.json; читаются до создания QApplication"""
+    settings = dict(ENGINE_DEFAULTS)
+    path = Path(config_dir) / ENGINE_SETTINGS_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            settings.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        log.warning("Не удалось прочитать %s: %s", path, e)
+    return settings
+
+def engine_flags(settings):
+    """Флаги Chromium для QTWEBENGINE_CHROMIUM_FLAGS"""
+    flags = []
+    model = settings.get('process_model')
+    if model in ('process-per-site', 'process-per-site-instance', 'single-process'):
+        flags.append(f"--{model}")
+    limit = int(settings.get('renderer_process_limit') or 0)
+    if limit > 0 and model != 'single-process':
+        flags.append(f"--renderer-process-limit={limit}")
+    heap = int(settings.get('js_heap_mb') or 0)
+    if heap > 0:
+        flags.append(f"--js-flags=--max-old-space-size={heap}")
+    if not settings.get('gpu', True):
+        flags.append("--disable-gpu")
+    raster = settings.get('gpu_rasterization')
+    if raster == 'on':
+        flags.append("--enable-gpu-rasterization")
+    elif raster == 'off':
+        flags.append("--disable-gpu-rasterization")
+    flags.extend(str(flag) for flag in settings.get('extra_flags') or [])
+    return flags
+
+def apply_engine_flags(config_dir):
+    """Дописать флаги из настроек к QTWEBENGINE_CHROMIUM_FLAGS до запуска WebEngine.
+    
+    Флаги, заданные пользователем в окружении, сохраняются и идут первыми.
+    """
+    flags = engine_flags(load_engine_settings(config_dir))
+    if flags:
+        current = os.environ.get('QTWEBENGINE_CHROMIUM_FLAGS', '').split()
+        os.environ['QTWEBENGINE_CHROMIUM_FLAGS'] = ' '.join(current + [f for f in flags if f not in current])
+    return flags
+
+# Параметры Qt со значением: иначе значение приняли бы за адрес
+QT_VALUE_OPTIONS = {
+    '-platform', '-platformpluginpath', '-platformtheme', '-plugin', '-style',
+    '-stylesheet', '-session', '-display', '-qwindowgeometry', '-qwindowtitle',
+    '-qwindowicon',
+}
+
+def read_render_list(path):
+    """Адреса для пакетной отрисовки: по одному в строке, # - комментарий.
+    Относительные пути к файлам считаются от каталога списка"""
+    base = str(Path(path).resolve().parent)
+    urls = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                urls.append(QUrl.fromUserInput(line, base).toString())
+    return urls
+
+class RenderSlot:
+    """Скрытый вид из пула отрисовки и задание, которое он сейчас выполняет"""
+    def __init__(self, view):
+        self.view = view
+        self.page = None
+        self.job = None
+        self.capturing = False
+        self.started = 0.0
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+
+class BatchRenderer(QObject):
+    """Пакетная отрисовка адресов в PDF или PNG без окна браузера.
+    
+    Ограниченный пул скрытых видов загружает адреса параллельно. Для
+    каждого задания создаётся новая страница, так что запоздалые сигналы
+    прежней страницы не путаются с текущим заданием. Попытка ограничена
+    по времени, неудачные адреса повторяются в конце очереди.
+    Заблокированные адреса не загружаются вовсе, а подресурсы отсекает
+    перехватчик профиля.
+    """
+    finished = pyqtSignal()
+    
+    # После загрузки страница успевает дорисоваться перед снимком
+    SETTLE_MS = 200
+    PROGRESS_EVERY = 100
+    
+    def __init__(self, profile, urls, out_dir, fmt='pdf', jobs=4, timeout=30, retries=1,
+                 size=QSize(1280, 800), block_manager=None, site_policies=None, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.out_dir = Path(out_dir)
+        self.fmt = fmt
+        self.timeout = timeout
+        self.retries = retries
+        self.block_manager = block_manager
+        self.site_policies = site_policies
+        self.queue = deque((index, url, 0) for index, url in enumerate(urls, 1))
+        self.total = len(self.queue)
+        self.counts = {'ok': 0, 'failed': 0, 'blocked': 0, 'retried': 0}
+        self.failures = []
+        self.durations = []
+        self.started = None
+        self.busy = 0
+        self.slots = []
+        for _ in range(max(0, min(jobs, self.total))):
+            view = QWebEngineView()
+            view.setAttribute(Qt.WA_DontShowOnScreen)
+            view.resize(size)
+            view.show()
+            slot = RenderSlot(view)
+            slot.timer.timeout.connect(lambda slot=slot: self.timed_out(slot))
+            self.slots.append(slot)
+    
+    def start(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.started = time.perf_counter()
+        for slot in self.slots:
+            self.busy += 1
+            self.next(slot)
+        if not self.slots:
+            self.finished.emit()
+    
+    def output_path(self, job):
+        index, url, _ = job
+        qurl = QUrl(url)
+        name = re.sub(r'[^\w.-]+', '_', qurl.host() + qurl.path()).strip('_')[:80] or "page"
+        return self.out_dir / f"{index:05d}-{name}.{self.fmt}"
+    
+    def next(self, slot):
+        slot.job = None
+        if slot.page is not None:
+            slot.page.deleteLater()
+            slot.page = None
+        while self.queue:
+            job = self.queue.popleft()
+            if self.block_manager is not None and self.block_manager.is_blocked(QUrl(job[1])):
+                self.counts['blocked'] += 1
+                continue
+            self.load(slot, job)
+            return
+        self.busy -= 1
+        if self.busy == 0:
+            self.finished.emit()
+    
+    def load(self, slot, job):
+        page = BrowserPage(self.profile, slot.view, site_policies=self.site_policies)
+        page.setAudioMuted(True)
+        page.loadFinished.connect(lambda ok: self.load_finished(slot, job, ok))
+        page.pdfPrintingFinished.connect(lambda _, ok: self.pdf_finished(slot, job, ok))
+        slot.view.setPage(page)
+        slot.page = page
+        slot.job = job
+        slot.capturing = False
+        slot.started = time.perf_counter()
+        slot.timer.start(int(self.timeout * 1000))
+        page.setUrl(QUrl(job[1]))
+    
+    def load_finished(self, slot, job, ok):
+        if slot.job is not job or slot.capturing:
+            return
+        if not ok:
+            self.fail(slot, job, "страница не загрузилась")
+            return
+        slot.capturing = True
+        if self.fmt == 'pdf':
+            slot.page.printToPdf(str(self.output_path(job)))
+        else:
+            QTimer.singleShot(self.SETTLE_MS, lambda: self.grab(slot, job))
+    
+    def pdf_finished(self, slot, job, ok):
+        if slot.job is not job:
+            return
+        if ok:
+            self.done(slot)
+        else:
+            self.fail(slot, job, "не удалось сохранить PDF")
+    
+    def grab(self, slot, job):
+        if slot.job is not job:
+            return
+        if slot.view.grab().save(str(self.output_path(job)), "PNG"):
+            self.done(slot)
+        else:
+            self.fail(slot, job, "не удалось сохранить PNG")
+    
+    def timed_out(self, slot):
+        job = slot.job
+        if job is not None:
+            # Остановка присылает loadFinished(False) сразу: задание уже снято со слота
+            slot.job = None
+            slot.page.triggerAction(QWebEnginePage.Stop)
+            self.fail(slot, job, f"нет ответа за {self.timeout} с")
+    
+    def done(self, slot):
+        slot.timer.stop()
+        self.counts['ok'] += 1
+        self.durations.append((time.perf_counter() - slot.started) * 1000)
+        finished = self.counts['ok'] + self.counts['failed']
+        if finished % self.PROGRESS_EVERY == 0:
+            print(f"{finished}/{self.total}", file=sys.stderr, flush=True)
+        self.next(slot)
+    
+    def fail(self, slot, job, reason):
+        slot.timer.stop()
+        index, url, attempt = job
+        if attempt < self.retries:
+            self.counts['retried'] += 1
+            self.queue.append((index, url, attempt + 1))
+        else:
+            self.counts['failed'] += 1
+            self.failures.append((url, reason))
+        self.next(slot)
+    
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-6) if self.started else 0.0
+        ok = self.counts['ok']
+        lines = [
+            f"Отрисовано {ok} из {self.total} за {elapsed:.1f} с"
+            f" ({ok / elapsed if elapsed else 0:.1f} стр/с, потоков: {len(self.slots)})",
+            f"Ошибок: {self.counts['failed']}, заблокировано: {self.counts['blocked']},"
+            f" повторов: {self.counts['retried']}",
+        ]
+        if self.durations:
+            lines.append(f"Страница: p50 {percentile(self.durations, 50):.0f} мс,"
+                         f" p95 {percentile(self.durations, 95):.0f} мс")
+        for url, reason in self.failures:
+            lines.append(f"  {url}: {reason}")
+        return '\n'.join(lines)
+
+def render_main(args, qt_args, data_dir):
+    """--render: отрисовать адреса из списка и выйти; код возврата 1, если были ошибки"""
+    try:
+        urls = read_render_list(args.render)
+    except OSError as e:
+        print(f"Не удалось прочитать {args.render}: {e}", file=sys.stderr)
+        return 2
+    try:
+        width, height = (int(value) for value in args.size.lower().split('x'))
+    except ValueError:
+        print(f"Размер должен быть вида 1280x800: {args.size}", file=sys.stderr)
+        return 2
+    if args.headless:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    apply_engine_flags(data_dir / "config")
+    
+    app = QApplication(sys.argv[:1] + qt_args)
+    app.setApplicationName("Portable Browser")
+    app.setOrganizationName("Portable Browser")
+    
+    # Блокировщик, правила сайтов и кеш - те же, что у окна браузера
+    config_dir = data_dir / "config"
+    store = ConfigStore(config_dir, app)
+    settings = store.load("settings.json", {})
+    if not isinstance(settings, dict):
+        settings = {}
+    block_manager = BlockedSitesManager(config_dir)
+    site_policies = SitePolicyManager(store)
+    site_policies.set_lite_mode(bool(settings.get('lite_mode', False)))
+    interceptor = UrlBlockInterceptor(block_manager, app, site_policies)
+    if args.incognito:
+        profile = IncognitoProfileManager(interceptor, app).acquire()
+    else:
+        profile = QWebEngineProfile.defaultProfile()
+        profile.setUrlRequestInterceptor(interceptor)
+        setup_http_cache(profile, data_dir / "cache",
+                         dict(PortableBrowser.HTTP_CACHE_DEFAULTS, **settings.get('http_cache', {})))
+    
+    renderer = BatchRenderer(profile, urls, args.out, args.format, args.jobs, args.timeout,
+                             args.retries, QSize(width, height), block_manager, site_policies, app)
+    renderer.finished.connect(app.quit)
+    QTimer.singleShot(0, renderer.start)
+    app.exec_()
+    print(renderer.summary())
+    return 1 if renderer.failures else 0
+
+def parse_args(argv):
+    """Свои флаги браузера; остальное передаётся QApplication"""
+    own_args, qt_args = [], []
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in QT_VALUE_OPTIONS:
+            qt_args += [arg, next(args, '')]
+        else:
+            own_args.append(arg)
+    
+    parser = argparse.ArgumentParser(prog="portable.py", add_help=True)
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="вывести время фаз запуска до первой загрузки страницы")
+    parser.add_argument("--data-dir", help="каталог данных вместо browser_data рядом с программой")
+    parser.add_argument("--incognito", action="store_true", help="открыть адреса в режиме инкогнито")
+    parser.add_argument("--new-instance", action="store_true",
+                        help="не передавать адреса уже запущенному браузеру")
+    parser.add_argument("urls", nargs="*", help="адреса или файлы для открытия")
+    
+    render = parser.add_argument_group("пакетная отрисовка")
+    render.add_argument("--render", metavar="FILE",
+                        help="отрисовать адреса из файла (по одному в строке) и выйти")
+    render.add_argument("--headless", action="store_true", help="без окон (платформа offscreen)")
+    render.add_argument("--out", default="render", help="каталог для результатов")
+    render.add_argument("--format", choices=("pdf", "png"), default="pdf")
+    render.add_argument("--jobs", type=int, default=4, help="страниц одновременно")
+    render.add_argument("--timeout", type=float, default=30, help="секунд на попытку")
+    render.add_argument("--retries", type=int, default=1, help="повторов после неудачи")
+    render.add_argument("--size", default="1280x800", help="размер окна страницы для PNG")
+    args, unknown = parser.parse_known_intermixed_args(own_args)
+    if args.headless and not args.render:
+        parser.error("--headless работает только вместе с --render")
+    return args, qt_args + unknown
+
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args(sys.argv)
+    STARTUP.enabled = args.profile_startup
+    
+    # Если браузер с этим каталогом данных уже запущен, адреса уходят ему
+    data_dir = Path(args.data_dir) if args.data_dir else Path(__file__).parent / "browser_data"
+    if args.render:
+        sys.exit(render_main(args, qt_args, data_dir))
+    urls = command_line_urls(args)
+    instance = SingleInstance(data_dir)
+    if not args.new_instance and instance.send({'urls': urls, 'incognito': args.incognito}):
+        sys.exit(0)
+    
+    # Chromium читает флаги один раз при запуске WebEngine
+    apply_engine_flags(data_dir / "config")
+    
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setApplicationName("Portable Browser")
     app.setOrganizationName("Portable Browser")
+    STARTUP.mark("QApplication создан")
     
     # Устанавливаем стиль по умолчанию
     app.setStyle("Fusion")
     
     # Создаем и показываем браузер
-    browser = PortableBrowser()
+    browser = PortableBrowser(data_dir=args.data_dir)
+    if urls or args.incognito:
+        browser.open_urls(urls, args.incognito)
+    if not args.new_instance and instance.listen():
+        instance.message_received.connect(browser.instance_message)
+        app.aboutToQuit.connect(instance.close)
     browser.show()
     
     sys.exit(app.exec_())